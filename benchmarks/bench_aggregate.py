@@ -0,0 +1,61 @@
+"""
+Group-by summaries: pandas groupby versus services/aggregator cold, on a cache
+hit, and after a small cell patch (incremental update versus regrouping).
+
+    python -m benchmarks.bench_aggregate --rows 100000 1000000
+"""
+import argparse
+import numpy as np
+import pandas as pd
+
+from benchmarks.common import make_sales_frame, fmt_rows, timed
+from services import aggregator, memory_store
+from services.operations import apply_op
+
+SPEC = {
+    "group_by": ["Region", "Status"],
+    "aggregations": [{"column": "Sales", "func": "sum"}, {"column": "Profit", "func": "mean"},
+                     {"column": "Units", "func": "min"}, {"column": "Units", "func": "max"}, {"func": "count"}],
+}
+
+
+def pandas_groupby(df: pd.DataFrame) -> pd.DataFrame:
+    grouped = df.groupby(["Region", "Status"])
+    return grouped.agg(Sales_sum=("Sales", "sum"), Profit_mean=("Profit", "mean"), Units_min=("Units", "min"),
+                       Units_max=("Units", "max"), count=("Units", "size")).reset_index()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, nargs="+", default=[100_000, 1_000_000])
+    parser.add_argument("--patch-cells", type=int, default=10)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    print(f"{'rows':>6} {'pandas':>9} {'cold':>9} {'hit':>9} {'patched':>9} {'regroup':>9}  (ms)")
+    for rows in args.rows:
+        file_id = f"bench-agg-{rows}"
+        df = make_sales_frame(rows)
+        memory_store.put(file_id, df, dirty=False)
+
+        pandas_s, expected = timed(pandas_groupby, df, repeat=3)
+        aggregator.forget(file_id)
+        cold_s, result = timed(aggregator.aggregate, file_id, df, SPEC)
+        pd.testing.assert_frame_equal(result, expected, check_dtype=False)
+        hit_s, _ = timed(aggregator.aggregate, file_id, df, SPEC, repeat=3)
+
+        updates = [{"row": int(r), "column": "Sales", "value": float(rng.normal(1000, 250))}
+                   for r in rng.integers(0, rows, args.patch_cells)]
+        patched, _ = apply_op(file_id, {"kind": "cells", "updates": updates}, journal=False)
+        patched_s, result = timed(aggregator.aggregate, file_id, patched, SPEC)
+        pd.testing.assert_frame_equal(result, pandas_groupby(patched), check_dtype=False)
+        aggregator.forget(file_id)
+        regroup_s, _ = timed(aggregator.aggregate, file_id, patched, SPEC)
+
+        print(f"{fmt_rows(rows):>6} {pandas_s * 1000:>9.2f} {cold_s * 1000:>9.2f} {hit_s * 1000:>9.3f} "
+              f"{patched_s * 1000:>9.2f} {regroup_s * 1000:>9.2f}")
+    print(aggregator.get_stats())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""
+The out-of-core mode (services/chunk_store, services/out_of_core) on a sheet
+bigger than this host's RAM would allow as one DataFrame: time and peak RSS
+of ingest and of each endpoint's work, against EXCELSIOR_CHUNK_MEMORY_MB.
+
+    python -m benchmarks.bench_chunked --rows 30000000            # ~3 GB as a DataFrame
+    EXCELSIOR_CHUNK_MEMORY_MB=64 python -m benchmarks.bench_chunked --rows 5000000
+
+The sheet is generated block by block straight into chunk files (writing a
+multi-GB .xlsx first would take hours and test openpyxl, not this code); ingest
+of real workbooks goes through the same writer. Runs in a scratch directory.
+Exits non-zero if a step's peak RSS goes over the budget or a result is wrong.
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import numpy as np
+
+from benchmarks.common import make_sales_frame, fmt_rows, timed, reset_peak_rss, peak_rss_mb, rss_mb
+from services import chunk_store
+from services.out_of_core import filter_rows, sort_head, sort_persist, patch_column
+from services.serializer import iter_json
+
+FILE_ID = "bench"
+BLOCK_ROWS = 100_000
+
+
+def blocks(rows: int):
+    for start in range(0, rows, BLOCK_ROWS):
+        block = make_sales_frame(min(BLOCK_ROWS, rows - start), seed=start)
+        block["Order ID"] += start
+        yield block
+
+
+def page_bytes(offset: int, limit: int) -> int:
+    return sum(len(part) for part in iter_json({}, chunk_store.page(FILE_ID, offset, offset + limit)))
+
+
+def is_sorted(column: str) -> bool:
+    """Non-decreasing across every chunk and chunk boundary, missing values last; one chunk at a time."""
+    previous, seen_missing = -np.inf, False
+    for _, chunk in chunk_store.iter_chunks(chunk_store.load_manifest(FILE_ID), [column]):
+        values = chunk[column].to_numpy(dtype=float)
+        missing = np.isnan(values)
+        if missing.any() and (~missing[missing.argmax():]).any():
+            return False
+        present = values[~missing]
+        if len(present) and (seen_missing or present[0] < previous or (np.diff(present) < 0).any()):
+            return False
+        previous = present[-1] if len(present) else previous
+        seen_missing |= bool(missing.any())
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=30_000_000)
+    args = parser.parse_args()
+
+    budget_mb = chunk_store.MEMORY_BUDGET / 2**20
+    # Text as object, the way pd.read_excel hands it over before any dtype pass
+    sample = make_sales_frame(BLOCK_ROWS).astype({"Customer": object, "Region": object, "Status": object})
+    frame_gb = sample.memory_usage(index=False, deep=True).sum() / BLOCK_ROWS * args.rows / 2**30
+    print(f"{fmt_rows(args.rows)} rows, {frame_gb:.2f} GB as one DataFrame read from .xlsx; "
+          f"memory budget {budget_mb:.0f} MB, {os.cpu_count()} cpu")
+
+    workdir = tempfile.mkdtemp(prefix="excelsior-chunked-")
+    os.chdir(workdir)
+    ok = True
+    try:
+        expected_west = None
+        steps = [
+            ("ingest", lambda: chunk_store.write_frames(FILE_ID, blocks(args.rows))),
+            ("page (1k rows, middle)", lambda: page_bytes(args.rows // 2, 1000)),
+            ("filter Region == West", lambda: filter_rows(FILE_ID, {"column": "Region", "op": "==", "value": "West"}, 100)),
+            ("filter Sales > 1500 and Open", lambda: filter_rows(FILE_ID, {"and": [
+                {"column": "Sales", "op": ">", "value": 1500}, {"column": "Status", "op": "==", "value": "Open"}]}, 100)),
+            ("sort preview (top 100)", lambda: sort_head(FILE_ID, "Sales", False, 100)),
+            ("column patch Units + 1", lambda: patch_column(FILE_ID, "Units", operation="add", delta=1)),
+            ("sort persist (merge sort)", lambda: sort_persist(FILE_ID, "Sales", True)),
+        ]
+        print(f"  {'step':<30} {'seconds':>9} {'peak MB':>9}  (RSS above the {rss_mb():.0f} MB baseline)")
+        for name, step in steps:
+            base = rss_mb()
+            reset_peak_rss()
+            seconds, result = timed(step)
+            peak = peak_rss_mb() - base
+            within = peak <= budget_mb
+            ok &= within
+            print(f"  {name:<30} {seconds:>9.2f} {peak:>9.1f}{'' if within else '  OVER BUDGET'}")
+            if name == "ingest":
+                print(f"    {result['chunks']} chunks, {result['bytes_on_disk'] / 2**30:.2f} GB on disk")
+            if name == "filter Region == West":
+                expected_west = result[0]
+
+        # Correctness, still one chunk at a time
+        count, _ = filter_rows(FILE_ID, {"column": "Region", "op": "==", "value": "West"}, 1)
+        sorted_ok = is_sorted("Sales")
+        rows_ok = chunk_store.load_manifest(FILE_ID).rows == args.rows
+        print(f"  rows kept: {rows_ok}, sorted: {sorted_ok}, filter stable across rewrites: {count == expected_west}")
+        ok &= sorted_ok and rows_ok and count == expected_west
+    finally:
+        os.chdir("/")
+        shutil.rmtree(workdir, ignore_errors=True)
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""
+Memory and speed of a sales sheet before and after services/dtype_optimizer:
+bytes per column as read (text as object, as pd.read_excel gives it on pandas
+< 3, and as pandas 3's "str"), then the common operations on each form.
+
+    python -m benchmarks.bench_dtypes --rows 100000 1000000
+"""
+import argparse
+import numpy as np
+import pandas as pd
+
+from benchmarks.common import make_sales_frame, fmt_rows, timed
+from services.cell_patch import column_values, patch_cells
+from services.dtype_optimizer import optimize
+from services.query_engine import filter_mask
+
+
+def as_read(df: pd.DataFrame, text) -> pd.DataFrame:
+    out = df.copy()
+    for column in ("Customer", "Region", "Status"):
+        out[column] = out[column].astype(text)
+    return out
+
+
+def operations(df: pd.DataFrame, rng) -> dict:
+    updates = [{"row": int(r), "column": "Region", "value": "West"} for r in rng.integers(0, len(df), 100)]
+    updates += [{"row": int(r), "column": "Units", "value": 7} for r in rng.integers(0, len(df), 100)]
+    return {
+        "filter ==": lambda: filter_mask({"column": "Region", "op": "==", "value": "West"}, df),
+        "filter range": lambda: filter_mask({"column": "Status", "op": ">=", "value": "Open"}, df),
+        "groupby": lambda: df.groupby(["Region", "Status"], observed=True)["Sales"].sum(),
+        "upper": lambda: column_values(df, "Region", operation="upper"),
+        "add": lambda: column_values(df, "Units", operation="add", delta=5),
+        "patch 200 cells": lambda: patch_cells(df, updates),
+        "sort": lambda: df["Region"].sort_values(kind="stable"),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, nargs="+", default=[100_000, 1_000_000])
+    args = parser.parse_args()
+
+    for rows in args.rows:
+        sales = make_sales_frame(rows)
+        forms = {"object": as_read(sales, object), "str": as_read(sales, "str")}
+        optimize_s, (compact, report) = timed(optimize, forms["object"])
+        forms["optimized"] = compact
+
+        print(f"\n{fmt_rows(rows)} rows, optimize() took {optimize_s * 1000:.1f} ms")
+        print(f"  {'column':<11} {'from':>14} {'to':>14} {'MB before':>10} {'MB after':>10}")
+        for name, column in report["columns"].items():
+            print(f"  {name:<11} {column['from']:>14} {column['to']:>14} "
+                  f"{column['bytes_before'] / 2**20:>10.2f} {column['bytes_after'] / 2**20:>10.2f}")
+        str_bytes = forms["str"].memory_usage(index=False, deep=True).sum()
+        print(f"  {'total':<11} {'':>14} {'':>14} {report['bytes_before'] / 2**20:>10.2f} "
+              f"{report['bytes_after'] / 2**20:>10.2f}   (pandas 3 'str': {str_bytes / 2**20:.2f} MB)")
+
+        print(f"  {'operation':<16}" + "".join(f"{form:>11}" for form in forms) + "  (ms)")
+        timings = {form: {name: timed(op, repeat=3)[0] for name, op in operations(df, np.random.default_rng(0)).items()}
+                   for form, df in forms.items()}
+        for name in timings["object"]:
+            print(f"  {name:<16}" + "".join(f"{timings[form][name] * 1000:>11.2f}" for form in forms))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+Export throughput and peak RSS: df.to_excel (openpyxl) versus the streaming
+writers in services/xlsx_writer and services/exporter, then the export cache.
+
+    python -m benchmarks.bench_export --rows 10000 100000 1000000
+
+Each write runs in a fresh interpreter on a frame loaded from an Arrow
+snapshot, so peak RSS counts the writer and not an earlier measurement.
+to_excel is skipped above --max-openpyxl-rows (it takes minutes).
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+
+from benchmarks.common import make_sales_frame, fmt_rows, scratch_dir
+from services.snapshot import write_frame
+
+WRITER = """
+import json, sys, time
+from benchmarks.common import reset_peak_rss, rss_mb, peak_rss_mb
+from services.snapshot import read_frame
+from services.exporter import write_export
+df = read_frame(sys.argv[2])
+df = df.copy()   # resident, as a cached frame is
+base = rss_mb()
+reset_peak_rss()
+start = time.perf_counter()
+if sys.argv[1] == "to_excel":
+    df.to_excel(sys.argv[3], index=False)
+else:
+    write_export(df, sys.argv[3], sys.argv[1])
+elapsed = time.perf_counter() - start
+print(json.dumps({"seconds": elapsed, "rss_mb": peak_rss_mb() - base}))
+"""
+
+
+def cold_write(kind: str, snapshot: str, out: str) -> dict:
+    result = subprocess.run(
+        [sys.executable, "-c", WRITER, kind, snapshot, out],
+        check=True, capture_output=True, text=True,
+    )
+    return json.loads(result.stdout)
+
+
+async def cache_behaviour(rows: int, concurrency: int):
+    from services import exporter, memory_store
+    from services.operations import apply_op
+
+    file_id = "bench-export"
+    memory_store.put(file_id, make_sales_frame(rows), dirty=False)
+
+    start = time.perf_counter()
+    paths = await asyncio.gather(*(exporter.export(file_id, "xlsx") for _ in range(concurrency)))
+    first = time.perf_counter() - start
+    stats = exporter.get_stats()
+    start = time.perf_counter()
+    again = await exporter.export(file_id, "xlsx")
+    hit = time.perf_counter() - start
+
+    apply_op(file_id, {"kind": "cells", "updates": [{"row": 0, "column": "Units", "value": 1}]}, journal=False)
+    start = time.perf_counter()
+    edited = await exporter.export(file_id, "xlsx")
+    after_edit = time.perf_counter() - start
+
+    print(f"\nexport cache, {fmt_rows(rows)} rows:")
+    print(f"  {concurrency} concurrent exports : {first:8.3f} s, {stats['misses']} write(s), "
+          f"{stats['coalesced']} coalesced, one file: {len(set(paths)) == 1}")
+    print(f"  unchanged version     : {hit * 1000:8.3f} ms (served from disk: {again == paths[0]})")
+    print(f"  after one edit        : {after_edit:8.3f} s (new file: {edited != paths[0]})")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--max-openpyxl-rows", type=int, default=100_000)
+    parser.add_argument("--concurrency", type=int, default=16)
+    args = parser.parse_args()
+
+    work = scratch_dir("export")
+    print(f"{'rows':>6} {'writer':>10} {'seconds':>9} {'rows/s':>11} {'rss MB':>8} {'file MB':>8}")
+    for rows in args.rows:
+        snapshot = os.path.join(work, f"{rows}.arrow")
+        write_frame(snapshot, make_sales_frame(rows))
+        kinds = ["to_excel", "xlsx", "csv", "parquet"]
+        if rows > args.max_openpyxl_rows:
+            kinds.remove("to_excel")
+        for kind in kinds:
+            ext = "xlsx" if kind == "to_excel" else kind
+            out = os.path.join(work, f"{rows}.{kind}.{ext}")
+            res = cold_write(kind, snapshot, out)
+            size = os.path.getsize(out) / 2**20
+            print(f"{fmt_rows(rows):>6} {kind:>10} {res['seconds']:>9.3f} {rows / res['seconds']:>11,.0f} "
+                  f"{res['rss_mb']:>8.1f} {size:>8.1f}")
+
+    os.chdir(work)   # the exporter writes under uploads/
+    asyncio.run(cache_behaviour(min(args.rows[-1], 100_000), args.concurrency))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+"""
+Fan-out of the /ws/data/{file_id} change feed: 500 subscribers on one file,
+one PATCH at a time, latency from the PATCH being sent until each subscriber's
+diff reaches its socket.
+
+    python -m benchmarks.bench_feed --subscribers 500 --edits 50
+    python -m benchmarks.bench_feed --slow 0.2 --slow-ms 50     # some consumers can't keep up
+
+The sockets are in-process ASGI WebSocket sessions against main.app (no
+network, no WebSocket library needed), so the numbers are the server's cost:
+building, encoding and handing over every message. For comparison it times
+what the same clients cost by polling GET /data/{file_id}?rows=1000 after
+every edit instead. Runs in a scratch directory.
+"""
+import argparse
+import asyncio
+import os
+import shutil
+import tempfile
+import time
+import numpy as np
+import httpx
+
+from benchmarks.common import make_sales_frame, fmt_rows
+from services import change_feed, memory_store
+
+FILE_ID = "bench"
+
+
+class Session:
+    """One WebSocket client driven straight through the ASGI app."""
+
+    def __init__(self, app, query: str, delay: float):
+        self.delay = delay
+        self.received: list[tuple[float, int, int]] = []   # (time, version, bytes)
+        self._closed = asyncio.Event()
+        scope = {"type": "websocket", "path": f"/ws/data/{FILE_ID}", "raw_path": f"/ws/data/{FILE_ID}".encode(),
+                 "query_string": query.encode(), "headers": [], "scheme": "ws", "server": ("bench", 80),
+                 "client": ("bench", 0), "root_path": "", "subprotocols": [], "asgi": {"version": "3.0"}}
+        self._connected = False
+        self.task = asyncio.create_task(app(scope, self._receive, self._send))
+
+    async def _receive(self):
+        if not self._connected:
+            self._connected = True
+            return {"type": "websocket.connect"}
+        await self._closed.wait()
+        return {"type": "websocket.disconnect", "code": 1000}
+
+    async def _send(self, message):
+        if message["type"] != "websocket.send":
+            return
+        text = message["text"]
+        # {"type":"...","version":N,...}: no need to parse the whole message
+        version = int(text[text.index('"version":') + 10:].split(",", 1)[0])
+        self.received.append((time.perf_counter(), version, len(text)))
+        if self.delay:
+            await asyncio.sleep(self.delay)   # a slow socket: the server waits on it
+
+    def last_version(self) -> int:
+        return self.received[-1][1] if self.received else -1
+
+    async def close(self):
+        self._closed.set()
+        await self.task
+
+
+def percentile(values, p: float) -> float:
+    return float(np.percentile(values, p)) if len(values) else float("nan")
+
+
+async def run(args):
+    os.environ.setdefault("OPENAI_API_KEY", "offline")   # main imports the LLM client; nothing here calls it
+    import main
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        starts = [i * args.viewport_rows for i in range(args.viewports)]
+        slow = set(range(0, args.subscribers, round(1 / args.slow))) if args.slow else set()
+        sessions = [Session(main.app, f"start={starts[i % len(starts)]}&end={starts[i % len(starts)] + args.viewport_rows}",
+                            args.slow_ms / 1000 if i in slow else 0)
+                    for i in range(args.subscribers)]
+        while any(not s.received for s in sessions):   # the initial snapshots
+            await asyncio.sleep(0.01)
+        fast = [s for i, s in enumerate(sessions) if i not in slow]
+
+        latencies, patch_seconds, fanout = [], [], []
+        rng = np.random.default_rng(0)
+        for n in range(args.edits):
+            # One cell in each viewport, so every subscriber has something to receive
+            updates = [{"row": int(start + rng.integers(args.viewport_rows)), "column": "Units", "value": n}
+                       for start in starts]
+            sent = time.perf_counter()
+            version = (await client.patch(f"/data/{FILE_ID}", json={"updates": updates})).json()["version"]
+            patch_seconds.append(time.perf_counter() - sent)
+            while any(s.last_version() < version for s in fast):
+                await asyncio.sleep(0)
+            arrivals = [next(t for t, v, _ in reversed(s.received) if v == version) for s in fast]
+            latencies.extend(t - sent for t in arrivals)
+            fanout.append(max(arrivals) - min(arrivals))
+
+        deadline = time.monotonic() + 30
+        while any(s.last_version() < version for s in sessions) and time.monotonic() < deadline:
+            await asyncio.sleep(0.01)
+        messages = sum(len(s.received) - 1 for s in sessions)
+        diff_bytes = sum(b for s in sessions for _, _, b in s.received[1:])
+        slow_messages = [len(s.received) - 1 for i, s in enumerate(sessions) if i in slow]
+        caught_up = all(s.last_version() == version for s in sessions)
+        stats = change_feed.get_stats()
+        for s in sessions:
+            await s.close()
+
+        # The same clients polling instead: every one re-reads 1000 rows after each edit
+        polls = 20
+        start = time.perf_counter()
+        poll_bytes = 0
+        for _ in range(polls):
+            poll_bytes = len((await client.get(f"/data/{FILE_ID}", params={"rows": 1000})).content)
+        poll_seconds = (time.perf_counter() - start) / polls
+
+    print(f"  PATCH round trip            p50 {percentile(patch_seconds, 50) * 1000:8.2f} ms")
+    print(f"  edit -> diff on socket      p50 {percentile(latencies, 50) * 1000:8.2f} ms   "
+          f"p99 {percentile(latencies, 99) * 1000:8.2f} ms   max {max(latencies) * 1000:8.2f} ms")
+    print(f"  first -> last subscriber    p50 {percentile(fanout, 50) * 1000:8.2f} ms   "
+          f"({len(fast)} subscribers, {args.viewports} distinct viewports)")
+    print(f"  messages {messages}, {diff_bytes / max(messages, 1):.0f} bytes each; feed stats {stats}")
+    if slow:
+        print(f"  slow consumers ({len(slow)}, {args.slow_ms:.0f} ms per message): "
+              f"{min(slow_messages)}-{max(slow_messages)} messages for {args.edits} edits, "
+              f"all caught up with the last version: {caught_up}")
+    print(f"  polling instead: {poll_seconds * 1000:.2f} ms and {poll_bytes / 1024:.0f} KB per client per edit, "
+          f"{poll_seconds * args.subscribers * 1000:.0f} ms of server time per edit for {args.subscribers} clients")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--subscribers", type=int, default=500)
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--edits", type=int, default=50)
+    parser.add_argument("--viewports", type=int, default=10, help="distinct row ranges among the subscribers")
+    parser.add_argument("--viewport-rows", type=int, default=50)
+    parser.add_argument("--slow", type=float, default=0.0, help="fraction of subscribers with a slow socket")
+    parser.add_argument("--slow-ms", type=float, default=50)
+    args = parser.parse_args()
+
+    print(f"{args.subscribers} subscribers on one {fmt_rows(args.rows)}-row file, {args.edits} edits, "
+          f"{os.cpu_count()} cpu")
+    workdir = tempfile.mkdtemp(prefix="excelsior-feed-")
+    os.chdir(workdir)
+    try:
+        memory_store.put(FILE_ID, make_sales_frame(args.rows), dirty=False)
+        asyncio.run(run(args))
+    finally:
+        os.chdir("/")
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
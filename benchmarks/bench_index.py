@@ -0,0 +1,50 @@
+"""
+Repeated /sort and /filter latency on a large frame: a full sort_values or
+df.query scan per request (the old handlers) versus the version-tagged
+permutations and value indexes in services/frame_index, cold and warm.
+
+    python -m benchmarks.bench_index --rows 1000000
+"""
+import argparse
+
+from benchmarks.common import make_sales_frame, timed
+from services import frame_index
+from services.memory_store import put
+
+FILE_ID = "bench-index"
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--preview", type=int, default=100)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    df = make_sales_frame(args.rows)
+    put(FILE_ID, df, dirty=False)
+    n = args.preview
+
+    print(f"{args.rows} rows, {n}-row previews (best of {args.repeat} for scan/warm)")
+    cases = [
+        ("sort Profit desc", lambda: df.sort_values("Profit", ascending=False).head(n),
+         lambda: frame_index.sort_positions(FILE_ID, df, "Profit", False, limit=n)),
+        ("sort Customer", lambda: df.sort_values("Customer").head(n),
+         lambda: frame_index.sort_positions(FILE_ID, df, "Customer", True, limit=n)),
+        ("filter Region == West", lambda: df.query("Region == 'West'"),
+         lambda: frame_index.filter_positions(FILE_ID, df, "Region", "==", "West")),
+        ("filter Sales > 1400", lambda: df.query("Sales > 1400"),
+         lambda: frame_index.filter_positions(FILE_ID, df, "Sales", ">", 1400.0)),
+    ]
+    print(f"{'case':<24} {'scan ms':>9} {'cold ms':>9} {'2nd ms':>9} {'warm ms':>9}")
+    for name, scan, indexed in cases:
+        scan_s, _ = timed(scan, repeat=args.repeat)
+        frame_index.forget(FILE_ID)
+        cold_s, _ = timed(indexed)
+        second_s, _ = timed(indexed)   # top-N sorts build the full permutation here
+        warm_s, _ = timed(indexed, repeat=args.repeat)
+        print(f"{name:<24} {scan_s * 1e3:>9.1f} {cold_s * 1e3:>9.1f} {second_s * 1e3:>9.1f} {warm_s * 1e3:>9.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""
+Coverage, accuracy and latency of the rule-based intent parser against the
+labelled prompts in benchmarks/intent_corpus.jsonl.
+
+    python -m benchmarks.bench_intent --rows 100000
+
+Each corpus line is {"prompt": ..., "expected": action or null}; null means the
+prompt should be left to the LLM. Run with -v to list every miss.
+"""
+import argparse
+import json
+import os
+import time
+
+from benchmarks.common import make_sales_frame
+from services.intent_parser import parse_intent, MIN_CONFIDENCE
+
+CORPUS = os.path.join(os.path.dirname(__file__), "intent_corpus.jsonl")
+
+
+def load_corpus(path: str = CORPUS) -> list[dict]:
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=100_000, help="rows in the frame the prompts run against")
+    parser.add_argument("--repeat", type=int, default=200, help="timing runs per prompt")
+    parser.add_argument("-v", "--verbose", action="store_true")
+    args = parser.parse_args()
+
+    df = make_sales_frame(args.rows)
+    corpus = load_corpus()
+
+    correct = wrong = missed = false_hits = llm_cases = 0
+    timings = []
+    for case in corpus:
+        intent = parse_intent(case["prompt"], df)
+        handled = intent is not None and intent.confidence >= MIN_CONFIDENCE
+        expected = case["expected"]
+
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            parse_intent(case["prompt"], df)
+        elapsed = (time.perf_counter() - start) / args.repeat
+        if handled:
+            timings.append(elapsed)
+
+        if expected is None:
+            llm_cases += 1
+            false_hits += handled
+            outcome = "ok" if not handled else "FALSE HIT"
+        elif not handled:
+            missed += 1
+            outcome = "missed"
+        elif intent.action == expected:
+            correct += 1
+            outcome = "ok"
+        else:
+            wrong += 1
+            outcome = "WRONG"
+        if args.verbose or outcome != "ok":
+            got = intent.action if intent else None
+            conf = f"{intent.confidence:.2f}" if intent else "-"
+            print(f"{outcome:<9} {conf:>5}  {case['prompt']!r} -> {got}")
+
+    rule_cases = len(corpus) - llm_cases
+    timings.sort()
+    print(f"corpus     : {len(corpus)} prompts ({rule_cases} rule-shaped, {llm_cases} for the LLM), "
+          f"min confidence {MIN_CONFIDENCE}")
+    print(f"coverage   : {correct + wrong}/{rule_cases} rule-shaped prompts handled locally "
+          f"({(correct + wrong) / rule_cases:.0%}), {correct} correct, {wrong} wrong, {missed} sent to the LLM")
+    print(f"fallback   : {llm_cases - false_hits}/{llm_cases} LLM prompts left alone, {false_hits} wrongly answered")
+    if timings:
+        print(f"latency    : median {timings[len(timings) // 2] * 1e6:.0f} us, "
+              f"max {timings[-1] * 1e6:.0f} us per rule hit ({args.rows} rows)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+"""
+LLM call path against the local stub: event-loop blocking, response-cache hit
+rate and coalescing of concurrent identical prompts.
+
+    python -m benchmarks.bench_llm --latency 0.2 --requests 200
+
+Nothing leaves the machine; benchmarks/llm_stub.py is started on a free port
+and the cache lives under benchmarks/.data/llm.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import time
+import urllib.request
+
+from openai import OpenAI
+
+from benchmarks.common import scratch_dir
+from benchmarks.llm_stub import serve
+from services import llm_client
+from services.formula_generator import SYSTEM_MSG, MODEL, generate_excel_formula
+
+COLUMNS = [["Order ID", "int64"], ["Region", "str"], ["Status", "str"], ["Profit", "float64"]]
+
+
+def _upstream_requests(base_url: str) -> int:
+    with urllib.request.urlopen(base_url + "/stats") as r:
+        return json.load(r)["requests"]
+
+
+async def _max_loop_lag(start_work) -> tuple[float, float]:
+    """Run start_work() while a 10ms ticker measures how late the event loop wakes it."""
+    lag, done = 0.0, False
+
+    async def ticker():
+        nonlocal lag
+        while not done:
+            start = time.perf_counter()
+            await asyncio.sleep(0.01)
+            lag = max(lag, time.perf_counter() - start - 0.01)
+
+    task = asyncio.create_task(ticker())
+    await asyncio.sleep(0)
+    start = time.perf_counter()
+    await start_work()
+    elapsed = time.perf_counter() - start
+    done = True
+    await task
+    return elapsed, lag
+
+
+async def bench_blocking(base_url: str, n: int):
+    # The old path: a synchronous client called straight from async handlers
+    sync_client = OpenAI(api_key="stub", base_url=base_url)
+
+    async def old_handler(i):
+        sync_client.chat.completions.create(
+            model=MODEL, messages=[{"role": "system", "content": SYSTEM_MSG},
+                                   {"role": "user", "content": f"sort by column {i}"}])
+
+    async def new_handler(i):
+        await llm_client.complete_json(SYSTEM_MSG, f"sort by column {i}", MODEL, use_cache=False)
+
+    await new_handler(-1)   # open the pooled connection outside the measurement
+    for name, handler in (("sync client", old_handler), ("async client", new_handler)):
+        elapsed, lag = await _max_loop_lag(lambda: asyncio.gather(*(handler(i) for i in range(n))))
+        print(f"{name:<13}: {n} concurrent calls in {elapsed:6.2f}s, max event-loop stall {lag * 1000:7.1f} ms")
+
+
+async def bench_cache(base_url: str, n: int, distinct: int):
+    # Zipf-ish mix of prompts, with whitespace variations of the same instruction
+    rng = random.Random(0)
+    prompts = [f"sort by Profit {'desc' if i % 2 else 'asc'} for group {i}" for i in range(distinct)]
+    weights = [1 / (i + 1) for i in range(distinct)]
+    before = _upstream_requests(base_url)
+    timings = []
+    for _ in range(n):
+        prompt = rng.choices(prompts, weights)[0]
+        if rng.random() < 0.3:
+            prompt = "  " + prompt.replace(" ", "   ") + "\n"
+        start = time.perf_counter()
+        await generate_excel_formula(prompt, COLUMNS)
+        timings.append(time.perf_counter() - start)
+    upstream = _upstream_requests(base_url) - before
+    timings.sort()
+    print(f"cache        : {n} prompts ({distinct} distinct) -> {upstream} upstream calls, "
+          f"hit rate {1 - upstream / n:.1%}, median {timings[n // 2] * 1000:.2f} ms, "
+          f"p95 {timings[int(n * 0.95)] * 1000:.1f} ms")
+
+
+async def bench_coalesce(base_url: str, n: int):
+    before = _upstream_requests(base_url)
+    start = time.perf_counter()
+    results = await asyncio.gather(*(generate_excel_formula("sort by Region", COLUMNS) for _ in range(n)))
+    elapsed = time.perf_counter() - start
+    upstream = _upstream_requests(base_url) - before
+    same = all(r == results[0] for r in results)
+    print(f"coalescing   : {n} concurrent identical prompts -> {upstream} upstream call(s) "
+          f"in {elapsed:.2f}s, identical answers: {same}")
+
+
+async def run(args):
+    server = serve(latency=args.latency)
+    base_url = f"http://127.0.0.1:{server.server_address[1]}/v1"
+    os.environ["OPENAI_API_KEY"] = "stub"
+    llm_client.BASE_URL = base_url
+    llm_client.CACHE_DB = os.path.join(scratch_dir("llm"), "llm_cache.db")
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(llm_client.CACHE_DB + suffix):
+            os.remove(llm_client.CACHE_DB + suffix)
+
+    await bench_blocking(base_url, args.concurrency)
+    await bench_cache(base_url, args.requests, args.distinct)
+    await bench_coalesce(base_url, args.concurrency)
+    print(f"stats        : {llm_client.get_stats()}")
+    server.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--latency", type=float, default=0.2, help="stub seconds per completion")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--distinct", type=int, default=30)
+    parser.add_argument("--concurrency", type=int, default=20)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
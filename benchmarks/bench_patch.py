@@ -0,0 +1,56 @@
+"""
+Batch cell patches: the old per-cell `df.at[row, col] = value` loop versus the
+grouped, vectorized engine in services/cell_patch.
+
+    python -m benchmarks.bench_patch --rows 1000000 --updates 100000
+"""
+import argparse
+import numpy as np
+
+from benchmarks.common import make_sales_frame, timed
+from services.cell_patch import apply_cell_updates
+
+
+def legacy_loop(df, updates):
+    df = df.copy()
+    for update in updates:
+        row_idx, col_name = update.get("row"), update.get("column")
+        if col_name not in df.columns or not (0 <= row_idx < len(df)):
+            raise ValueError(update)
+        df.at[row_idx, col_name] = update.get("value")
+    return df
+
+
+def make_updates(df, n: int, seed: int = 0) -> list[dict]:
+    rng = np.random.default_rng(seed)
+    rows = rng.integers(0, len(df), n).tolist()
+    cols = rng.choice(["Units", "Sales", "Status"], n).tolist()
+    values = {
+        "Units": rng.integers(1, 500, n).tolist(),
+        "Sales": rng.normal(1000, 250, n).round(2).tolist(),
+        "Status": rng.choice(["Open", "Complete"], n).tolist(),
+    }
+    return [{"row": r, "column": c, "value": values[c][i]} for i, (r, c) in enumerate(zip(rows, cols))]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--updates", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    df = make_sales_frame(args.rows)
+    updates = make_updates(df, args.updates)
+
+    vectorized, out = timed(apply_cell_updates, df, updates, repeat=args.repeat)
+    legacy, expected = timed(legacy_loop, df, updates)
+    assert out.equals(expected), "vectorized result differs from the per-cell loop"
+
+    print(f"{args.updates} updates on {args.rows} rows")
+    print(f"  per-cell loop : {legacy:8.3f} s")
+    print(f"  vectorized    : {vectorized:8.3f} s  ({legacy / vectorized:.0f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+Multi-step actions: the same steps sent as one action each (a validation,
+version, journal record and status write per step) versus one
+{"operation": "pipeline"} action run from its compiled plan.
+
+    python -m benchmarks.bench_pipeline --rows 1000000
+
+Both paths go through apply_excel_action against the cached frame and must
+end with the same frame. Runs in a scratch directory.
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+from benchmarks.common import make_sales_frame, fmt_rows
+from services import frame_versions, memory_store
+from services.excel_modifier import apply_excel_action, plan_action
+
+FILE_ID = "bench"
+
+SCENARIOS = {
+    "filter West, sort by Profit, set Status to Done": [
+        {"operation": "filter", "column": "Region", "condition": {"operator": "==", "value": "West"}},
+        {"operation": "sort", "column": "Profit", "order": "desc"},
+        {"operation": "update", "column": "Status", "value": "Done"},
+    ],
+    "sort, filter, filter, re-sort, filter": [
+        {"operation": "sort", "column": "Sales", "order": "asc"},
+        {"operation": "filter", "column": "Units", "condition": {"operator": ">", "value": 100}},
+        {"operation": "filter", "column": "Region", "condition": {"operator": "!=", "value": "East"}},
+        {"operation": "sort", "column": "Sales", "order": "desc"},
+        {"operation": "filter", "column": "Status", "condition": {"operator": "==", "value": "Open"}},
+    ],
+    "sort by Customer, then filter to 1 row in 1000": [
+        {"operation": "sort", "column": "Customer", "order": "asc"},
+        {"operation": "filter", "column": "Units", "condition": {"operator": "<", "value": 2}},
+    ],
+}
+
+
+def fresh(df):
+    memory_store.delete(FILE_ID)
+    frame_versions.forget(FILE_ID)
+    memory_store.put(FILE_ID, df, dirty=False)
+
+
+def one_by_one(steps) -> int:
+    for step in steps:
+        apply_excel_action(FILE_ID, step)
+    return len(steps)
+
+
+def pipelined(steps) -> int:
+    apply_excel_action(FILE_ID, {"operation": "pipeline", "steps": steps})
+    return 1
+
+
+def measure(df, run, steps, repeat: int):
+    best, result = float("inf"), None
+    for _ in range(repeat):
+        fresh(df)
+        start = time.perf_counter()
+        versions = run(steps)
+        best = min(best, time.perf_counter() - start)
+        result = memory_store.get(FILE_ID)
+    return best, versions, result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    df = make_sales_frame(args.rows)
+    workdir = tempfile.mkdtemp(prefix="excelsior-pipeline-")
+    os.chdir(workdir)
+    try:
+        print(f"{fmt_rows(args.rows)} rows")
+        for name, steps in SCENARIOS.items():
+            separate, separate_versions, expected = measure(df, one_by_one, steps, args.repeat)
+            fused, fused_versions, out = measure(df, pipelined, steps, args.repeat)
+            assert out.equals(expected), f"{name}: the pipeline's result differs from running the steps one by one"
+
+            fresh(df)
+            start = time.perf_counter()
+            plan = plan_action(FILE_ID, {"operation": "pipeline", "steps": steps})
+            dry_run = time.perf_counter() - start
+            compiled = ", ".join(f"{s['operation']}{'x%d' % len(s['steps']) if len(s['steps']) > 1 else ''}"
+                                 for s in plan["steps"])
+            print(f"  {name}")
+            print(f"    one action per step : {separate:8.3f} s  {separate_versions} versions")
+            print(f"    pipeline            : {fused:8.3f} s  {fused_versions} version  ({separate / fused:.1f}x)"
+                  f"  plan: {compiled}; {len(plan['dropped'])} dropped; {plan['steps'][-1]['estimated_rows']} rows left")
+            print(f"    dry run             : {dry_run:8.3f} s")
+    finally:
+        os.chdir("/")
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,41 @@
+"""
+Time-to-first-preview against workbook size: the streaming read-only parser
+versus parsing the whole first sheet with pd.ExcelFile (the previous
+parse_excel_preview).
+
+    python -m benchmarks.bench_preview --rows 1000 10000 100000
+"""
+import argparse
+import os
+import pandas as pd
+
+from benchmarks.common import make_sales_frame, fmt_rows, scratch_dir, timed
+from services.excel_parser import parse_excel_preview
+
+
+def full_parse_preview(path: str):
+    xl = pd.ExcelFile(path)
+    df = xl.parse(xl.sheet_names[0])
+    return {"sheets": xl.sheet_names, "headers": list(df.columns), "sample": df.head().values.tolist()}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, nargs="+", default=[1_000, 10_000, 100_000])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    out_dir = scratch_dir("preview")
+    print(f"{'rows':>6} {'full parse s':>13} {'streaming s':>12} {'speedup':>8}")
+    for rows in args.rows:
+        path = os.path.join(out_dir, f"{rows}.xlsx")
+        if not os.path.exists(path):
+            make_sales_frame(rows).to_excel(path, index=False)
+
+        full, _ = timed(full_parse_preview, path, repeat=args.repeat)
+        stream, _ = timed(parse_excel_preview, path, repeat=args.repeat)
+        print(f"{fmt_rows(rows):>6} {full:>13.3f} {stream:>12.4f} {full / stream:>7.0f}x")
+
+
+if __name__ == "__main__":
+    main()
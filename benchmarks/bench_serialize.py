@@ -0,0 +1,50 @@
+"""
+Whole-sheet JSON encoding: the old `to_dict(orient="records")` + stock JSON
+response versus the batched streaming encoder behind /data/{file_id}/preview.
+
+    python -m benchmarks.bench_serialize --rows 100000 500000
+
+Reports wall time and the peak RSS growth while encoding.
+"""
+import argparse
+import json
+
+from fastapi.encoders import jsonable_encoder
+
+from benchmarks.common import make_sales_frame, fmt_rows, reset_peak_rss, rss_mb, peak_rss_mb, timed
+from services.serializer import iter_json, iter_ndjson, iter_arrow
+
+
+def stock(df):
+    rows = jsonable_encoder(df.to_dict(orient="records"))
+    return len(json.dumps({"rows": rows, "columns": df.columns.tolist()}).encode())
+
+
+def drain(chunks):
+    # Consume the stream the way a socket would, without keeping the chunks
+    return sum(len(chunk) for chunk in chunks)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, nargs="+", default=[100_000, 500_000])
+    args = parser.parse_args()
+
+    print(f"{'rows':>6} {'encoder':>10} {'seconds':>9} {'peak +MB':>9} {'MB out':>8}")
+    for rows in args.rows:
+        df = make_sales_frame(rows)
+        variants = {
+            "stock": lambda: stock(df),
+            "json": lambda: drain(iter_json({"columns": df.columns.tolist()}, df)),
+            "ndjson": lambda: drain(iter_ndjson(df)),
+            "arrow": lambda: drain(iter_arrow(df)),
+        }
+        for name, fn in variants.items():
+            base = rss_mb()
+            reset_peak_rss()
+            seconds, size = timed(fn)
+            print(f"{fmt_rows(rows):>6} {name:>10} {seconds:>9.3f} {peak_rss_mb() - base:>9.1f} {size / 2**20:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""
+Cold-load time and peak RSS: pd.read_excel on the .xlsx versus the memory-mapped
+Arrow snapshot that upload writes next to it.
+
+    python -m benchmarks.bench_snapshot --rows 10000 100000 1000000
+
+Each load runs in a fresh interpreter so neither the parse nor the page cache
+of a previous measurement is counted twice.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+from benchmarks.common import make_sales_frame, fmt_rows, scratch_dir
+from services.snapshot import write_frame
+
+LOADER = """
+import json, sys, time
+from benchmarks.common import reset_peak_rss, rss_mb, peak_rss_mb
+import pandas as pd
+from services.snapshot import read_frame
+base = rss_mb()
+reset_peak_rss()
+start = time.perf_counter()
+df = pd.read_excel(sys.argv[2]) if sys.argv[1] == "xlsx" else read_frame(sys.argv[2])
+elapsed = time.perf_counter() - start
+print(json.dumps({"seconds": elapsed, "rss_mb": peak_rss_mb() - base, "rows": len(df)}))
+"""
+
+
+def cold_load(kind: str, path: str) -> dict:
+    out = subprocess.run(
+        [sys.executable, "-c", LOADER, kind, path],
+        check=True, capture_output=True, text=True,
+    )
+    return json.loads(out.stdout)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    args = parser.parse_args()
+
+    out_dir = scratch_dir("snapshot")
+    print(f"{'rows':>6} {'format':>8} {'load s':>9} {'rss MB':>8} {'file MB':>8}")
+    for rows in args.rows:
+        df = make_sales_frame(rows)
+        xlsx = os.path.join(out_dir, f"{rows}.xlsx")
+        arrow = os.path.join(out_dir, f"{rows}.arrow")
+        if not os.path.exists(xlsx):
+            df.to_excel(xlsx, index=False)
+        write_frame(arrow, df)
+
+        for kind, path in (("xlsx", xlsx), ("arrow", arrow)):
+            res = cold_load(kind, path)
+            size = os.path.getsize(path) / 2**20
+            print(f"{fmt_rows(rows):>6} {kind:>8} {res['seconds']:>9.3f} {res['rss_mb']:>8.1f} {size:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+Status-store update throughput with many tracked files and concurrent writers.
+
+    python -m benchmarks.bench_status --files 100000 --writers 8 --updates 2000
+
+Seeds `--files` statuses, then runs `--writers` processes that each issue
+`--updates` update_status() calls on random files, and reports updates/s. The
+old JSON read-modify-write is measured single-threaded for comparison (it is
+not safe with concurrent writers at all).
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import time
+import uuid
+
+from benchmarks.common import scratch_dir
+from services import file_status
+
+
+def _seed(file_ids: list[str]):
+    conn = file_status._connect()
+    conn.execute("BEGIN")
+    conn.executemany(
+        "INSERT OR REPLACE INTO file_status VALUES (?, 'uploaded', ?)",
+        [(fid, file_status._now()) for fid in file_ids],
+    )
+    conn.execute("COMMIT")
+
+
+def _writer(db_path: str, file_ids: list[str], updates: int, seed: int, start_evt):
+    file_status.STATUS_DB = db_path
+    rng = random.Random(seed)
+    start_evt.wait()
+    for i in range(updates):
+        file_status.update_status(rng.choice(file_ids), f"modified ({i})")
+
+
+def bench_sqlite(db_path: str, file_ids: list[str], writers: int, updates: int) -> float:
+    ctx = multiprocessing.get_context("fork")
+    start_evt = ctx.Event()
+    procs = [
+        ctx.Process(target=_writer, args=(db_path, file_ids, updates, n, start_evt))
+        for n in range(writers)
+    ]
+    for p in procs:
+        p.start()
+    start = time.perf_counter()
+    start_evt.set()
+    for p in procs:
+        p.join()
+    return writers * updates / (time.perf_counter() - start)
+
+
+def bench_legacy_json(path: str, file_ids: list[str], updates: int) -> float:
+    with open(path, "w") as f:
+        json.dump({fid: {"status": "uploaded", "timestamp": file_status._now()} for fid in file_ids}, f, indent=2)
+    start = time.perf_counter()
+    for i in range(updates):
+        with open(path) as f:
+            statuses = json.load(f)
+        statuses[random.choice(file_ids)] = {"status": f"modified ({i})", "timestamp": file_status._now()}
+        with open(path, "w") as f:
+            json.dump(statuses, f, indent=2)
+    return updates / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--files", type=int, default=100_000)
+    parser.add_argument("--writers", type=int, default=8)
+    parser.add_argument("--updates", type=int, default=2000, help="updates per writer")
+    parser.add_argument("--legacy-updates", type=int, default=20)
+    args = parser.parse_args()
+
+    out_dir = scratch_dir("status")
+    db_path = os.path.join(out_dir, "statuses.db")
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(db_path + suffix):
+            os.remove(db_path + suffix)
+
+    file_ids = [str(uuid.uuid4()) for _ in range(args.files)]
+    file_status.STATUS_DB = db_path
+    file_status.STATUS_FILE = os.path.join(out_dir, "missing.json")
+    _seed(file_ids)
+
+    rate = bench_sqlite(db_path, file_ids, args.writers, args.updates)
+    history = file_status._connect().execute("SELECT COUNT(*) FROM status_history").fetchone()[0]
+    print(f"sqlite WAL : {rate:>10.0f} updates/s  ({args.writers} writers, {history} history rows, none lost: "
+          f"{history == args.writers * args.updates})")
+
+    legacy = bench_legacy_json(os.path.join(out_dir, "statuses.json"), file_ids, args.legacy_updates)
+    print(f"legacy JSON: {legacy:>10.1f} updates/s  (1 writer, {args.files} files)")
+
+
+if __name__ == "__main__":
+    main()
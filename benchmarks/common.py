@@ -0,0 +1,132 @@
+"""
+Shared helpers for the scripts in benchmarks/. Run them from the repo root,
+e.g. `python -m benchmarks.bench_snapshot`.
+"""
+import io
+import os
+import resource
+import time
+import numpy as np
+import pandas as pd
+
+REGIONS = ["West", "East", "North", "South", "Central"]
+STATUSES = ["Open", "Pending", "Complete", "Cancelled"]
+
+
+def make_sales_frame(rows: int, seed: int = 0) -> pd.DataFrame:
+    """A sales-style sheet: a few low-cardinality text columns plus numbers and dates."""
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        "Order ID": np.arange(1, rows + 1),
+        "Customer": [f"Customer {i}" for i in rng.integers(0, max(rows // 10, 1), rows)],
+        "Region": rng.choice(REGIONS, rows),
+        "Status": rng.choice(STATUSES, rows),
+        "Units": rng.integers(1, 500, rows),
+        "Sales": rng.normal(1000, 250, rows).round(2),
+        "Profit": rng.normal(200, 80, rows).round(2),
+        "Order Date": pd.Timestamp("2024-01-01") + pd.to_timedelta(rng.integers(0, 365, rows), unit="D"),
+    })
+
+
+# Column kinds for make_workbook, e.g. "int=2,float=3,text=2,category=3,date=1,bool=1"
+COLUMN_KINDS = ("int", "float", "text", "category", "date", "bool")
+DEFAULT_MIX = "int=2,float=3,text=2,category=3,date=1,bool=1"
+
+
+def parse_mix(mix: str) -> dict[str, int]:
+    """{kind: column count} from "kind=count,..."; unknown kinds raise ValueError."""
+    counts = {}
+    for part in filter(None, (p.strip() for p in mix.split(","))):
+        kind, _, count = part.partition("=")
+        if kind not in COLUMN_KINDS:
+            raise ValueError(f"unknown column kind '{kind}' (one of {', '.join(COLUMN_KINDS)})")
+        counts[kind] = counts.get(kind, 0) + int(count or 1)
+    return counts
+
+
+def make_workbook(rows: int, mix: str = DEFAULT_MIX, nulls: float = 0.0, seed: int = 0) -> pd.DataFrame:
+    """
+    A synthetic sheet of `rows` rows with the column mix `mix`: columns are
+    named by kind (int0, float0, text0, category0, ...). `nulls` is the share
+    of missing cells in the float, text and category columns.
+    """
+    rng = np.random.default_rng(seed)
+    columns = {}
+    for kind, count in parse_mix(mix).items():
+        for i in range(count):
+            name = f"{kind}{i}"
+            if kind == "int":
+                columns[name] = rng.integers(0, 10 ** (i % 6 + 2), rows)
+            elif kind == "float":
+                columns[name] = rng.normal(1000, 250, rows).round(2)
+            elif kind == "text":
+                columns[name] = [f"{name} {v}" for v in rng.integers(0, max(rows // 2, 1), rows)]
+            elif kind == "category":
+                columns[name] = rng.choice([f"{name}-{c}" for c in range(3 + 4 * i)], rows)
+            elif kind == "date":
+                columns[name] = pd.Timestamp("2024-01-01") + pd.to_timedelta(rng.integers(0, 730, rows), unit="D")
+            else:
+                columns[name] = rng.random(rows) < 0.5
+            if nulls and kind in {"float", "text", "category"}:
+                columns[name] = pd.Series(columns[name]).mask(rng.random(rows) < nulls)
+    return pd.DataFrame(columns)
+
+
+def workbook_bytes(df: pd.DataFrame) -> bytes:
+    """df as an .xlsx upload body."""
+    buf = io.BytesIO()
+    df.to_excel(buf, index=False)
+    return buf.getvalue()
+
+
+def _proc_status_kb(field: str) -> int | None:
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def reset_peak_rss():
+    """Reset the kernel's high-water mark so peak_rss_mb() measures from here (Linux only)."""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+
+def rss_mb() -> float:
+    kb = _proc_status_kb("VmRSS")
+    return kb / 1024 if kb is not None else peak_rss_mb()
+
+
+def peak_rss_mb() -> float:
+    kb = _proc_status_kb("VmHWM")
+    if kb is None:
+        # ru_maxrss is KiB on Linux and can't be reset
+        kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return kb / 1024
+
+
+def timed(fn, *args, repeat: int = 1, **kwargs):
+    """Return (best seconds, last result) over `repeat` runs."""
+    best, result = float("inf"), None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn(*args, **kwargs)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def fmt_rows(rows: int) -> str:
+    return f"{rows // 1_000_000}M" if rows >= 1_000_000 else f"{rows // 1000}k" if rows >= 1000 else str(rows)
+
+
+def scratch_dir(name: str) -> str:
+    path = os.path.join("benchmarks", ".data", name)
+    os.makedirs(path, exist_ok=True)
+    return path
@@ -0,0 +1,96 @@
+"""
+A stand-in for the OpenAI chat-completions API, for running the LLM paths
+offline.
+
+    python -m benchmarks.llm_stub --port 8765 --latency 0.5
+    EXCELSIOR_LLM_BASE_URL=http://127.0.0.1:8765/v1 uvicorn main:app
+
+Every POST to /v1/chat/completions sleeps `--latency` seconds and answers with
+a sort action on the first column named in the prompt ("Columns: A (int64), ..."),
+so responses are deterministic per prompt. GET /stats returns the request count.
+"""
+import argparse
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    latency = 0.0
+    requests = 0
+    _lock = threading.Lock()
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, body: dict, status: int = 200):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path.rstrip("/").endswith("/stats"):
+            self._reply({"requests": StubHandler.requests})
+        else:
+            self._reply({"error": "not found"}, 404)
+
+    def do_POST(self):
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._reply({"error": "not found"}, 404)
+            return
+        payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+        with StubHandler._lock:
+            StubHandler.requests += 1
+        time.sleep(self.latency)
+
+        prompt = payload["messages"][-1]["content"]
+        match = re.search(r"Columns: ([^(,]+?) \(", prompt)
+        column = match.group(1) if match else "Region"
+        order = "desc" if "desc" in prompt.lower() else "asc"
+        content = json.dumps({"operation": "sort", "column": column, "order": order})
+        self._reply({
+            "id": f"stub-{StubHandler.requests}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": payload.get("model", "stub"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop",
+            }],
+            "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+        })
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 256   # bursts of concurrent connections, not the default 5
+
+
+def serve(port: int = 0, latency: float = 0.0) -> ThreadingHTTPServer:
+    """Start the stub on a background thread; port 0 picks a free port."""
+    StubHandler.latency = latency
+    server = StubServer(("127.0.0.1", port), StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.5, help="seconds per completion")
+    args = parser.parse_args()
+
+    StubHandler.latency = args.latency
+    server = StubServer(("127.0.0.1", args.port), StubHandler)
+    print(f"LLM stub on http://127.0.0.1:{args.port}/v1 ({args.latency}s latency)")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
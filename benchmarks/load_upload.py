@@ -0,0 +1,124 @@
+"""
+Concurrent-upload load test: p50/p99 latency of GET /data/{file_id} on an idle
+server versus the same server while several large uploads are being ingested.
+
+    python -m benchmarks.load_upload --upload-rows 50000 --uploaders 4 --seconds 10
+
+The server runs under uvicorn in a scratch directory, so uploads/ and the
+status store of the working tree are left alone.
+"""
+import argparse
+import asyncio
+import io
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+from benchmarks.common import make_sales_frame
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _workbook(rows: int) -> bytes:
+    buf = io.BytesIO()
+    make_sales_frame(rows).to_excel(buf, index=False)
+    return buf.getvalue()
+
+
+def percentile(samples: list[float], pct: float) -> float:
+    if not samples:
+        return float("nan")
+    ordered = sorted(samples)
+    return ordered[min(int(len(ordered) * pct / 100), len(ordered) - 1)]
+
+
+async def wait_until_parsed(client: httpx.AsyncClient, file_id: str, timeout: float = 600):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        status = (await client.get(f"/status/{file_id}")).json()["status"]
+        if status != "parsing":
+            return status
+        await asyncio.sleep(0.05)
+    raise TimeoutError(file_id)
+
+
+async def probe_data(client: httpx.AsyncClient, file_id: str, seconds: float) -> list[float]:
+    latencies = []
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        start = time.perf_counter()
+        r = await client.get(f"/data/{file_id}", params={"rows": 50})
+        r.raise_for_status()
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+async def upload_loop(client: httpx.AsyncClient, payload: bytes, stop: asyncio.Event, done: list):
+    while not stop.is_set():
+        r = await client.post("/upload-excel", files={"file": ("bench.xlsx", payload)})
+        await wait_until_parsed(client, r.json()["file_id"])
+        done.append(1)
+
+
+async def run(base_url: str, args):
+    small = _workbook(1000)
+    big = _workbook(args.upload_rows)
+    async with httpx.AsyncClient(base_url=base_url, timeout=600) as client:
+        file_id = (await client.post("/upload-excel", files={"file": ("probe.xlsx", small)})).json()["file_id"]
+        await wait_until_parsed(client, file_id)
+
+        idle = await probe_data(client, file_id, args.seconds)
+
+        stop, done = asyncio.Event(), []
+        uploaders = [asyncio.create_task(upload_loop(client, big, stop, done)) for _ in range(args.uploaders)]
+        busy = await probe_data(client, file_id, args.seconds)
+        stop.set()
+        await asyncio.gather(*uploaders)
+
+    for label, samples in (("idle", idle), (f"{args.uploaders} uploads", busy)):
+        print(f"{label:>12}: n={len(samples):>5}  p50={percentile(samples, 50) * 1000:7.2f} ms"
+              f"  p99={percentile(samples, 99) * 1000:7.2f} ms")
+    print(f"uploads completed during run: {len(done)}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--upload-rows", type=int, default=50_000)
+    parser.add_argument("--uploaders", type=int, default=4)
+    parser.add_argument("--seconds", type=float, default=10)
+    args = parser.parse_args()
+
+    port = _free_port()
+    workdir = tempfile.mkdtemp(prefix="excelsior-load-")
+    env = {**os.environ, "PYTHONPATH": REPO_ROOT, "OPENAI_API_KEY": os.getenv("OPENAI_API_KEY", "offline")}
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=workdir, env=env,
+    )
+    try:
+        base_url = f"http://127.0.0.1:{port}"
+        for _ in range(100):
+            try:
+                httpx.get(f"{base_url}/cache/stats")
+                break
+            except httpx.TransportError:
+                time.sleep(0.1)
+        asyncio.run(run(base_url, args))
+    finally:
+        server.terminate()
+        server.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""
+Multi-worker load test: requests/s of a read-heavy mix (filter, aggregate,
+paged reads, 1 edit in --edit-every requests) against `uvicorn --workers N`
+for each N, with the cached frames shared through EXCELSIOR_STORE.
+
+    python -m benchmarks.load_workers --workers 1 2 4 --store shm --rows 100000
+    python -m benchmarks.load_workers --store redis      # starts benchmarks/resp_stub
+
+After each run it checks consistency: one PATCH, then every worker must read
+the new value. `--store local` is the baseline: nothing shared, so with more
+than one worker that check fails. Scaling is bounded by the host's cores.
+"""
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+from benchmarks.load_upload import REPO_ROOT, _free_port, _workbook, percentile, wait_until_parsed
+
+
+def _wait_for(base_url: str):
+    for _ in range(300):
+        try:
+            httpx.get(f"{base_url}/cache/stats")
+            return
+        except httpx.TransportError:
+            time.sleep(0.1)
+    raise TimeoutError(base_url)
+
+
+async def client_loop(client: httpx.AsyncClient, file_id: str, deadline: float, edit_every: int,
+                      seed: int, latencies: list[float]):
+    requests = [
+        lambda: client.get(f"/data/{file_id}/filter", params={"column": "Region", "value": "West", "rows": 20}),
+        lambda: client.get(f"/data/{file_id}/aggregate", params={"group_by": "Region", "agg": "Sales:sum"}),
+        lambda: client.get(f"/data/{file_id}/preview", params={"offset": (seed * 50) % 1000, "limit": 50}),
+    ]
+    n = seed
+    while time.monotonic() < deadline:
+        n += 1
+        start = time.perf_counter()
+        if edit_every and n % edit_every == 0:
+            r = await client.patch(f"/data/{file_id}", json={"updates": [
+                {"row": n % 1000, "column": "Units", "value": n % 500}]})
+        else:
+            r = await requests[n % len(requests)]()
+        r.raise_for_status()
+        latencies.append(time.perf_counter() - start)
+
+
+async def consistent(client: httpx.AsyncClient, file_id: str, probes: int) -> bool:
+    """After one edit, every request (spread over all workers) sees it."""
+    await client.patch(f"/data/{file_id}", json={"updates": [{"row": 0, "column": "Units", "value": 4242}]})
+    for _ in range(probes):
+        # A fresh connection each time so the requests land on different workers
+        async with httpx.AsyncClient(base_url=client.base_url) as fresh:
+            row = (await fresh.get(f"/data/{file_id}", params={"rows": 1})).json()["rows"][0]
+        if row["Units"] != 4242:
+            return False
+    return True
+
+
+async def run(base_url: str, payload: bytes, args) -> dict:
+    async with httpx.AsyncClient(base_url=base_url, timeout=120) as client:
+        file_id = (await client.post("/upload-excel", files={"file": ("bench.xlsx", payload)})).json()["file_id"]
+        await wait_until_parsed(client, file_id)
+
+    latencies: list[float] = []
+    deadline = time.monotonic() + args.seconds
+    # One connection per simulated client, so the kernel spreads them across workers
+    clients = [httpx.AsyncClient(base_url=base_url, timeout=120) for _ in range(args.clients)]
+    try:
+        await asyncio.gather(*(client_loop(c, file_id, deadline, args.edit_every, i, latencies)
+                               for i, c in enumerate(clients)))
+        ok = await consistent(clients[0], file_id, probes=4 * args.clients)
+    finally:
+        await asyncio.gather(*(c.aclose() for c in clients))
+    return {"requests": len(latencies), "p50": percentile(latencies, 50), "p99": percentile(latencies, 99),
+            "consistent": ok}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--store", choices=["shm", "redis", "local"], default="shm")
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--clients", type=int, default=16)
+    parser.add_argument("--edit-every", type=int, default=20, help="1 PATCH per this many requests (0: read-only)")
+    parser.add_argument("--seconds", type=float, default=10)
+    args = parser.parse_args()
+
+    payload = _workbook(args.rows)
+    print(f"{args.rows} rows, {args.clients} clients, store={args.store}, cpus={os.cpu_count()}")
+    print(f"{'workers':>7} {'req/s':>9} {'p50 ms':>9} {'p99 ms':>9} {'consistent':>11}")
+
+    stub = None
+    env = {**os.environ, "PYTHONPATH": REPO_ROOT, "OPENAI_API_KEY": os.getenv("OPENAI_API_KEY", "offline"),
+           "EXCELSIOR_STORE": args.store}
+    if args.store == "redis":
+        stub_port = _free_port()
+        stub = subprocess.Popen([sys.executable, "-m", "benchmarks.resp_stub", "--port", str(stub_port)],
+                                cwd=REPO_ROOT, stdout=subprocess.DEVNULL)
+        env["EXCELSIOR_REDIS_URL"] = f"redis://127.0.0.1:{stub_port}/0"
+    try:
+        for workers in args.workers:
+            port = _free_port()
+            workdir = tempfile.mkdtemp(prefix="excelsior-workers-")
+            env["EXCELSIOR_SHARED_DIR"] = os.path.join(workdir, "shared")
+            server = subprocess.Popen(
+                [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--workers", str(workers),
+                 "--log-level", "warning"],
+                cwd=workdir, env=env,
+            )
+            try:
+                base_url = f"http://127.0.0.1:{port}"
+                _wait_for(base_url)
+                result = asyncio.run(run(base_url, payload, args))
+            finally:
+                server.terminate()
+                server.wait()
+            print(f"{workers:>7} {result['requests'] / args.seconds:>9.1f} {result['p50'] * 1000:>9.2f} "
+                  f"{result['p99'] * 1000:>9.2f} {str(result['consistent']):>11}")
+    finally:
+        if stub is not None:
+            stub.terminate()
+            stub.wait()
+
+
+if __name__ == "__main__":
+    main()
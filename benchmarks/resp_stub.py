@@ -0,0 +1,106 @@
+"""
+A stand-in for a Redis server, enough for EXCELSIOR_STORE=redis without
+installing one.
+
+    python -m benchmarks.resp_stub --port 6390
+    EXCELSIOR_STORE=redis EXCELSIOR_REDIS_URL=redis://127.0.0.1:6390/0 uvicorn main:app --workers 4
+
+Speaks RESP2 and implements PING, GET, SET (NX, PX, GET), DEL, EXISTS, DBSIZE,
+FLUSHALL, SELECT and AUTH, in memory, single-threaded on an asyncio loop.
+"""
+import argparse
+import asyncio
+import time
+
+_data: dict[bytes, tuple[bytes, float | None]] = {}   # key -> (value, expiry on the monotonic clock)
+
+
+def _live(key: bytes) -> bytes | None:
+    item = _data.get(key)
+    if item is None:
+        return None
+    if item[1] is not None and item[1] <= time.monotonic():
+        del _data[key]
+        return None
+    return item[0]
+
+
+def _bulk(value: bytes | None) -> bytes:
+    return b"$-1\r\n" if value is None else b"$%d\r\n%s\r\n" % (len(value), value)
+
+
+def _set(args: list[bytes]) -> bytes:
+    key, value, options = args[0], args[1], [a.upper() for a in args[2:]]
+    old = _live(key)
+    if b"NX" in options and old is not None:
+        return _bulk(None)
+    expiry = None
+    if b"PX" in options:
+        expiry = time.monotonic() + int(args[2 + options.index(b"PX") + 1]) / 1000
+    _data[key] = (value, expiry)
+    return _bulk(old) if b"GET" in options else b"+OK\r\n"
+
+
+def execute(args: list[bytes]) -> bytes:
+    command = args[0].upper()
+    if command == b"PING":
+        return b"+PONG\r\n"
+    if command == b"GET":
+        return _bulk(_live(args[1]))
+    if command == b"SET":
+        return _set(args[1:])
+    if command == b"DEL":
+        return b":%d\r\n" % sum(_data.pop(key, None) is not None for key in args[1:])
+    if command == b"EXISTS":
+        return b":%d\r\n" % sum(_live(key) is not None for key in args[1:])
+    if command == b"DBSIZE":
+        return b":%d\r\n" % len(_data)
+    if command == b"FLUSHALL":
+        _data.clear()
+        return b"+OK\r\n"
+    if command in {b"SELECT", b"AUTH"}:
+        return b"+OK\r\n"
+    return b"-ERR unknown command '%s'\r\n" % command
+
+
+async def _read_command(reader: asyncio.StreamReader) -> list[bytes] | None:
+    line = await reader.readline()
+    if not line:
+        return None
+    if not line.startswith(b"*"):
+        return line.split()   # inline command, e.g. from telnet
+    args = []
+    for _ in range(int(line[1:-2])):
+        size = int((await reader.readline())[1:-2])
+        args.append((await reader.readexactly(size + 2))[:-2])
+    return args
+
+
+async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    try:
+        while (args := await _read_command(reader)) is not None:
+            if args:
+                writer.write(execute(args))
+                await writer.drain()
+    except (ConnectionError, asyncio.IncompleteReadError):
+        pass
+    finally:
+        writer.close()
+
+
+async def serve(port: int):
+    server = await asyncio.start_server(handle, "127.0.0.1", port, limit=2**20)
+    async with server:
+        await server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=6390)
+    args = parser.parse_args()
+    print(f"RESP stand-in on 127.0.0.1:{args.port}")
+    asyncio.run(serve(args.port))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,379 @@
+"""
+End-to-end benchmark suite: micro-benchmarks of the main endpoints plus a
+concurrent load run, against the ASGI app in-process, with the LLM replaced by
+benchmarks/llm_stub. Results are written as JSON so runs can be compared.
+
+    python -m benchmarks.suite run --rows 100000 --mix int=2,float=3,text=2,category=3,date=1,bool=1
+    python -m benchmarks.suite run --quick --out before.json
+    python -m benchmarks.suite compare before.json after.json --threshold 0.15
+
+`run` measures, each as p50/p99/mean over --repeat calls:
+  upload_excel           POST /upload-excel until the background parse is done
+  patch_file_data        PATCH /data/{id}, one cell and a 1000-cell batch
+  patch_column           PATCH /data/{id}/column, numeric add
+  filter_data            GET /data/{id}/filter on a low-cardinality text column
+  sort_data              GET /data/{id}/sort, preview and persist=true
+  export_file            POST /export/{id} per --export format (after an edit, so it isn't cached)
+  update_status          services.file_status.update_status, called directly
+  generate_action/formula  POST /generate-action and /generate-formula through the stub
+then --clients concurrent clients for --seconds on a mixed workload, reporting
+throughput and p50/p99 overall and per request kind.
+
+`compare` prints every metric of two result files side by side and exits with
+status 1 when one got worse by more than --threshold (latencies up, throughput
+down). Runs in a scratch directory; nothing leaves the machine.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+import httpx
+import numpy as np
+
+from benchmarks.common import DEFAULT_MIX, make_workbook, scratch_dir, workbook_bytes
+from benchmarks.llm_stub import serve
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FILE_ID = "suite"
+
+# Load mix: (request kind, weight)
+LOAD_MIX = [("get_data", 25), ("filter", 20), ("sort_preview", 10), ("aggregate", 10),
+            ("patch_cell", 25), ("patch_column", 5), ("generate_action", 5)]
+
+
+def summarize(samples: list[float]) -> dict:
+    """Latency statistics in milliseconds."""
+    ms = np.asarray(samples) * 1000
+    return {"n": len(samples), "p50": round(float(np.percentile(ms, 50)), 3),
+            "p99": round(float(np.percentile(ms, 99)), 3), "mean": round(float(ms.mean()), 3),
+            "min": round(float(ms.min()), 3), "max": round(float(ms.max()), 3)}
+
+
+def check(response: httpx.Response) -> httpx.Response:
+    if response.status_code >= 400:
+        raise RuntimeError(f"{response.request.method} {response.request.url.path}: "
+                           f"{response.status_code} {response.text[:200]}")
+    return response
+
+
+class Columns:
+    """Which generated columns each benchmark uses; None when the mix has no such column."""
+
+    def __init__(self, df):
+        names = df.columns.tolist()
+        first = lambda *prefixes: next((c for c in names if c.rstrip("0123456789") in prefixes), None)  # noqa: E731
+        self.number = first("float", "int")
+        self.integer = first("int")
+        self.label = first("category", "text")
+        self.label_value = None if self.label is None else str(df[self.label].dropna().iloc[0])
+
+
+async def sample(call, repeat: int) -> dict:
+    seconds = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        check(await call(i))
+        seconds.append(time.perf_counter() - start)
+    return summarize(seconds)
+
+
+async def wait_parsed(client: httpx.AsyncClient, file_id: str):
+    while True:
+        status = check(await client.get(f"/status/{file_id}")).json()["status"]
+        if status != "parsing":
+            if status != "uploaded":
+                raise RuntimeError(f"upload {file_id}: {status}")
+            return
+        await asyncio.sleep(0.01)
+
+
+async def micro(client: httpx.AsyncClient, cols: Columns, rows: int, args) -> dict:
+    from services import file_status
+    results, skipped = {}, []
+    rng = np.random.default_rng(0)
+    repeat = args.repeat
+
+    payload = workbook_bytes(make_workbook(args.upload_rows, args.mix, args.nulls, seed=1))
+
+    async def upload(_):
+        r = check(await client.post("/upload-excel", files={"file": ("suite.xlsx", payload)}))
+        await wait_parsed(client, r.json()["file_id"])
+        return r
+    results["upload_excel"] = {**await sample(upload, max(repeat // 10, 2)), "rows": args.upload_rows,
+                               "bytes": len(payload)}
+
+    if cols.number is not None:
+        def cell(i):
+            return {"row": int(rng.integers(rows)), "column": cols.number, "value": float(i)}
+        results["patch_file_data"] = await sample(
+            lambda i: client.patch(f"/data/{FILE_ID}", json={"updates": [cell(i)]}), repeat)
+        results["patch_file_data_1000"] = await sample(
+            lambda i: client.patch(f"/data/{FILE_ID}", json={"updates": [cell(i) for _ in range(1000)]}), repeat)
+        results["patch_column"] = await sample(
+            lambda i: client.patch(f"/data/{FILE_ID}/column",
+                                   json={"column": cols.number, "operation": "add", "delta": 1}), repeat)
+        results["sort_data"] = await sample(
+            lambda i: client.get(f"/data/{FILE_ID}/sort", params={"column": cols.number, "order": "desc"}), repeat)
+        results["sort_data_persist"] = await sample(
+            lambda i: client.get(f"/data/{FILE_ID}/sort", params={"column": cols.number, "persist": True,
+                                                                 "order": "asc" if i % 2 else "desc"}), repeat)
+    else:
+        skipped += ["patch_file_data", "patch_column", "sort_data"]
+
+    if cols.label is not None:
+        results["filter_data"] = await sample(
+            lambda i: client.get(f"/data/{FILE_ID}/filter", params={"column": cols.label, "value": cols.label_value}),
+            repeat)
+    else:
+        skipped.append("filter_data")
+
+    for fmt in args.export:
+        async def export(i, fmt=fmt):
+            if cols.number is not None:   # a new version, so the export is written rather than reused
+                check(await client.patch(f"/data/{FILE_ID}", json={"updates": [
+                    {"row": 0, "column": cols.number, "value": float(i)}]}))
+            start = time.perf_counter()
+            r = await client.post(f"/export/{FILE_ID}", params={"format": fmt})
+            export.seconds.append(time.perf_counter() - start)
+            return r
+        export.seconds = []
+        for i in range(max(repeat // 10, 2)):
+            check(await export(i))
+        results[f"export_file_{fmt}"] = summarize(export.seconds)
+
+    seconds = []
+    for i in range(repeat * 10):
+        start = time.perf_counter()
+        file_status.update_status(f"suite-{i % 100}", f"modified ({i})")
+        seconds.append(time.perf_counter() - start)
+    results["update_status"] = summarize(seconds)
+
+    # Prompts the local intent rules can't answer, each new, so every call reaches the stub
+    results["generate_action"] = await sample(
+        lambda i: client.post("/generate-action", json={"file_id": FILE_ID, "prompt": f"tidy this sheet up, take {i}"}),
+        max(repeat // 5, 2))
+    results["generate_formula"] = await sample(
+        lambda i: client.post("/generate-formula", json={"file_id": FILE_ID, "prompt": f"make it look right, take {i}"}),
+        max(repeat // 5, 2))
+    return {"results": results, "skipped": skipped}
+
+
+def load_request(client: httpx.AsyncClient, kind: str, cols: Columns, rows: int, n: int):
+    if kind == "get_data":
+        return client.get(f"/data/{FILE_ID}", params={"rows": 50})
+    if kind == "filter" and cols.label is not None:
+        return client.get(f"/data/{FILE_ID}/filter", params={"column": cols.label, "value": cols.label_value, "rows": 20})
+    if kind == "sort_preview" and cols.number is not None:
+        return client.get(f"/data/{FILE_ID}/sort", params={"column": cols.number, "rows": 20})
+    if kind == "aggregate" and cols.label is not None:
+        agg = f"{cols.number}:sum" if cols.number else "count"
+        return client.get(f"/data/{FILE_ID}/aggregate", params={"group_by": cols.label, "agg": agg})
+    if kind == "patch_cell" and cols.number is not None:
+        return client.patch(f"/data/{FILE_ID}", json={"updates": [
+            {"row": (n * 7919) % rows, "column": cols.number, "value": float(n)}]})
+    if kind == "patch_column" and cols.integer is not None:
+        return client.patch(f"/data/{FILE_ID}/column", json={"column": cols.integer, "operation": "add", "delta": 1})
+    if kind == "generate_action":
+        return client.post("/generate-action", json={"file_id": FILE_ID, "prompt": f"tidy this sheet up, load {n}"})
+    return client.get(f"/data/{FILE_ID}", params={"rows": 50})   # the mix has no column for it
+
+
+async def load(client: httpx.AsyncClient, cols: Columns, rows: int, args) -> dict:
+    kinds = [k for k, _ in LOAD_MIX]
+    weights = np.asarray([w for _, w in LOAD_MIX], dtype=float)
+    samples: dict[str, list[float]] = {k: [] for k in kinds}
+    errors = []
+    deadline = time.monotonic() + args.seconds
+
+    async def worker(seed: int):
+        rng = np.random.default_rng(seed)
+        n = seed
+        while time.monotonic() < deadline:
+            n += args.clients
+            kind = kinds[rng.choice(len(kinds), p=weights / weights.sum())]
+            start = time.perf_counter()
+            r = await load_request(client, kind, cols, rows, n)
+            if r.status_code >= 400:
+                errors.append(f"{kind}: {r.status_code}")
+                continue
+            samples[kind].append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker(i) for i in range(args.clients)))
+    elapsed = time.perf_counter() - start
+    everything = [s for values in samples.values() for s in values]
+    return {"clients": args.clients, "seconds": round(elapsed, 3), "requests": len(everything),
+            "throughput": round(len(everything) / elapsed, 2), "errors": len(errors), "error_sample": errors[:5],
+            **{k: v for k, v in summarize(everything).items() if k != "n"},
+            "kinds": {k: summarize(v) for k, v in samples.items() if v}}
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def run_suite(args) -> dict:
+    import pandas as pd
+    import main
+    from services import memory_store
+    from services.dtype_optimizer import optimize
+
+    df = make_workbook(args.rows, args.mix, args.nulls)
+    cols = Columns(df)
+    # Loaded as an upload would leave it: dtype-optimized, in the cache
+    memory_store.put(FILE_ID, optimize(df)[0], dirty=False)
+
+    transport = httpx.ASGITransport(app=main.app)
+    async with main.app.router.lifespan_context(main.app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://suite", timeout=600) as client:
+            started = time.perf_counter()
+            micro_results = await micro(client, cols, len(df), args)
+            print(f"  micro-benchmarks: {time.perf_counter() - started:.1f} s")
+            load_results = await load(client, cols, len(df), args)
+    return {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "pandas": pd.__version__,
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "rows": args.rows, "mix": args.mix, "nulls": args.nulls, "columns": df.shape[1],
+            "upload_rows": args.upload_rows, "repeat": args.repeat, "llm_latency": args.llm_latency,
+        },
+        "micro": micro_results["results"],
+        "skipped": micro_results["skipped"],
+        "load": load_results,
+    }
+
+
+def command_run(args) -> int:
+    out = os.path.abspath(args.out or os.path.join(
+        scratch_dir("results"), f"suite-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json"))
+    stub = serve(latency=args.llm_latency)
+    workdir = tempfile.mkdtemp(prefix="excelsior-suite-")
+    # Set before the app is imported: the LLM client reads its base URL once
+    os.environ.update({
+        "OPENAI_API_KEY": os.getenv("OPENAI_API_KEY", "offline"),
+        "EXCELSIOR_LLM_BASE_URL": f"http://127.0.0.1:{stub.server_address[1]}/v1",
+        "EXCELSIOR_LLM_CACHE_DB": os.path.join(workdir, "llm_cache.db"),
+        "EXCELSIOR_STATUS_DB": os.path.join(workdir, "file_statuses.db"),
+    })
+    sys.path.insert(0, REPO_ROOT)
+    os.chdir(workdir)
+    try:
+        print(f"{args.rows} rows x {len(make_workbook(1, args.mix).columns)} columns ({args.mix}), "
+              f"{args.clients} clients for {args.seconds:g} s, LLM stub {args.llm_latency * 1000:.0f} ms")
+        results = asyncio.run(run_suite(args))
+    finally:
+        os.chdir(REPO_ROOT)
+        stub.shutdown()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    with open(out, "w") as f:
+        json.dump(results, f, indent=2)
+    for name, stats in results["micro"].items():
+        print(f"  {name:24} p50 {stats['p50']:10.3f} ms   p99 {stats['p99']:10.3f} ms   (n={stats['n']})")
+    load_results = results["load"]
+    print(f"  load: {load_results['throughput']:.1f} req/s, p50 {load_results['p50']:.2f} ms, "
+          f"p99 {load_results['p99']:.2f} ms, {load_results['errors']} errors")
+    print(f"results: {out}")
+    if args.baseline:
+        return report(load_json(args.baseline), results, args.threshold, args.min_ms)
+    return 0
+
+
+def load_json(path: str) -> dict:
+    with open(path) as f:
+        return json.load(f)
+
+
+def metrics(results: dict) -> dict[str, tuple[float, bool]]:
+    """{metric: (value, higher is better)}"""
+    out = {}
+    for name, stats in results.get("micro", {}).items():
+        out[f"micro.{name}.p50"] = (stats["p50"], False)
+        out[f"micro.{name}.p99"] = (stats["p99"], False)
+    load_results = results.get("load")
+    if load_results:
+        out["load.throughput"] = (load_results["throughput"], True)
+        out["load.p50"] = (load_results["p50"], False)
+        out["load.p99"] = (load_results["p99"], False)
+        for kind, stats in load_results.get("kinds", {}).items():
+            out[f"load.{kind}.p50"] = (stats["p50"], False)
+    return out
+
+
+def report(baseline: dict, current: dict, threshold: float, min_ms: float) -> int:
+    """Print both runs side by side; 1 when any metric regressed by more than `threshold`."""
+    before, after = metrics(baseline), metrics(current)
+    regressions = []
+    print(f"{'metric':40} {'baseline':>12} {'current':>12} {'change':>8}")
+    for name in sorted(before.keys() & after.keys()):
+        (old, higher_better), (new, _) = before[name], after[name]
+        change = (new - old) / old if old else 0.0
+        worse = -change if higher_better else change
+        # Sub-millisecond latencies move by more than any threshold from noise alone
+        flagged = worse > threshold and (higher_better or new - old >= min_ms)
+        if flagged:
+            regressions.append(name)
+        print(f"{name:40} {old:12.3f} {new:12.3f} {change:+8.1%}{'  REGRESSION' if flagged else ''}")
+    for name in sorted(before.keys() ^ after.keys()):
+        print(f"{name:40} {'only in ' + ('baseline' if name in before else 'current'):>34}")
+    print(f"{len(regressions)} regression(s) beyond {threshold:.0%}"
+          + (f": {', '.join(regressions)}" if regressions else ""))
+    return 1 if regressions else 0
+
+
+def command_compare(args) -> int:
+    return report(load_json(args.baseline), load_json(args.current), args.threshold, args.min_ms)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run = commands.add_parser("run", help="run the suite and write results JSON")
+    run.add_argument("--rows", type=int, default=100_000, help="rows of the sheet the endpoints work on")
+    run.add_argument("--mix", default=DEFAULT_MIX, help="column kinds and counts, e.g. int=2,float=3,text=1")
+    run.add_argument("--nulls", type=float, default=0.02, help="share of missing float/text cells")
+    run.add_argument("--upload-rows", type=int, default=10_000, help="rows of the workbook uploaded")
+    run.add_argument("--repeat", type=int, default=30, help="calls per micro-benchmark")
+    run.add_argument("--export", nargs="*", default=["csv", "parquet"], choices=["xlsx", "csv", "parquet"])
+    run.add_argument("--clients", type=int, default=16)
+    run.add_argument("--seconds", type=float, default=10, help="length of the load run")
+    run.add_argument("--llm-latency", type=float, default=0.2, help="seconds per stub completion")
+    run.add_argument("--quick", action="store_true", help="small and short: 20k rows, 10 repeats, 3 s of load")
+    run.add_argument("--out", help="results file (default benchmarks/.data/results/suite-<time>.json)")
+    run.add_argument("--baseline", help="results file to compare against when done")
+    run.add_argument("--threshold", type=float, default=0.15)
+    run.add_argument("--min-ms", type=float, default=1.0, help="ignore latency changes smaller than this")
+
+    compare = commands.add_parser("compare", help="compare two results files")
+    compare.add_argument("baseline")
+    compare.add_argument("current")
+    compare.add_argument("--threshold", type=float, default=0.15, help="relative change that counts as a regression")
+    compare.add_argument("--min-ms", type=float, default=1.0, help="ignore latency changes smaller than this")
+
+    args = parser.parse_args()
+    if args.command == "run":
+        if args.quick:
+            args.rows, args.repeat, args.seconds, args.upload_rows = 20_000, 10, 3, 2_000
+        sys.exit(command_run(args))
+    sys.exit(command_compare(args))
+
+
+if __name__ == "__main__":
+    main()
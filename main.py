@@ -1,7 +1,21 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
-from routers import upload, formula, action, download, status, data, export
+from routers import upload, formula, action, download, status, data, export, feed
+from services import ingest, op_journal, operations, exporter
+from services.metrics import MetricsMiddleware
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Edits that were journalled but never checkpointed before the last shutdown/crash
+    operations.recover_all()
+    exporter.clear()
+    yield
+    ingest.shutdown()
+    op_journal.close_all()
+
+app = FastAPI(lifespan=lifespan)
+# Per-route latency and bytes for /metrics, and ?profile=1 (see services/metrics)
+app.add_middleware(MetricsMiddleware)
 app.include_router(upload.router)
 app.include_router(formula.router)
 app.include_router(action.router)
@@ -9,4 +23,5 @@ app.include_router(download.router)
 app.include_router(status.router)
 app.include_router(data.router)
 app.include_router(export.router)
+app.include_router(feed.router)
 app.include_router(data.router, tags=["preview"])
\ No newline at end of file
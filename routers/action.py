@@ -1,7 +1,12 @@
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
-from services.formula_generator import generate_excel_formula
-from services.excel_modifier import apply_excel_action
+from services.formula_generator import resolve_action
+from services.memory_store import get as get_df
+from services.excel_modifier import apply_excel_action, plan_action
+from services.action_validator import validate_action_schema
+from services.aggregator import aggregate
+from services.serializer import FastJSONResponse, frame_records
+from services.operations import durable
 from exceptions import FileNotFound, InvalidActionSchema, ExcelOperationError
 
 router = APIRouter()
@@ -9,15 +14,36 @@ router = APIRouter()
 class PromptRequest(BaseModel):
     file_id: str
     prompt: str
+    dry_run: bool = False   # return the execution plan and row estimates; change nothing
 
 @router.post("/generate-action")
 async def generate_action(request: PromptRequest):
-    action = generate_excel_formula(request.prompt)
+    # Common commands are parsed locally; the rest go to the LLM
+    df = get_df(request.file_id)
+    if df is None:
+        raise HTTPException(status_code=404, detail=f"File with ID '{request.file_id}' not found.")
+    action, source = await resolve_action(request.prompt, df)
 
     if "error" in action:
         raise HTTPException(status_code=400, detail=action["error"])
 
+    # Summaries are answered, not applied: the sheet stays as it is
+    if action.get("operation") == "aggregate":
+        is_valid, err = validate_action_schema(action, df.columns.tolist())
+        if not is_valid:
+            raise HTTPException(status_code=422, detail=f"Invalid request: {err}")
+        try:
+            result = aggregate(request.file_id, df, action)
+        except InvalidActionSchema as e:
+            raise HTTPException(status_code=422, detail=f"Invalid request: {e.message}")
+        return FastJSONResponse({"message": "Summary computed", "action": action, "source": source,
+                                 "groups": len(result), "rows": frame_records(result.head(1000))})
+
     try:
+        if request.dry_run:
+            plan = plan_action(request.file_id, action)
+            return FastJSONResponse({"message": "Dry run: nothing was applied", "action": action,
+                                     "source": source, "plan": plan})
         apply_excel_action(request.file_id, action)
     except FileNotFound as e:
         raise HTTPException(status_code=404, detail=e.message)
@@ -27,5 +53,6 @@ async def generate_action(request: PromptRequest):
         raise HTTPException(status_code=400, detail=f"Excel error: {e.message}")
     except Exception:
         raise HTTPException(status_code=500, detail="Unexpected error occurred.")
+    await durable(request.file_id)
 
-    return { "message": "Action applied successfully", "action": action }
\ No newline at end of file
+    return { "message": "Action applied successfully", "action": action, "source": source }
\ No newline at end of file
@@ -1,15 +1,28 @@
 from fastapi import APIRouter, HTTPException, Query
-from services.memory_store import get as get_df, put as put_df   # in-memory store
+from fastapi.responses import StreamingResponse
+from services.memory_store import get as get_df, list_sheets   # in-memory store
 from pydantic import BaseModel
 from services.file_status import update_status
-import pandas as pd
-import os
+from services import frame_versions
+from services.operations import apply_op, durable, checkpoint
+from services.frame_index import sort_positions
+from services.query_engine import filter_mask, to_expression
+from services.aggregator import aggregate
+from services.dtype_optimizer import memory_report
+from services.chunk_store import is_chunked, head as chunk_head, page as chunk_page, describe as chunk_description
+from services.out_of_core import filter_rows, sort_head, sort_persist, patch_column as patch_chunked_column
+from services.metrics import stage, timed_iter
+from services.serializer import FastJSONResponse, frame_records, iter_json, iter_ndjson, iter_arrow
+from exceptions import ExcelOperationError, InvalidActionSchema, FileNotFound
+import asyncio
+import numpy as np
+import json
 
 UPLOAD_DIR = "uploads"
 router = APIRouter()
 
 class PatchRequest(BaseModel):
-    updates: list[dict]  # Each dict should have "row", "column", and "value"
+    updates: list[dict]  # Each dict should have "row" (0-based position), "column", and "value"
 
 class ColumnPatch(BaseModel):
     column: str
@@ -17,70 +30,131 @@ class ColumnPatch(BaseModel):
     operation: str | None = None                  # upper, lower, title, add, sub
     delta: int | float | None = None  
 
+def _in_memory_only(file_id: str):
+    # Files in the out-of-core mode (services/chunk_store) page, filter, sort and patch columns only
+    if is_chunked(file_id):
+        raise HTTPException(status_code=409, detail="Not available for files in out-of-core mode.")
+
 @router.get("/data/{file_id}")
 async def get_live_data(
     file_id: str,
-    rows: int = Query(20, ge=1, le=1000, description="Number of rows to preview")
+    rows: int = Query(20, ge=1, le=1000, description="Number of rows to preview"),
+    sheet: str | None = Query(None, description="Sheet name; defaults to the first sheet"),
+    version: int | None = Query(None, ge=0, description="Read an earlier (or undone) version")
 ):
     """
     Return the top `rows` rows of the DataFrame for live preview.
     """
-    df = get_df(file_id)
+    if sheet is None and version is None and is_chunked(file_id):
+        head = await asyncio.to_thread(chunk_head, file_id, rows)
+        return FastJSONResponse({"file_id": file_id, "rows": frame_records(head)})
+    if version is not None:
+        _in_memory_only(file_id)
+        df = _frame_version(file_id, version)
+    else:
+        df = get_df(file_id, sheet=sheet)
     if df is None:
-        raise HTTPException(status_code=404, detail="File not loaded in memory.")
+        detail = f"Sheet '{sheet}' not found." if sheet is not None else "File not loaded in memory."
+        raise HTTPException(status_code=404, detail=detail)
 
     # Convert DataFrame slice → JSON-serialisable list-of-dicts
-    preview = df.head(rows).to_dict(orient="records")
-    return {"file_id": file_id, "rows": preview}
+    preview = frame_records(df.head(rows))
+    return FastJSONResponse({"file_id": file_id, "rows": preview})
 
-@router.get("/data/{file_id}/preview")
-async def get_file_data(file_id: str):
-    df = get_df(file_id)
+def _frame_version(file_id: str, version: int):
+    if get_df(file_id) is None:
+        return None
+    df = frame_versions.frame_at(file_id, version)
     if df is None:
-        raise HTTPException(status_code=404, detail="File not found in memory.")
-    
-    # Convert DataFrame to list of dicts for JSON response
-    return {
+        raise HTTPException(status_code=404, detail=f"Version {version} is not available.")
+    return df
+
+@router.get("/data/{file_id}/sheets")
+async def get_sheet_names(file_id: str):
+    names = list_sheets(file_id)
+    if names is None:
+        raise HTTPException(status_code=404, detail="File not found.")
+    return {"file_id": file_id, "sheets": names}
+
+@router.get("/data/{file_id}/preview")
+async def get_file_data(
+    file_id: str,
+    offset: int = Query(0, ge=0, description="First row of the page"),
+    limit: int | None = Query(None, ge=1, description="Rows in the page; omit for all remaining rows"),
+    format: str = Query("json", pattern="^(json|ndjson|arrow)$", description="json, ndjson or arrow"),
+    version: int | None = Query(None, ge=0, description="Read an earlier (or undone) version")
+):
+    """
+    Page through the whole DataFrame. Rows are encoded and streamed in batches,
+    so memory per request stays bounded however large the sheet is. Files in
+    the out-of-core mode are read one chunk at a time.
+    """
+    chunked = chunk_description(file_id)
+    if chunked is not None:
+        if version is not None:
+            _in_memory_only(file_id)
+        total, columns = chunked["rows"], list(chunked["columns"])
+    else:
+        df = get_df(file_id) if version is None else _frame_version(file_id, version)
+        if df is None:
+            raise HTTPException(status_code=404, detail="File not found in memory.")
+        total, columns = len(df), df.columns.tolist()
+
+    end = total if limit is None else min(offset + limit, total)
+    page = chunk_page(file_id, offset, end) if chunked is not None else df.iloc[offset:end]
+    next_offset = end if end < total else None
+
+    headers = {"X-Total-Count": str(total)}
+    if next_offset is not None:
+        headers["X-Next-Offset"] = str(next_offset)
+
+    if format == "ndjson":
+        return StreamingResponse(timed_iter("serialize", iter_ndjson(page)), media_type="application/x-ndjson", headers=headers)
+    if format == "arrow":
+        return StreamingResponse(timed_iter("serialize", iter_arrow(page)), media_type="application/vnd.apache.arrow.stream", headers=headers)
+
+    meta = {
         "file_id": file_id,
-        "rows": df.to_dict(orient="records"),
-        "columns": df.columns.tolist()
+        "columns": columns,
+        "offset": offset,
+        "total": total,
+        "next_offset": next_offset,
     }
+    return StreamingResponse(timed_iter("serialize", iter_json(meta, page)), media_type="application/json", headers=headers)
 
 @router.patch("/data/{file_id}")
 async def patch_file_data(file_id: str, patch: PatchRequest):
     """
-    Apply in-place updates to the in-memory DataFrame.
+    Apply a batch of cell updates to the in-memory DataFrame. The batch is
+    validated up front and applied all-or-nothing.
     """
-    df = get_df(file_id)
-    if df is None:
+    _in_memory_only(file_id)
+    try:
+        _, version = apply_op(file_id, {"kind": "cells", "updates": patch.updates})
+    except FileNotFound:
         raise HTTPException(status_code=404, detail="File not loaded in memory.")
+    except ExcelOperationError as e:
+        raise HTTPException(status_code=400, detail=e.message)
 
-    for update in patch.updates:
-        row_idx = update.get("row")
-        col_name = update.get("column")
-        new_val = update.get("value")
-
-        if row_idx is None or col_name is None:
-            raise HTTPException(status_code=400, detail="Missing row or column in update.")
-
-        if col_name not in df.columns or not (0 <= row_idx < len(df)):
-            raise HTTPException(status_code=400, detail=f"Invalid row index or column name: {row_idx}, {col_name}")
-
-        df.at[row_idx, col_name] = new_val
-
-    put_df(file_id, df)  # Save changes back into memory
-    return {"file_id": file_id, "message": "Updates applied in memory."}
+    # New version in memory; acknowledged once its journal record is on disk
+    await durable(file_id)
+    return {"file_id": file_id, "version": version, "message": "Updates applied in memory."}
 
 
 @router.post("/data/{file_id}/save")
 async def save_live_data(file_id: str):
-    df = get_df(file_id)
-    if df is None:
+    if is_chunked(file_id):
+        # Column patches and sorts write their chunks as they go
+        return {"file_id": file_id, "message": "Out-of-core files are saved as they are edited."}
+    if get_df(file_id) is None:
         raise HTTPException(status_code=404, detail="File not found in memory.")
 
-    # Save to disk
-    file_path = os.path.join(UPLOAD_DIR, f"{file_id}.xlsx")
-    df.to_excel(file_path, index=False)
+    # Checkpoint: a new base snapshot (the .xlsx is regenerated from it on
+    # /download) and a compacted journal, written off the event loop
+    try:
+        await asyncio.to_thread(checkpoint, file_id)
+    except ExcelOperationError as e:
+        raise HTTPException(status_code=400, detail=e.message)
 
     update_status(file_id, "modified")
     return {
@@ -90,90 +164,151 @@ async def save_live_data(file_id: str):
 
 @router.patch("/data/{file_id}/column")
 async def patch_column(file_id: str, patch: ColumnPatch):
-    df = get_df(file_id)
-    if df is None:
+    if is_chunked(file_id):
+        return await _patch_chunked_column(file_id, patch)
+    op = {"kind": "column", "column": patch.column, "value": patch.value,
+          "operation": patch.operation, "delta": patch.delta}
+    try:
+        patched, version = apply_op(file_id, op)
+    except FileNotFound:
         raise HTTPException(status_code=404, detail="File not loaded in memory.")
-
-    if patch.column not in df.columns:
-        raise HTTPException(status_code=400, detail="Column not found.")
-
-    col = patch.column
-    if patch.operation is None:  # simple overwrite
-        if patch.value is None:
-            raise HTTPException(status_code=400, detail="Provide 'value' or 'operation'.")
-        df[col] = patch.value
-
-    elif patch.operation in {"upper", "lower", "title"}:
-        if not pd.api.types.is_string_dtype(df[col]):
-            raise HTTPException(status_code=400, detail="String operation on non-string column.")
-        if patch.operation == "upper":
-            df[col] = df[col].str.upper()
-        elif patch.operation == "lower":
-            df[col] = df[col].str.lower()
-        elif patch.operation == "title":
-            df[col] = df[col].str.title()
-
-    elif patch.operation in {"add", "sub"}:
-        if patch.delta is None:
-            raise HTTPException(status_code=400, detail="Missing 'delta' for numeric operation.")
-        if not pd.api.types.is_numeric_dtype(df[col]):
-            raise HTTPException(status_code=400, detail="Numeric operation on non-numeric column.")
-        delta = patch.delta
-        df[col] = df[col] + delta if patch.operation == "add" else df[col] - delta
-
-    else:
-        raise HTTPException(status_code=400, detail=f"Unsupported operation '{patch.operation}'.")
-
-    put_df(file_id, df)
+    except ExcelOperationError as e:
+        raise HTTPException(status_code=400, detail=e.message)
+    await durable(file_id)
     update_status(file_id, "modified (column patch)")
 
     # return a preview so caller sees effect immediately
-    return {
+    return FastJSONResponse({
         "file_id": file_id,
+        "version": version,
         "message": "Column updated.",
-        "preview": df.head(10).to_dict(orient="records")
-    }
+        "preview": frame_records(patched.head(10))
+    })
+
+async def _patch_chunked_column(file_id: str, patch: ColumnPatch):
+    # Rewrites every chunk, off the event loop; there is no undo in the out-of-core mode
+    try:
+        with stage("frame_op"):
+            version = await asyncio.to_thread(patch_chunked_column, file_id, patch.column, patch.value,
+                                              patch.operation, patch.delta)
+    except ExcelOperationError as e:
+        raise HTTPException(status_code=400, detail=e.message)
+    update_status(file_id, "modified (column patch)")
+    return FastJSONResponse({
+        "file_id": file_id,
+        "version": version,
+        "message": "Column updated.",
+        "preview": frame_records(await asyncio.to_thread(chunk_head, file_id, 10))
+    })
+
+class FilterRequest(BaseModel):
+    where: dict       # expression tree, see services/query_engine
+    rows: int = 100
+
+async def _run_chunked_filter(file_id: str, expr: dict, rows: int):
+    try:
+        with stage("filter"):
+            count, matched = await asyncio.to_thread(filter_rows, file_id, expr, rows)
+    except InvalidActionSchema as e:
+        raise HTTPException(status_code=400, detail=e.message)
+    return FastJSONResponse({"file_id": file_id, "filter": expr, "count": count, "rows": frame_records(matched)})
 
-SUPPORTED_OPS = { "==", "!=", ">", "<", ">=", "<=" }
+def _run_filter(file_id: str, expr: dict, rows: int):
+    df = get_df(file_id)
+    if df is None:
+        raise HTTPException(status_code=404, detail="File not loaded in memory.")
+
+    # Compiled to NumPy masks; simple comparisons reuse the cached per-column indexes
+    try:
+        with stage("filter"):
+            mask = filter_mask(expr, df, file_id)
+    except InvalidActionSchema as e:
+        raise HTTPException(status_code=400, detail=e.message)
+    positions = np.flatnonzero(mask)
+
+    return FastJSONResponse({
+        "file_id": file_id,
+        "filter": expr,
+        "count": len(positions),
+        "rows": frame_records(df.take(positions[:rows]))
+    })
 
 @router.get("/data/{file_id}/filter")
 async def filter_data(
     file_id: str,
-    column: str = Query(..., description="Column to filter on"),
+    column: str | None = Query(None, description="Column to filter on"),
     operator: str = Query("==", description="One of ==, !=, >, <, >=, <="),
-    value: str = Query(..., description="Value to compare against"),
+    value: str | None = Query(None, description="Value to compare against"),
+    where: str | None = Query(None, description="JSON filter expression; replaces column/operator/value"),
     rows: int = Query(100, ge=1, le=1000, description="Rows to return (preview)")
 ):
+    if where is not None:
+        try:
+            expr = json.loads(where)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=f"'where' is not valid JSON: {e}")
+    elif column is not None and value is not None:
+        expr = to_expression(column, operator, value)
+    else:
+        raise HTTPException(status_code=400, detail="Provide 'where' or 'column' and 'value'.")
+    if is_chunked(file_id):
+        return await _run_chunked_filter(file_id, expr, rows)
+    return _run_filter(file_id, expr, rows)
+
+@router.post("/data/{file_id}/filter")
+async def filter_data_post(file_id: str, request: FilterRequest):
+    if not 1 <= request.rows <= 1000:
+        raise HTTPException(status_code=400, detail="'rows' must be between 1 and 1000.")
+    if is_chunked(file_id):
+        return await _run_chunked_filter(file_id, request.where, request.rows)
+    return _run_filter(file_id, request.where, request.rows)
+
+class AggregateRequest(BaseModel):
+    group_by: list[str] = []
+    pivot: str | None = None
+    aggregations: list[dict] | dict | None = None   # [{"column", "func"}], see services/aggregator
+    rows: int = 1000
+
+def _run_aggregate(file_id: str, spec: dict, rows: int):
+    _in_memory_only(file_id)
     df = get_df(file_id)
     if df is None:
         raise HTTPException(status_code=404, detail="File not loaded in memory.")
 
-    if column not in df.columns:
-        raise HTTPException(status_code=400, detail=f"Column '{column}' not found.")
-
-    if operator not in SUPPORTED_OPS:
-        raise HTTPException(status_code=400, detail=f"Unsupported operator '{operator}'.")
-
-    # Coerce value type to match column dtype
-    col_dtype = df[column].dtype
+    # Cached per frame version; small cell patches update the cached result in place
     try:
-        typed_value = pd.Series([value]).astype(col_dtype)[0]
-    except Exception:
-        raise HTTPException(status_code=400, detail=f"Cannot cast value to column type {col_dtype}")
+        with stage("aggregate"):
+            result = aggregate(file_id, df, spec)
+    except InvalidActionSchema as e:
+        raise HTTPException(status_code=400, detail=e.message)
 
-    # Build boolean mask
-    expr = f"`{column}` {operator} @typed_value"
-    try:
-        filtered = df.query(expr)
-    except Exception as e:
-        raise HTTPException(status_code=400, detail=f"Bad filter expression: {e}")
-
-    return {
+    return FastJSONResponse({
         "file_id": file_id,
-        "filter": { "column": column, "operator": operator, "value": value },
-        "count": len(filtered),
-        "rows": filtered.head(rows).to_dict(orient="records")
-    }
+        "aggregate": spec,
+        "groups": len(result),
+        "rows": frame_records(result.head(rows))
+    })
+
+@router.get("/data/{file_id}/aggregate")
+async def aggregate_data(
+    file_id: str,
+    group_by: list[str] = Query([], description="Key column(s); repeat for several"),
+    agg: list[str] = Query(["count"], description="'func' or 'column:func', e.g. Sales:sum; repeat for several"),
+    pivot: str | None = Query(None, description="Column whose values become result columns"),
+    rows: int = Query(1000, ge=1, le=10000, description="Groups to return")
+):
+    aggregations = []
+    for item in agg:
+        column, _, func = item.rpartition(":")
+        aggregations.append({"column": column or None, "func": func})
+    return _run_aggregate(file_id, {"group_by": group_by, "pivot": pivot, "aggregations": aggregations}, rows)
+
+@router.post("/data/{file_id}/aggregate")
+async def aggregate_data_post(file_id: str, request: AggregateRequest):
+    if not 1 <= request.rows <= 10000:
+        raise HTTPException(status_code=400, detail="'rows' must be between 1 and 10000.")
+    spec = {"group_by": request.group_by, "pivot": request.pivot, "aggregations": request.aggregations}
+    return _run_aggregate(file_id, spec, request.rows)
 
 @router.get("/data/{file_id}/sort")
 async def sort_data(
@@ -187,6 +322,8 @@ async def sort_data(
     Return the DataFrame sorted by a given column.
     If persist=true the sorted frame is saved back into memory.
     """
+    if is_chunked(file_id):
+        return await _sort_chunked(file_id, column, order, rows, persist)
     df = get_df(file_id)
     if df is None:
         raise HTTPException(status_code=404, detail="File not loaded in memory.")
@@ -194,17 +331,88 @@ async def sort_data(
     if column not in df.columns:
         raise HTTPException(status_code=400, detail=f"Column '{column}' not found.")
 
-    # Perform the sort (ascending unless order='desc')
+    # Perform the sort (ascending unless order='desc'); a preview only needs the top rows
     ascending = order.lower() == "asc"
-    sorted_df = df.sort_values(by=column, ascending=ascending, inplace=False)
+    with stage("sort"):
+        positions = sort_positions(file_id, df, column, ascending, limit=None if persist else rows)
 
-    # Persist if requested
+    # Persist if requested; stored as a row permutation, not a second copy
     if persist:
-        put_df(file_id, sorted_df)
+        action = {"operation": "sort", "column": column, "order": order.lower()}
+        sorted_df, _ = apply_op(file_id, {"kind": "action", "action": action})
+        await durable(file_id)
         update_status(file_id, "modified (sort)")
+        head = sorted_df.head(rows)
+    else:
+        head = df.take(positions[:rows])
 
-    return {
+    return FastJSONResponse({
         "file_id": file_id,
         "sort": {"column": column, "order": order, "persist": persist},
-        "rows": sorted_df.head(rows).to_dict(orient="records")
-    }
\ No newline at end of file
+        "rows": frame_records(head)
+    })
+
+async def _sort_chunked(file_id: str, column: str, order: str, rows: int, persist: bool):
+    # A preview keeps a running top-N over the chunks; persisting is an external merge sort
+    ascending = order.lower() == "asc"
+    try:
+        with stage("sort"):
+            if persist:
+                await asyncio.to_thread(sort_persist, file_id, column, ascending)
+                head = await asyncio.to_thread(chunk_head, file_id, rows)
+            else:
+                head = await asyncio.to_thread(sort_head, file_id, column, ascending, rows)
+    except ExcelOperationError as e:
+        raise HTTPException(status_code=400, detail=e.message)
+    if persist:
+        update_status(file_id, "modified (sort)")
+    return FastJSONResponse({
+        "file_id": file_id,
+        "sort": {"column": column, "order": order, "persist": persist},
+        "rows": frame_records(head)
+    })
+
+@router.post("/data/{file_id}/undo")
+async def undo_change(file_id: str):
+    _in_memory_only(file_id)
+    try:
+        df, version = apply_op(file_id, {"kind": "undo"})
+    except FileNotFound:
+        raise HTTPException(status_code=404, detail="File not loaded in memory.")
+    except ExcelOperationError as e:
+        raise HTTPException(status_code=409, detail=e.message)
+    await durable(file_id)
+    update_status(file_id, "modified (undo)")
+    return FastJSONResponse({"file_id": file_id, "version": version, "preview": frame_records(df.head(10))})
+
+@router.post("/data/{file_id}/redo")
+async def redo_change(file_id: str):
+    _in_memory_only(file_id)
+    try:
+        df, version = apply_op(file_id, {"kind": "redo"})
+    except FileNotFound:
+        raise HTTPException(status_code=404, detail="File not loaded in memory.")
+    except ExcelOperationError as e:
+        raise HTTPException(status_code=409, detail=e.message)
+    await durable(file_id)
+    update_status(file_id, "modified (redo)")
+    return FastJSONResponse({"file_id": file_id, "version": version, "preview": frame_records(df.head(10))})
+
+@router.get("/data/{file_id}/versions")
+async def list_versions(file_id: str):
+    _in_memory_only(file_id)
+    if get_df(file_id) is None:
+        raise HTTPException(status_code=404, detail="File not loaded in memory.")
+    return {"file_id": file_id, **frame_versions.describe(file_id)}
+
+
+@router.get("/data/{file_id}/memory")
+async def get_memory(file_id: str):
+    """Bytes and dtype per column of the cached frame, and the totals before/after ingest's dtype pass."""
+    chunked = chunk_description(file_id)
+    if chunked is not None:
+        return {"file_id": file_id, **chunked}
+    df = get_df(file_id)
+    if df is None:
+        raise HTTPException(status_code=404, detail="File not loaded in memory.")
+    return {"file_id": file_id, **memory_report(file_id, df)}
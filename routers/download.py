@@ -1,6 +1,7 @@
 from fastapi import APIRouter, HTTPException
 from fastapi.responses import FileResponse
-import os
+from services.exporter import saved_xlsx
+from services.chunk_store import describe as chunk_description
 
 router = APIRouter()
 
@@ -8,9 +9,15 @@ OUTPUT_DIR = "outputs"
 
 @router.get("/download/{file_id}")
 async def download_file(file_id: str):
-    file_path = os.path.join("uploads", f"{file_id}.xlsx")
+    # Out-of-core files aren't written back to .xlsx; only the upload itself can be downloaded
+    chunked = chunk_description(file_id)
+    if chunked is not None and chunked["generation"] > 1:
+        raise HTTPException(status_code=409, detail="Edited files in out-of-core mode can't be downloaded as .xlsx.")
 
-    if not os.path.exists(file_path):
+    # Saved edits live in the columnar snapshot until someone asks for the .xlsx
+    file_path = await saved_xlsx(file_id)
+
+    if file_path is None:
         raise HTTPException(status_code=404, detail="Modified file not found.")
 
     return FileResponse(
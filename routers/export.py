@@ -1,24 +1,37 @@
-import os, pandas as pd
-from fastapi import APIRouter, HTTPException
+import asyncio
+from fastapi import APIRouter, HTTPException, Query
 from fastapi.responses import FileResponse
+from exceptions import ExcelOperationError
 from services.memory_store import get as get_df
 from services.file_status import update_status
+from services.operations import checkpoint
+from services.exporter import export, FORMATS
+from services.chunk_store import is_chunked
 
-UPLOAD_DIR = "uploads"
 router = APIRouter()
 
 @router.post("/export/{file_id}")
-async def export_file(file_id: str):
-    df = get_df(file_id)
-    if df is None:
+async def export_file(
+    file_id: str,
+    format: str = Query("xlsx", pattern="^(xlsx|csv|parquet)$", description="xlsx, csv or parquet")
+):
+    if is_chunked(file_id):
+        raise HTTPException(status_code=409, detail="Not available for files in out-of-core mode.")
+    if get_df(file_id) is None:
         raise HTTPException(status_code=404, detail="File not in memory.")
 
-    path = os.path.join(UPLOAD_DIR, f"{file_id}.xlsx")
-    df.to_excel(path, index=False)
+    # Exporting saves too; both are no-ops when nothing changed since the last time
+    try:
+        await asyncio.to_thread(checkpoint, file_id)
+        path = await export(file_id, format)
+    except ExcelOperationError as e:
+        raise HTTPException(status_code=400, detail=e.message)
+    if path is None:
+        raise HTTPException(status_code=404, detail="File not in memory.")
     update_status(file_id, "exported")
 
     return FileResponse(
         path=path,
-        filename=f"{file_id}.xlsx",
-        media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-    )
\ No newline at end of file
+        filename=f"{file_id}.{format}",
+        media_type=FORMATS[format],
+    )
@@ -0,0 +1,78 @@
+import asyncio
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect, WebSocketException, status
+
+from services import change_feed, frame_versions
+from services.change_feed import MAX_VIEWPORT_ROWS, Viewport
+from services.chunk_store import is_chunked, load_manifest
+
+router = APIRouter()
+
+
+def _viewport(start: int, end: int, columns) -> Viewport:
+    if isinstance(columns, str):
+        columns = [c for c in columns.split(",") if c]
+    if start < 0 or end <= start:
+        raise ValueError("'end' must be greater than 'start', and 'start' at least 0.")
+    if end - start > MAX_VIEWPORT_ROWS:
+        raise ValueError(f"A viewport holds at most {MAX_VIEWPORT_ROWS} rows.")
+    return Viewport(start, end, tuple(columns) if columns else None)
+
+
+def _subscribe(file_id: str, viewport: Viewport) -> change_feed.Subscriber | None:
+    if is_chunked(file_id):
+        manifest = load_manifest(file_id)
+        return change_feed.subscribe(file_id, viewport, change_feed.Change(manifest.generation))
+    return frame_versions.subscribe(file_id, viewport)
+
+
+async def _send_changes(websocket: WebSocket, subscriber: change_feed.Subscriber):
+    chunked = is_chunked(subscriber.file_id)
+    while True:
+        changes, resync, viewport = await subscriber.wait()
+        args = (subscriber.file_id, viewport, changes, resync)
+        # Out-of-core snapshots read chunks from disk: off the event loop
+        data = await asyncio.to_thread(change_feed.render, *args) if chunked else change_feed.render(*args)
+        if data is not None:
+            await websocket.send_text(data.decode())
+
+
+async def _receive_viewports(websocket: WebSocket, subscriber: change_feed.Subscriber):
+    # {"start": 0, "end": 100, "columns": ["Region", "Sales"]} moves the viewport
+    while True:
+        message = await websocket.receive_json()
+        try:
+            viewport = _viewport(int(message.get("start", 0)), int(message.get("end", 100)), message.get("columns"))
+        except (AttributeError, TypeError, ValueError) as e:
+            await websocket.send_json({"type": "error", "detail": str(e)})
+            continue
+        subscriber.move(viewport)
+
+
+@router.websocket("/ws/data/{file_id}")
+async def data_feed(websocket: WebSocket, file_id: str, start: int = 0, end: int = 100, columns: str | None = None):
+    """
+    Live updates of a file's rows in [start, end) (and `columns`, comma
+    separated): a snapshot first, then a compact diff after every edit.
+    Consumers that fall behind get one merged update, not a backlog.
+    """
+    try:
+        viewport = _viewport(start, end, columns)
+    except ValueError as e:
+        raise WebSocketException(code=status.WS_1008_POLICY_VIOLATION, reason=str(e))
+    subscriber = _subscribe(file_id, viewport)
+    if subscriber is None:
+        raise WebSocketException(code=status.WS_1008_POLICY_VIOLATION, reason="File not loaded in memory.")
+
+    tasks = []
+    try:
+        await websocket.accept()
+        tasks = [asyncio.create_task(_send_changes(websocket, subscriber)),
+                 asyncio.create_task(_receive_viewports(websocket, subscriber))]
+        done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            if not isinstance(task.exception(), WebSocketDisconnect):
+                task.result()
+    finally:
+        change_feed.unsubscribe(subscriber)
+        for task in tasks:
+            task.cancel()
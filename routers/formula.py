@@ -1,6 +1,13 @@
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
-from services.formula_generator import generate_excel_formula
+from services.formula_generator import resolve_action
+from services.memory_store import get as get_df
+from services.chunk_store import is_chunked
+from services.file_status import update_status
+from services.formula_engine import describe
+from services.operations import apply_op, durable
+from services.serializer import FastJSONResponse, frame_records
+from exceptions import ExcelOperationError, InvalidActionSchema, FileNotFound
 
 router = APIRouter()
 
@@ -8,10 +15,44 @@ class FormulaRequest(BaseModel):
     file_id: str
     prompt: str
 
+class ComputedColumn(BaseModel):
+    column: str
+    formula: str      # e.g. "=IF([@Sales]>0, [@Profit]/[@Sales], 0)", see services/formula_engine
+
 @router.post("/generate-formula")
 async def generate_formula(request: FormulaRequest):
+    df = get_df(request.file_id)
+    if df is None:
+        raise HTTPException(status_code=404, detail="File not loaded in memory.")
     try:
-        formula = generate_excel_formula(request.file_id, request.prompt)
-        return { "formula": formula }
+        formula, source = await resolve_action(request.prompt, df)
+        return { "formula": formula, "source": source }
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/data/{file_id}/formulas")
+async def list_formulas(file_id: str):
+    """The file's computed columns in evaluation order, with what each reads and what reads it."""
+    df = get_df(file_id)
+    if df is None:
+        raise HTTPException(status_code=404, detail="File not loaded in memory.")
+    return {"file_id": file_id, **describe(file_id, df)}
+
+@router.post("/data/{file_id}/formulas")
+async def add_formula(file_id: str, request: ComputedColumn):
+    """Add a computed column, or redefine one; later edits to its inputs recompute it."""
+    if is_chunked(file_id):
+        raise HTTPException(status_code=409, detail="Not available for files in out-of-core mode.")
+    action = {"operation": "add_column", "column": request.column, "formula": request.formula}
+    try:
+        df, version = apply_op(file_id, {"kind": "action", "action": action})
+    except FileNotFound:
+        raise HTTPException(status_code=404, detail="File not loaded in memory.")
+    except InvalidActionSchema as e:
+        raise HTTPException(status_code=422, detail=f"Invalid request: {e.message}")
+    except ExcelOperationError as e:
+        raise HTTPException(status_code=400, detail=e.message)
+    await durable(file_id)
+    update_status(file_id, "modified (computed column)")
+    return FastJSONResponse({"file_id": file_id, "version": version, "column": request.column,
+                             "preview": frame_records(df[[request.column]].head(10))})
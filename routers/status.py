@@ -1,11 +1,73 @@
 from fastapi import APIRouter, HTTPException
-from services.file_status import get_status
+from fastapi.responses import PlainTextResponse
+from services.file_status import get_status, get_history
+from services.memory_store import get_stats as get_cache_stats
+from services import llm_client, op_journal, exporter, aggregator, frame_index, metrics, change_feed
+from services.formula_generator import source_counts
 
 router = APIRouter()
 
+# Counters every service already keeps, exported as gauges at /metrics
+metrics.register_collector("memory_store", get_cache_stats)
+metrics.register_collector("llm_cache", llm_client.get_stats)
+metrics.register_collector("llm_source", lambda: dict(source_counts))
+metrics.register_collector("journal", op_journal.get_stats)
+metrics.register_collector("exports", exporter.get_stats)
+metrics.register_collector("aggregates", aggregator.get_stats)
+metrics.register_collector("frame_index", frame_index.get_stats)
+metrics.register_collector("change_feed", change_feed.get_stats)
+
 @router.get("/status/{file_id}")
 async def get_file_status(file_id: str):
     status_info = get_status(file_id)
     if status_info["status"] == "not_found":
         raise HTTPException(status_code=404, detail="File status not found.")
-    return status_info
\ No newline at end of file
+    return status_info
+
+@router.get("/status/{file_id}/history")
+async def get_file_status_history(file_id: str):
+    history = get_history(file_id)
+    if not history:
+        raise HTTPException(status_code=404, detail="File status not found.")
+    return {"file_id": file_id, "history": history}
+
+@router.get("/cache/stats")
+async def get_cache_status():
+    """Hit/miss/eviction counters and current size of the DataFrame cache."""
+    return get_cache_stats()
+
+
+@router.get("/cache/llm")
+async def get_llm_cache_status():
+    """LLM response-cache counters, plus how many actions the local rules answered."""
+    return {**llm_client.get_stats(), "sources": dict(source_counts)}
+
+
+@router.get("/cache/journal")
+async def get_journal_status():
+    """Operation-journal counters: records, bytes, fsyncs, checkpoints and pending records."""
+    return op_journal.get_stats()
+
+
+@router.get("/cache/exports")
+async def get_export_status():
+    """Export-cache counters: hits, writes, coalesced requests and rows/seconds written."""
+    return exporter.get_stats()
+
+
+@router.get("/cache/aggregates")
+async def get_aggregate_status():
+    """Aggregate-cache counters: hits, full group-bys and incremental updates."""
+    return aggregator.get_stats()
+
+
+@router.get("/cache/feed")
+async def get_feed_status():
+    """Change-feed counters: subscribers, changes published, messages sent, snapshots and coalesced changes."""
+    return change_feed.get_stats()
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """Prometheus text format: route and stage latency histograms, bytes in/out, LLM tokens, cache gauges."""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
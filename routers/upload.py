@@ -1,16 +1,18 @@
 import os
 import uuid
-import pandas as pd
 from fastapi import APIRouter, UploadFile, File, HTTPException
 
-from services.memory_store import put            # in-memory DataFrame cache
-from services.file_status import update_status   # status + timestamp helper
+from services.ingest import spool_path, schedule_parse   # background xlsx parsing
+from services.metrics import stage
 
 router = APIRouter()
 UPLOAD_DIR = "uploads"
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 
-@router.post("/upload-excel")
+CHUNK_SIZE = 1024 * 1024
+MAX_UPLOAD_BYTES = int(os.getenv("EXCELSIOR_MAX_UPLOAD_BYTES", 100 * 1024 * 1024))
+
+@router.post("/upload-excel", status_code=202)
 async def upload_excel(file: UploadFile = File(...)):
     # 1. quick extension check
     if not file.filename.endswith(".xlsx"):
@@ -18,26 +20,27 @@ async def upload_excel(file: UploadFile = File(...)):
 
     # 2. generate UUID and disk path
     file_id   = str(uuid.uuid4())
-    disk_path = os.path.join(UPLOAD_DIR, f"{file_id}.xlsx")
-
-    # 3. save raw bytes to disk (backup / later export)
-    with open(disk_path, "wb") as f:
-        f.write(await file.read())
+    disk_path = spool_path(file_id)
 
-    # 4. load into a pandas DataFrame
-    try:
-        df = pd.read_excel(disk_path)
-    except Exception as e:
-        raise HTTPException(status_code=400, detail=f"Could not read Excel: {e}")
+    # 3. spool the body to disk in chunks, enforcing the size cap
+    written = 0
+    with stage("upload_spool"), open(disk_path, "wb") as f:
+        while chunk := await file.read(CHUNK_SIZE):
+            written += len(chunk)
+            if written > MAX_UPLOAD_BYTES:
+                break
+            f.write(chunk)
 
-    # 5. store in-memory for real-time edits
-    put(file_id, df)
+    if written > MAX_UPLOAD_BYTES:
+        os.remove(disk_path)
+        raise HTTPException(status_code=413, detail=f"File exceeds the {MAX_UPLOAD_BYTES}-byte upload limit.")
 
-    # 6. update status
-    update_status(file_id, "uploaded")
+    # 4. parse in a worker process; status goes parsing -> uploaded (or error)
+    schedule_parse(file_id)
 
-    # 7. return file_id for subsequent calls
+    # 5. return file_id right away; poll /status/{file_id} until it is "uploaded"
     return {
         "file_id": file_id,
-        "message": "File uploaded, parsed, and ready for live editing."
-    }
\ No newline at end of file
+        "status": "parsing",
+        "message": "File received; parsing in the background."
+    }
@@ -1,19 +1,16 @@
-import os
-import pandas as pd
-from dotenv import load_dotenv
-import openai
-
-load_dotenv()
-client = openai.OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+from services.memory_store import get as get_df
+from services.llm_client import complete_json
+from services.formula_generator import column_schema
 
 UPLOAD_DIR = "uploads"
+MODEL = "gpt-4o"
 
-def generate_excel_action(file_id: str, prompt: str):
-    file_path = os.path.join(UPLOAD_DIR, f"{file_id}.xlsx")
-    if not os.path.exists(file_path):
+async def generate_excel_action(file_id: str, prompt: str):
+    # Cached frame, or a memory-mapped reload of the snapshot next to the .xlsx
+    df = get_df(file_id)
+    if df is None:
         raise FileNotFoundError(f"File with ID {file_id} not found.")
-    
-    df = pd.read_excel(file_path)
+
     headers = df.columns.tolist()
     sample_rows = df.head(3).to_dict(orient="records")
 
@@ -22,8 +19,8 @@ def generate_excel_action(file_id: str, prompt: str):
         "return a clean JSON object that describes what Excel operation to perform.\n"
         "Supported actions: filter, sort, highlight, rename_column, add_column.\n"
         "Example outputs:\n"
-        "{'operation': 'filter', 'column': 'Region', 'condition': '==', 'value': 'West'}\n"
-        "{'operation': 'sort', 'column': 'Profit', 'order': 'descending'}\n"
+        '{"operation": "filter", "column": "Region", "condition": {"operator": "==", "value": "West"}}\n'
+        '{"operation": "sort", "column": "Profit", "order": "desc"}\n'
         "Respond ONLY with JSON."
     )
 
@@ -32,17 +29,9 @@ def generate_excel_action(file_id: str, prompt: str):
     Sample rows: {sample_rows}
     """
 
-    response = client.chat.completions.create(
-        model="gpt-4o",
-        messages=[
-            { "role": "system", "content": system_prompt },
-            { "role": "user", "content": user_prompt }
-        ]
-    )
-
-    action_json = response.choices[0].message.content.strip()
-
+    # Parsed as JSON rather than eval()'d; the sample rows are part of the prompt,
+    # so they're part of the cache key too
     try:
-        return eval(action_json)
-    except Exception as e:
-        raise ValueError(f"Failed to parse LLM response: {action_json}")
\ No newline at end of file
+        return await complete_json(system_prompt, user_prompt, MODEL, schema=column_schema(df))
+    except ValueError:
+        raise ValueError("Failed to parse LLM response")
@@ -0,0 +1,176 @@
+from dataclasses import dataclass, field
+import numpy as np
+import pandas as pd
+
+from services.frame_index import sort_positions
+from services.frame_versions import ColumnDelta, CompositeDelta, RowDelta, sort_order
+from services.query_engine import And, Not, Or, filter_mask, parse, to_expression
+
+# Multi-step actions: {"operation": "pipeline", "steps": [action, ...]} runs
+# several sort/filter/update actions as one edit. The steps are validated
+# once (services/action_validator) and compiled into a plan before anything
+# runs:
+#
+#   - a sort moves past the filters (and updates of other columns) after it,
+#     so it sorts the smaller frame; filters keep row order and the sort is
+#     stable, so the result is the same
+#   - a sort is dropped when a later sort on the same column overrides it
+#   - an update is dropped when a later one sets the same column before
+#     anything reads it
+#   - adjacent filters fuse into one "and" expression: one mask, one take
+#
+# The pipeline is committed as a single version whose CompositeDelta undoes
+# every step at once. A single action is a one-step plan.
+
+
+@dataclass
+class Step:
+    operation: str                 # sort, filter, update
+    action: dict                   # as validated; what describe() reports
+    sources: list = field(default_factory=list)   # positions in the submitted pipeline
+    expr: dict | None = None       # filter: the expression, conditions already converted
+    columns: frozenset = frozenset()   # columns the step reads (filter, sort) or writes (update)
+
+    @property
+    def column(self) -> str | None:
+        return self.action.get("column")
+
+
+@dataclass
+class Plan:
+    steps: list
+    dropped: list                  # [{"step": position, "operation", "reason"}]
+    submitted: int
+
+    def describe(self) -> dict:
+        steps = []
+        for step in self.steps:
+            item = {"operation": step.operation, "steps": step.sources}
+            if step.operation == "filter":
+                item["where"] = step.expr
+            elif step.operation == "sort":
+                item.update(column=step.column, order=step.action.get("order", "asc").lower())
+            else:
+                item.update(column=step.column, value=step.action["value"])
+            steps.append(item)
+        return {"submitted": self.submitted, "steps": steps, "dropped": self.dropped}
+
+
+def _expression(action: dict) -> dict:
+    if "where" in action:
+        return action["where"]
+    cond = action["condition"]
+    return to_expression(action["column"], cond["operator"], cond["value"])
+
+
+def _read_columns(node) -> set[str]:
+    if isinstance(node, (And, Or)):
+        return set().union(*(_read_columns(child) for child in node.children))
+    if isinstance(node, Not):
+        return _read_columns(node.child)
+    return {node.column}
+
+
+def _step(position: int, action: dict, columns: list[str]) -> Step:
+    operation = action["operation"]
+    if operation == "filter":
+        expr = _expression(action)
+        return Step(operation, action, [position], expr, frozenset(_read_columns(parse(expr, columns))))
+    return Step(operation, action, [position], columns=frozenset([action["column"]]))
+
+
+def _commutes(sort: Step, later: Step) -> bool:
+    # A filter never depends on row order; an update does only through the sort key
+    return later.operation == "filter" or (later.operation == "update" and sort.column not in later.columns)
+
+
+def compile_plan(actions: list[dict], columns: list[str]) -> Plan:
+    """The execution plan for already validated `actions`, in order, against `columns`."""
+    steps = [_step(i, action, columns) for i, action in enumerate(actions)]
+    dropped = []
+
+    # Sorts later: past filters and unrelated updates, onto a later sort of the same column
+    i = len(steps) - 1
+    while i >= 0:
+        if steps[i].operation == "sort":
+            j = i
+            while j + 1 < len(steps) and _commutes(steps[j], steps[j + 1]):
+                steps[j], steps[j + 1] = steps[j + 1], steps[j]
+                j += 1
+            if j + 1 < len(steps) and steps[j + 1].operation == "sort" and steps[j + 1].column == steps[j].column:
+                dropped.append({"step": steps[j].sources[0], "operation": "sort",
+                                "reason": f"a later sort by '{steps[j].column}' overrides it"})
+                del steps[j]
+        i -= 1
+
+    # Updates overwritten before anything reads the column
+    kept = []
+    for i, step in enumerate(steps):
+        if step.operation == "update":
+            for later in steps[i + 1:]:
+                if later.operation == "update" and later.column == step.column:
+                    dropped.append({"step": step.sources[0], "operation": "update",
+                                    "reason": f"a later update sets '{step.column}' again"})
+                    break
+                if later.operation != "update" and step.column in later.columns:
+                    kept.append(step)
+                    break
+            else:
+                kept.append(step)
+            continue
+        kept.append(step)
+
+    # Adjacent filters into one expression
+    fused = []
+    for step in kept:
+        previous = fused[-1] if fused else None
+        if step.operation == "filter" and previous is not None and previous.operation == "filter":
+            parts = previous.expr["and"] if len(previous.sources) > 1 else [previous.expr]
+            fused[-1] = Step("filter", {"operation": "filter"}, previous.sources + step.sources,
+                             {"and": parts + [step.expr]}, previous.columns | step.columns)
+        else:
+            fused.append(step)
+    dropped.sort(key=lambda d: d["step"])
+    return Plan(fused, dropped, len(actions))
+
+
+def _filter(file_id: str, df: pd.DataFrame, original: pd.DataFrame, step: Step) -> np.ndarray:
+    # The cached per-column indexes describe the stored frame only
+    return np.flatnonzero(filter_mask(step.expr, df, file_id if df is original else None))
+
+
+def _update(df: pd.DataFrame, step: Step) -> pd.DataFrame:
+    updated = df.copy(deep=False)
+    updated[step.column] = step.action["value"]
+    return updated
+
+
+def run(file_id: str, df: pd.DataFrame, plan: Plan) -> tuple[pd.DataFrame, object]:
+    """Execute `plan` on df; returns the new frame and the delta that undoes all of it."""
+    current, deltas = df, []
+    for step in plan.steps:
+        if step.operation == "filter":
+            current, delta = RowDelta.take(current, _filter(file_id, current, df, step))
+        elif step.operation == "sort":
+            ascending = step.action.get("order", "asc").lower() == "asc"
+            positions = sort_positions(file_id, current, step.column, ascending) if current is df \
+                else sort_order(current, step.column, ascending)
+            current, delta = RowDelta.take(current, positions)
+        else:
+            updated = _update(current, step)
+            current, delta = updated, ColumnDelta.capture(current, updated, step.column)
+        deltas.append(delta)
+    return current, deltas[0] if len(deltas) == 1 else CompositeDelta(deltas)
+
+
+def estimate(file_id: str, df: pd.DataFrame, plan: Plan) -> list[int]:
+    """Rows left after each plan step, without changing anything. Sorts don't change counts, so they're skipped."""
+    current, rows = df, []
+    for step in plan.steps:
+        if step.operation == "filter":
+            current = current.take(_filter(file_id, current, df, step))
+        elif step.operation == "update" and any(step.column in later.columns for later in plan.steps
+                                                if later.operation == "filter"):
+            current = _update(current, step)   # a later filter reads it
+        rows.append(len(current))
+    return rows
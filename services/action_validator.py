@@ -1,3 +1,11 @@
+import os
+from exceptions import InvalidActionSchema
+from services.query_engine import parse as parse_filter, to_expression
+from services.aggregator import parse_spec as parse_aggregate
+from services.formula_engine import compile_formula
+
+MAX_PIPELINE_STEPS = int(os.getenv("EXCELSIOR_PIPELINE_MAX_STEPS", 20))
+
 def validate_action_schema(action: dict, df_columns: list[str]) -> tuple[bool, str]:
     """
     Validates that the action has the expected keys and values.
@@ -7,17 +15,61 @@ def validate_action_schema(action: dict, df_columns: list[str]) -> tuple[bool, s
         "sort": ["column"],
         "filter": ["column", "condition"],
         "update": ["column", "value"],
+        "aggregate": [],
+        "pipeline": ["steps"],
+        "add_column": ["column", "formula"],
     }
 
     operation = action.get("operation")
     if not operation or operation not in required_keys:
         return False, f"Invalid or missing 'operation'. Got: {operation}"
 
+    # Compound filters: {"operation": "filter", "where": {...}} (see services/query_engine)
+    if operation == "filter" and "where" in action:
+        try:
+            parse_filter(action["where"], df_columns)
+        except InvalidActionSchema as e:
+            return False, e.message
+        return True, ""
+
+    # Group-by summaries: {"operation": "aggregate", "group_by", "pivot", "aggregations"}
+    if operation == "aggregate":
+        try:
+            parse_aggregate(action, df_columns)
+        except InvalidActionSchema as e:
+            return False, e.message
+        return True, ""
+
+    # Several actions in one edit: {"operation": "pipeline", "steps": [action, ...]} (see services/action_plan)
+    if operation == "pipeline":
+        steps = action.get("steps")
+        if not isinstance(steps, list) or not steps:
+            return False, "'steps' must be a non-empty list of actions"
+        if len(steps) > MAX_PIPELINE_STEPS:
+            return False, f"A pipeline has at most {MAX_PIPELINE_STEPS} steps"
+        for i, step in enumerate(steps):
+            if not isinstance(step, dict) or step.get("operation") not in {"sort", "filter", "update"}:
+                return False, f"Step {i + 1}: pipeline steps must be sort, filter or update actions"
+            is_valid, err = validate_action_schema(step, df_columns)
+            if not is_valid:
+                return False, f"Step {i + 1}: {err}"
+        return True, ""
+
     # Required keys for this operation
     for key in required_keys[operation]:
         if key not in action:
             return False, f"Missing key '{key}' for operation '{operation}'"
 
+    # Computed columns: {"operation": "add_column", "column", "formula"} (see services/formula_engine)
+    if operation == "add_column":
+        if not isinstance(action["column"], str) or not action["column"].strip():
+            return False, "'column' must be a non-empty name"
+        try:
+            compile_formula(action["formula"], df_columns, action["column"])
+        except InvalidActionSchema as e:
+            return False, e.message
+        return True, ""
+
     # Column validity
     column = action.get("column")
     if column and column not in df_columns:
@@ -30,7 +82,9 @@ def validate_action_schema(action: dict, df_columns: list[str]) -> tuple[bool, s
             return False, "'condition' must be a dictionary"
         if "operator" not in cond or "value" not in cond:
             return False, "Filter condition must have 'operator' and 'value'"
-        if cond["operator"] not in [">", "<", "==", "!="]:
-            return False, f"Unsupported operator: {cond['operator']}"
+        try:
+            parse_filter(to_expression(column, cond["operator"], cond["value"]), df_columns)
+        except InvalidActionSchema as e:
+            return False, e.message
 
-    return True, ""
\ No newline at end of file
+    return True, ""
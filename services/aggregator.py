@@ -0,0 +1,362 @@
+import os
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+import numpy as np
+import pandas as pd
+
+from exceptions import InvalidActionSchema
+from services import frame_versions
+from services.frame_versions import CellDelta, current_version
+from services.frame_index import key_codes
+from services.serializer import dumps
+
+# Group-by / pivot summaries for /data/{file_id}/aggregate and the "aggregate"
+# action. A spec is JSON:
+#
+#   {"group_by": ["Region"], "pivot": "Status",
+#    "aggregations": [{"column": "Sales", "func": "sum"}, {"func": "count"}]}
+#
+# Key columns are factorized (their categorical codes) into one group id per
+# row; sums, counts, minimums and maximums are NumPy reductions over the rows
+# in group order. Results are cached per frame version. When the only edits
+# since the cached version are a few cell patches outside the key columns, the
+# cached sums/counts/min/max are adjusted for the changed cells instead of
+# grouping the frame again.
+
+AGG_FUNCS = {"sum", "mean", "count", "min", "max", "nunique"}
+MAX_ENTRIES = int(os.getenv("EXCELSIOR_AGG_CACHE_ENTRIES", 64))
+# Larger patches than this are cheaper to regroup than to replay cell by cell
+INCREMENTAL_MAX_CELLS = int(os.getenv("EXCELSIOR_AGG_INCREMENTAL_CELLS", 10_000))
+
+
+@dataclass(frozen=True)
+class AggregateSpec:
+    group_by: tuple
+    pivot: str | None
+    aggregations: tuple   # ((column or None, func), ...)
+
+    @property
+    def keys(self) -> tuple:
+        return self.group_by + ((self.pivot,) if self.pivot is not None else ())
+
+    @property
+    def cache_key(self) -> bytes:
+        return dumps([self.group_by, self.pivot, self.aggregations])
+
+
+def parse_spec(spec: dict, columns: list[str], dtypes: dict | None = None) -> AggregateSpec:
+    """
+    Check `spec` against the frame's columns and, given their `dtypes`, that
+    sum and mean only read numeric ones. Raises InvalidActionSchema.
+    """
+    if not isinstance(spec, dict):
+        raise InvalidActionSchema("Aggregate spec must be an object")
+    names = set(columns)
+
+    group_by = spec.get("group_by") or []
+    if isinstance(group_by, str):
+        group_by = [group_by]
+    if not isinstance(group_by, list) or not all(isinstance(c, str) for c in group_by):
+        raise InvalidActionSchema("'group_by' must be a column name or a list of them")
+    pivot = spec.get("pivot")
+    for col in group_by + ([pivot] if pivot is not None else []):
+        if col not in names:
+            raise InvalidActionSchema(f"Column '{col}' not found in Excel sheet.")
+    if len(set(group_by)) != len(group_by) or pivot in group_by:
+        raise InvalidActionSchema("Each key column can only be used once")
+
+    raw = spec.get("aggregations") or [{"func": "count"}]
+    if isinstance(raw, dict):
+        # {"Sales": "sum", "Units": ["min", "max"]}
+        raw = [{"column": col, "func": f} for col, funcs in raw.items()
+               for f in (funcs if isinstance(funcs, list) else [funcs])]
+    if not isinstance(raw, list):
+        raise InvalidActionSchema("'aggregations' must be a list of {column, func}")
+    aggregations = []
+    for agg in raw:
+        if not isinstance(agg, dict):
+            raise InvalidActionSchema("Each aggregation must be an object with 'func' and 'column'")
+        func, column = agg.get("func"), agg.get("column")
+        if func not in AGG_FUNCS:
+            raise InvalidActionSchema(f"Unsupported aggregation '{func}'. Use one of {sorted(AGG_FUNCS)}")
+        if column in (None, "*"):
+            if func != "count":
+                raise InvalidActionSchema(f"'{func}' needs a column")
+            column = None
+        elif column not in names:
+            raise InvalidActionSchema(f"Column '{column}' not found in Excel sheet.")
+        elif dtypes is not None and func in {"sum", "mean"} and not _is_numeric(dtypes[column]):
+            verb = "sum" if func == "sum" else "average"
+            raise InvalidActionSchema(f"Can't {verb} non-numeric column '{column}'")
+        if (column, func) not in aggregations:
+            aggregations.append((column, func))
+    return AggregateSpec(tuple(group_by), pivot, tuple(aggregations))
+
+
+def _is_numeric(dtype) -> bool:
+    return pd.api.types.is_numeric_dtype(dtype)
+
+
+def _floats(values) -> np.ndarray:
+    return pd.Series(values).to_numpy(dtype=np.float64, na_value=np.nan)
+
+
+@dataclass
+class _Groups:
+    gid: np.ndarray       # group of each row; -1 where a key is missing
+    order: np.ndarray     # rows of group 0, then group 1, ...
+    starts: np.ndarray    # order[starts[g]:starts[g + 1]] are the rows of group g
+    keys: pd.DataFrame    # one row per group, in key order
+
+    @property
+    def n(self) -> int:
+        return len(self.starts) - 1
+
+    def members(self, g: int) -> np.ndarray:
+        return self.order[self.starts[g]:self.starts[g + 1]]
+
+
+def _group(file_id: str, df: pd.DataFrame, keys: tuple) -> _Groups:
+    n_rows = len(df)
+    combined = np.zeros(n_rows, dtype=np.int64)
+    valid = np.ones(n_rows, dtype=bool)
+    size = 1
+    for key in keys:
+        codes, n = key_codes(file_id, df, key)
+        valid &= codes >= 0
+        if size * max(n, 1) >= 2**62:
+            # Renumber what we have so far before the product overflows
+            _, combined = np.unique(combined, return_inverse=True)
+            size = int(combined.max()) + 1 if n_rows else 1
+        combined = combined * max(n, 1) + np.maximum(codes, 0)
+        size *= max(n, 1)
+
+    if valid.all():
+        rows, keyed = np.arange(n_rows), combined
+    else:
+        rows = np.flatnonzero(valid)
+        keyed = combined[rows]
+    if size <= max(4 * n_rows, 1 << 16):
+        # Number the key combinations that occur with a bincount; O(rows)
+        present = np.bincount(keyed, minlength=size) > 0
+        inverse = (np.cumsum(present) - 1)[keyed]
+    else:
+        # np.unique sorts, so groups still come out in key order
+        _, inverse = np.unique(keyed, return_inverse=True)
+    if len(rows) == n_rows:
+        gid = inverse
+    else:
+        gid = np.full(n_rows, -1, dtype=np.intp)
+        gid[rows] = inverse
+    n_groups = int(inverse.max()) + 1 if len(rows) else 0
+    # Radix sort when the group ids fit in 16 bits
+    sortable = inverse.astype(np.uint16) if n_groups <= 1 << 16 else inverse
+    order = rows[np.argsort(sortable, kind="stable")]
+    starts = np.concatenate([[0], np.cumsum(np.bincount(inverse, minlength=n_groups))]).astype(np.intp)
+    keys_table = df[list(keys)].take(order[starts[:-1]]).reset_index(drop=True)
+    for key in keys:
+        if isinstance(keys_table[key].dtype, pd.CategoricalDtype):
+            # Plain values: a categorical key would pivot into unobserved categories too
+            keys_table[key] = keys_table[key].astype(keys_table[key].dtype.categories.dtype)
+    return _Groups(gid, order, starts, keys_table)
+
+
+def _reduce(df: pd.DataFrame, groups: _Groups, column: str, func: str) -> np.ndarray:
+    """One statistic per group for `column`."""
+    col = df[column]
+    if groups.n == 0:
+        return np.empty(0)
+    bounds = groups.starts[:-1]
+    if func == "count":
+        return np.add.reduceat(col.notna().to_numpy()[groups.order].astype(np.int64), bounds)
+    if func in {"sum", "min", "max"} and _is_numeric(col.dtype):
+        values = _floats(col)[groups.order]
+        if func == "sum":
+            return np.add.reduceat(np.nan_to_num(values, nan=0.0), bounds)
+        # fmin/fmax skip NaN; a group with no values at all stays NaN
+        return (np.fmin if func == "min" else np.fmax).reduceat(values, bounds)
+    # Text min/max and nunique: pandas' groupby kernels over the codes
+    labels = np.repeat(np.arange(groups.n), np.diff(groups.starts))
+    if isinstance(col.dtype, pd.CategoricalDtype):
+        col = col.astype(col.dtype.categories.dtype)   # unordered categoricals have no min/max
+    grouped = pd.Series(col.array.take(groups.order)).groupby(labels, sort=True)
+    return getattr(grouped, func)().to_numpy()
+
+
+def _statistics(spec: AggregateSpec) -> set:
+    # What is stored per group: mean is kept as sum and count
+    needed = set()
+    for column, func in spec.aggregations:
+        if column is None:
+            continue
+        if func == "mean":
+            needed |= {(column, "sum"), (column, "count")}
+        else:
+            needed.add((column, func))
+    return needed
+
+
+@dataclass
+class _State:
+    version: int
+    groups: _Groups
+    stats: dict                            # {(column, func): array per group}
+    integer: dict = field(default_factory=dict)   # {column: True if its dtype is integer/bool}
+    result: pd.DataFrame | None = None
+
+
+def _build(file_id: str, df: pd.DataFrame, spec: AggregateSpec, version: int) -> _State:
+    groups = _group(file_id, df, spec.keys)
+    stats = {stat: _reduce(df, groups, *stat) for stat in _statistics(spec)}
+    return _State(version, groups, stats, _integer_columns(df, spec))
+
+
+def _integer_columns(df: pd.DataFrame, spec: AggregateSpec) -> dict:
+    return {column: pd.api.types.is_integer_dtype(df[column].dtype) or pd.api.types.is_bool_dtype(df[column].dtype)
+            for column, _ in spec.aggregations if column is not None}
+
+
+def _incremental(state: _State, spec: AggregateSpec, df: pd.DataFrame, deltas: list, version: int) -> _State | None:
+    """
+    The state moved forward over `deltas`, or None when they aren't small cell
+    patches that the maintained statistics can absorb.
+    """
+    if not deltas or not all(isinstance(d, CellDelta) for d in deltas):
+        return None
+    touched = {col for d in deltas for col in d.changes}
+    if touched & set(spec.keys):
+        return None   # rows may have changed group
+    if sum(len(rows) for d in deltas for rows, *_ in d.changes.values()) > INCREMENTAL_MAX_CELLS:
+        return None
+    for column, func in state.stats:
+        if column in touched and (func == "nunique" or func != "count" and not _is_numeric(df[column].dtype)):
+            return None
+
+    stats = {stat: values.copy() if stat[0] in touched else values for stat, values in state.stats.items()}
+    gid = state.groups.gid
+    recheck: dict[tuple, set] = {}   # min/max whose extreme was overwritten: recomputed below
+    try:
+        for delta in deltas:
+            for column, (rows, old_vals, new_vals, _, _) in delta.changes.items():
+                mine = [(c, f) for c, f in stats if c == column]
+                if not mine:
+                    continue
+                # A row patched twice in one batch holds its first old and last new value
+                rows, first = np.unique(rows, return_index=True)
+                old, new = _floats(old_vals)[first], _floats(new_vals)[first]
+                groups = gid[rows]
+                keep = groups >= 0
+                groups, old, new = groups[keep], old[keep], new[keep]
+                for stat in mine:
+                    values = stats[stat]
+                    func = stat[1]
+                    if func == "sum":
+                        np.add.at(values, groups, np.nan_to_num(new, nan=0.0) - np.nan_to_num(old, nan=0.0))
+                    elif func == "count":
+                        np.add.at(values, groups, (~np.isnan(new)).astype(np.int64) - (~np.isnan(old)).astype(np.int64))
+                    else:
+                        better = np.fmin if func == "min" else np.fmax
+                        current = values[groups]
+                        lost = (old == current) & (better(new, old) != new)
+                        recheck.setdefault(stat, set()).update(groups[lost].tolist())
+                        better.at(values, groups, new)
+    except (TypeError, ValueError):
+        return None   # a value that isn't a number after all
+
+    for (column, func), dirty in recheck.items():
+        col = _floats(df[column])
+        better = np.fmin if func == "min" else np.fmax
+        for g in dirty:
+            members = col[state.groups.members(g)]
+            stats[(column, func)][g] = better.reduce(members) if len(members) else np.nan
+    return _State(version, state.groups, stats, _integer_columns(df, spec))
+
+
+def _output_name(column: str | None, func: str) -> str:
+    return func if column is None else f"{column}_{func}"
+
+
+def _result(state: _State, spec: AggregateSpec) -> pd.DataFrame:
+    out = state.groups.keys.copy()
+    sizes = np.diff(state.groups.starts)
+    names = []
+    for column, func in spec.aggregations:
+        if column is None:
+            values = sizes
+        elif func == "mean":
+            counts = state.stats[(column, "count")]
+            with np.errstate(invalid="ignore", divide="ignore"):
+                values = np.where(counts > 0, state.stats[(column, "sum")] / np.maximum(counts, 1), np.nan)
+        else:
+            values = state.stats[(column, func)]
+            if func in {"sum", "min", "max"} and state.integer.get(column) and values.dtype.kind == "f" \
+                    and not np.isnan(values).any():
+                values = values.astype(np.int64)
+        name = _output_name(column, func)
+        out[name] = values
+        names.append(name)
+
+    if spec.pivot is None:
+        return out
+    # One column per (statistic, pivot value), e.g. Sales_sum_Open
+    index = list(spec.group_by)
+    if index:
+        wide = out.set_index(index + [spec.pivot])[names].unstack(spec.pivot)
+    else:
+        wide = out.set_index(spec.pivot)[names].unstack().to_frame().T
+    wide.columns = [f"{name}_{value}" for name, value in wide.columns]
+    return wide.reset_index() if index else wide.reset_index(drop=True)
+
+
+_cache: "OrderedDict[tuple, _State]" = OrderedDict()   # (file_id, spec) -> state, least recently used first
+_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0, "incremental": 0}
+
+
+def aggregate(file_id: str, df: pd.DataFrame, spec: dict) -> pd.DataFrame:
+    """
+    Summary table of df for `spec`: one row per group (key columns first,
+    then `<column>_<func>` per aggregation). Raises InvalidActionSchema.
+    """
+    parsed = parse_spec(spec, df.columns.tolist(), df.dtypes.to_dict())
+    version = current_version(file_id)
+    key = (file_id, parsed.cache_key)
+    with _lock:
+        state = _cache.get(key)
+        if state is not None:
+            _cache.move_to_end(key)
+            if state.version == version and state.result is not None:
+                _stats["hits"] += 1
+                return state.result
+
+    updated = None
+    if state is not None:
+        deltas = frame_versions.deltas_since(file_id, state.version)
+        if deltas is not None:
+            updated = _incremental(state, parsed, df, deltas, version)
+    if updated is not None:
+        _stats["incremental"] += 1
+        state = updated
+    else:
+        _stats["misses"] += 1
+        state = _build(file_id, df, parsed, version)
+    state.result = _result(state, parsed)
+
+    with _lock:
+        _cache[key] = state
+        _cache.move_to_end(key)
+        while len(_cache) > MAX_ENTRIES:
+            _cache.popitem(last=False)
+    return state.result
+
+
+def forget(file_id: str):
+    with _lock:
+        for key in [k for k in _cache if k[0] == file_id]:
+            del _cache[key]
+
+
+def get_stats() -> dict:
+    with _lock:
+        return {**_stats, "entries": len(_cache)}
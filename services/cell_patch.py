@@ -0,0 +1,193 @@
+import numpy as np
+import pandas as pd
+from exceptions import ExcelOperationError
+from services.dtype_optimizer import number_dtype, optimize_column, wide_dtype
+
+# Batch cell writes for PATCH /data/{file_id}. The whole batch is validated
+# before anything is written, then applied one column at a time with a single
+# positional assignment, so a batch either lands completely or not at all.
+
+MAX_REPORTED_ERRORS = 5
+
+
+def group_updates(df: pd.DataFrame, updates: list[dict]) -> dict[str, tuple[np.ndarray, list]]:
+    """
+    Validate `updates` against `df` and group them as
+    {column: (row positions, values)}. Raises ExcelOperationError listing the
+    first few bad entries.
+    """
+    n_rows = len(df)
+    columns = set(df.columns)
+    grouped: dict[str, tuple[list, list]] = {}
+    errors = []
+
+    for i, update in enumerate(updates):
+        row_idx = update.get("row")
+        col_name = update.get("column")
+        if row_idx is None or col_name is None:
+            errors.append(f"update {i}: missing row or column")
+        elif isinstance(row_idx, bool) or not isinstance(row_idx, int) or not (0 <= row_idx < n_rows):
+            errors.append(f"update {i}: invalid row index {row_idx!r}")
+        elif col_name not in columns:
+            errors.append(f"update {i}: invalid column name {col_name!r}")
+        else:
+            rows, values = grouped.setdefault(col_name, ([], []))
+            rows.append(row_idx)
+            values.append(update.get("value"))
+            continue
+        if len(errors) >= MAX_REPORTED_ERRORS:
+            break
+
+    if errors:
+        raise ExcelOperationError("; ".join(errors))
+
+    return {col: (np.asarray(rows, dtype=np.intp), values) for col, (rows, values) in grouped.items()}
+
+
+def _is_text(dtype) -> bool:
+    return pd.api.types.is_string_dtype(dtype) or pd.api.types.is_object_dtype(dtype)
+
+
+def _is_number(value) -> bool:
+    return isinstance(value, (int, float, np.number)) and not isinstance(value, bool)
+
+
+def coerce_values(col: pd.Series, values: list) -> tuple[object, np.ndarray | pd.api.extensions.ExtensionArray]:
+    """
+    Decide once per column what dtype the column needs to hold both its
+    current data and `values`. Returns (target dtype, values as an array).
+    """
+    dtype = col.dtype
+    present = [v for v in values if v is not None]
+
+    if pd.api.types.is_bool_dtype(dtype) and all(isinstance(v, (bool, np.bool_)) for v in values):
+        return dtype, np.asarray(values, dtype=bool)
+
+    if pd.api.types.is_numeric_dtype(dtype) and not pd.api.types.is_bool_dtype(dtype):
+        if all(_is_number(v) for v in present):
+            arr = np.asarray([np.nan if v is None else v for v in values])
+            # Sized by the values, not their int64/float64 literals, so a compact column stays compact
+            target = np.result_type(dtype, number_dtype(arr))
+            if len(present) < len(values):
+                target = np.result_type(target, np.float32)   # None becomes NaN
+            return target, arr.astype(target)
+
+    if isinstance(dtype, pd.CategoricalDtype) and _is_text(dtype.categories.dtype):
+        if all(isinstance(v, str) for v in present):
+            new = sorted(set(present).difference(dtype.categories))
+            if new:
+                # Keep categories sorted so codes still order like the text
+                dtype = pd.CategoricalDtype(dtype.categories.append(pd.Index(new, dtype=dtype.categories.dtype))
+                                            .sort_values())
+            return dtype, pd.Categorical(values, dtype=dtype)
+
+    if pd.api.types.is_datetime64_any_dtype(dtype):
+        try:
+            arr = pd.to_datetime(pd.Series(values, dtype=object))
+            return dtype, arr.astype(dtype).array
+        except (ValueError, TypeError):
+            pass
+
+    if pd.api.types.is_string_dtype(dtype) and not pd.api.types.is_object_dtype(dtype):
+        if all(isinstance(v, str) for v in present):
+            return dtype, pd.array(values, dtype=dtype)
+
+    if pd.api.types.is_object_dtype(dtype):
+        arr = np.empty(len(values), dtype=object)
+        arr[:] = values
+        return dtype, arr
+
+    # Mixed types: widen the column to object rather than fail or truncate
+    arr = np.empty(len(values), dtype=object)
+    arr[:] = values
+    return np.dtype(object), arr
+
+
+def _map_categories(col: pd.Series, operation: str) -> pd.Series:
+    # Change each category once instead of every cell; categories that now
+    # coincide ("West", "WEST") merge
+    mapped = getattr(pd.Series(col.cat.categories).str, operation)()
+    remap, categories = pd.factorize(mapped, sort=True)
+    codes = col.cat.codes.to_numpy()
+    codes = np.where(codes >= 0, remap[np.maximum(codes, 0)], -1)
+    return pd.Series(pd.Categorical.from_codes(codes, categories=categories), index=col.index, name=col.name)
+
+
+def column_values(df: pd.DataFrame, column: str, value=None, operation: str | None = None,
+                  delta: int | float | None = None):
+    """
+    New contents for `column` under PATCH /data/{file_id}/column: a scalar
+    overwrite (`value`), a string case change or a numeric add/sub of `delta`.
+    Raises ExcelOperationError for requests that don't fit the column.
+    """
+    if column not in df.columns:
+        raise ExcelOperationError("Column not found.")
+    col = df[column]
+
+    if operation is None:  # simple overwrite
+        if value is None:
+            raise ExcelOperationError("Provide 'value' or 'operation'.")
+        return value
+
+    if operation in {"upper", "lower", "title"}:
+        if isinstance(col.dtype, pd.CategoricalDtype) and _is_text(col.dtype.categories.dtype):
+            return _map_categories(col, operation)
+        if not pd.api.types.is_string_dtype(col):
+            raise ExcelOperationError("String operation on non-string column.")
+        if operation == "upper":
+            return col.str.upper()
+        if operation == "lower":
+            return col.str.lower()
+        return col.str.title()
+
+    if operation in {"add", "sub"}:
+        if delta is None:
+            raise ExcelOperationError("Missing 'delta' for numeric operation.")
+        if not pd.api.types.is_numeric_dtype(col):
+            raise ExcelOperationError("Numeric operation on non-numeric column.")
+        # On the wide dtype: an int8 column plus 100 must not wrap around
+        col = col.astype(wide_dtype(col.dtype))
+        return optimize_column(col + delta if operation == "add" else col - delta)
+
+    raise ExcelOperationError(f"Unsupported operation '{operation}'.")
+
+
+def apply_cell_updates(df: pd.DataFrame, updates: list[dict]) -> pd.DataFrame:
+    """
+    Return a new frame with `updates` ({"row", "column", "value"}, row being the
+    0-based position) applied. `df` itself is never modified.
+    """
+    return patch_cells(df, updates)[0]
+
+
+def patch_cells(df: pd.DataFrame, updates: list[dict]) -> tuple[pd.DataFrame, dict[str, np.ndarray]]:
+    """apply_cell_updates, also returning the distinct row positions written per column."""
+    grouped = group_updates(df, updates)
+    touched = {}
+
+    # Build every replacement column first; nothing is written if one fails
+    replacements = {}
+    for col_name, (rows, values) in grouped.items():
+        col = df[col_name]
+        target, arr = coerce_values(col, values)
+        # Last write wins for a repeated cell, as with the old per-cell loop
+        unique_rows, last = np.unique(rows[::-1], return_index=True)
+        if len(unique_rows) < len(rows):
+            keep = len(rows) - 1 - last
+            rows, arr = rows[keep], arr[keep]
+        touched[col_name] = rows
+        if isinstance(target, np.dtype):
+            new_values = col.to_numpy(dtype=target, copy=True)
+            arr = np.asarray(arr)
+        else:
+            new_values = col.array.astype(target, copy=True)
+        try:
+            new_values[rows] = arr
+        except (TypeError, ValueError) as e:
+            raise ExcelOperationError(f"Cannot write values into column '{col_name}': {e}")
+        replacements[col_name] = pd.Series(new_values, index=df.index, name=col_name)
+
+    out = df.copy(deep=False)
+    for col_name, series in replacements.items():
+        out[col_name] = series
+    return out, touched
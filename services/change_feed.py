@@ -0,0 +1,253 @@
+import asyncio
+import os
+import threading
+from dataclasses import dataclass, field
+import numpy as np
+import pandas as pd
+
+from services import chunk_store
+from services.serializer import dumps, frame_records
+
+# Change feed behind /ws/data/{file_id}. Every committed edit is published
+# here (frame_versions.commit/undo/redo, and the out-of-core writers) and each
+# subscriber turns the changes it hasn't sent yet into one message, limited to
+# its viewport: a row range and, optionally, some columns.
+#
+#   {"type": "snapshot", "version", "total", "start", "columns", "rows"}
+#   {"type": "patch", "version", "cells": [[row, column, value], ...],
+#    "columns": {column: [value per viewport row]}, "dropped": [column]}
+#   {"type": "reorder", "version", "total", "from": [old row per viewport row],
+#    "rows": {row: record}}   # only the rows that weren't in the viewport before
+#
+# A subscriber never queues messages: changes that arrive while it is still
+# sending are merged into the next message (cell and column patches), or,
+# once rows have moved or too many have piled up, collapse into a fresh
+# snapshot of the viewport. Edits made through another worker process (with
+# a shared EXCELSIOR_STORE) reach only that worker's subscribers.
+
+MAX_VIEWPORT_ROWS = int(os.getenv("EXCELSIOR_FEED_MAX_ROWS", 1000))
+MAX_PENDING = int(os.getenv("EXCELSIOR_FEED_MAX_PENDING", 16))
+
+
+@dataclass(frozen=True)
+class Viewport:
+    start: int = 0
+    end: int = 100
+    columns: tuple | None = None   # None: every column
+
+    def visible(self, columns) -> list[str]:
+        return list(columns) if self.columns is None else [c for c in self.columns if c in columns]
+
+
+@dataclass(eq=False)
+class Change:
+    version: int
+    frame: pd.DataFrame | None = None   # None for out-of-core files: read back from the chunks
+    delta: object = None                # a frame_versions delta; None means "resend the viewport"
+    reverted: bool = False              # the delta was undone rather than applied
+    rendered: dict = field(default_factory=dict)   # (viewport, resync) -> message, shared by subscribers
+
+    @property
+    def kind(self) -> str | None:
+        if self.delta is None or (self.reverted and self.delta.kind == "rows"):
+            return None
+        return self.delta.kind
+
+
+class Subscriber:
+    """One feed consumer: the viewport plus the changes not yet sent to it."""
+
+    def __init__(self, file_id: str, viewport: Viewport, initial: Change, loop: asyncio.AbstractEventLoop):
+        self.file_id = file_id
+        self.viewport = viewport
+        self.loop = loop
+        self._ready = asyncio.Event()
+        self._lock = threading.Lock()
+        self._latest = initial
+        self._changes = [initial]
+        self._resync = True   # starts with a snapshot
+        self._ready.set()
+
+    def offer(self, change: Change) -> bool:
+        """Queue `change`; True when the consumer was idle and needs waking."""
+        with self._lock:
+            self._latest = change
+            if self._resync or len(self._changes) >= MAX_PENDING:
+                # Only the newest frame matters for a snapshot
+                _stats["coalesced"] += len(self._changes)
+                self._changes, self._resync = [change], True
+            else:
+                self._changes.append(change)
+            return len(self._changes) == 1
+
+    def move(self, viewport: Viewport):
+        """Change the viewport; the next message is a snapshot of it."""
+        with self._lock:
+            self.viewport = viewport
+            _stats["coalesced"] += len(self._changes)
+            self._changes, self._resync = [self._latest], True
+        self._ready.set()
+
+    async def wait(self) -> tuple[list[Change], bool, Viewport]:
+        """The changes to send next, whether they need a snapshot, and the viewport to render them for."""
+        while True:
+            await self._ready.wait()
+            self._ready.clear()
+            with self._lock:
+                changes, resync, viewport = self._changes, self._resync, self.viewport
+                self._changes, self._resync = [], False
+            if changes:
+                _stats["coalesced"] += len(changes) - 1
+                return changes, resync, viewport
+
+
+_subscribers: dict[str, set[Subscriber]] = {}
+_lock = threading.Lock()
+_stats = {"published": 0, "messages": 0, "snapshots": 0, "coalesced": 0}
+
+
+def subscribe(file_id: str, viewport: Viewport, initial: Change, loop=None) -> Subscriber:
+    subscriber = Subscriber(file_id, viewport, initial, loop or asyncio.get_running_loop())
+    with _lock:
+        _subscribers.setdefault(file_id, set()).add(subscriber)
+    return subscriber
+
+
+def unsubscribe(subscriber: Subscriber):
+    with _lock:
+        subscribers = _subscribers.get(subscriber.file_id)
+        if subscribers is not None:
+            subscribers.discard(subscriber)
+            if not subscribers:
+                del _subscribers[subscriber.file_id]
+
+
+def _wake(subscribers: list[Subscriber]):
+    for subscriber in subscribers:
+        subscriber._ready.set()
+
+
+def publish(file_id: str, version: int, frame: pd.DataFrame | None = None, delta=None, reverted: bool = False):
+    """Hand a committed change of `file_id` to its subscribers. Cheap when nobody is watching."""
+    with _lock:
+        subscribers = list(_subscribers.get(file_id, ()))
+    if not subscribers:
+        return
+    _stats["published"] += 1
+    change = Change(version, frame, delta, reverted)
+    idle: dict[asyncio.AbstractEventLoop, list[Subscriber]] = {}
+    for subscriber in subscribers:
+        if subscriber.offer(change):
+            idle.setdefault(subscriber.loop, []).append(subscriber)
+    # One wake-up per event loop, however many of its subscribers were idle
+    for loop, waiting in idle.items():
+        try:
+            loop.call_soon_threadsafe(_wake, waiting)
+        except RuntimeError:
+            pass   # the loop has closed; its subscribers are gone
+
+
+# -- messages -----------------------------------------------------------------
+
+def _rows_range(viewport: Viewport, total: int) -> tuple[int, int]:
+    return min(viewport.start, total), min(viewport.end, total)
+
+
+def _snapshot(file_id: str, viewport: Viewport, change: Change) -> dict:
+    if change.frame is None:
+        manifest = chunk_store.require_manifest(file_id)
+        total, columns = manifest.rows, viewport.visible(manifest.columns)
+        start, end = _rows_range(viewport, total)
+        view = chunk_store.concat_frames(list(chunk_store.page(file_id, start, end)))[columns]
+    else:
+        df = change.frame
+        total, columns = len(df), viewport.visible(df.columns)
+        start, end = _rows_range(viewport, total)
+        view = df.iloc[start:end][columns]
+    _stats["snapshots"] += 1
+    return {"type": "snapshot", "version": change.version, "total": total, "start": start,
+            "columns": columns, "rows": frame_records(view)}
+
+
+def _in_view(rows: np.ndarray, start: int, end: int) -> np.ndarray:
+    return rows[(rows >= start) & (rows < end)]
+
+
+def _patch(viewport: Viewport, changes: list[Change]) -> dict | None:
+    # Rows don't move in a cell or column patch, so every value can be read
+    # from the newest frame, however many changes are merged here
+    df = changes[-1].frame
+    start, end = _rows_range(viewport, len(df))
+    replaced, touched = set(), {}
+    for change in changes:
+        if change.delta.kind == "column":
+            replaced.add(change.delta.column)
+        else:
+            for column, (rows, *_) in change.delta.changes.items():
+                touched.setdefault(column, []).append(_in_view(np.asarray(rows), start, end))
+
+    wanted = set(viewport.visible(set(df.columns) | replaced))
+    columns = {c: df[c].iloc[start:end].tolist() for c in replaced if c in wanted and c in df.columns}
+    dropped = sorted(c for c in replaced if c in wanted and c not in df.columns)
+    cells = []
+    for column, parts in touched.items():
+        if column in columns or column not in wanted or column not in df.columns:
+            continue
+        rows = np.unique(np.concatenate(parts))
+        cells.extend(zip(rows.tolist(), [column] * len(rows), df[column].take(rows).tolist()))
+    if not (cells or columns or dropped):
+        return None
+    message = {"type": "patch", "version": changes[-1].version, "cells": cells}
+    if columns:
+        message["columns"] = columns
+        message["start"] = start
+    if dropped:
+        message["dropped"] = dropped
+    return message
+
+
+def _reorder(viewport: Viewport, change: Change) -> dict:
+    # new row i is old row positions[i]; the client keeps the rows it already shows
+    df, positions = change.frame, change.delta.positions
+    start, end = _rows_range(viewport, len(df))
+    sources = positions[start:end]
+    fresh = np.flatnonzero((sources < viewport.start) | (sources >= viewport.end))
+    records = frame_records(df.iloc[start + fresh][viewport.visible(df.columns)])
+    return {"type": "reorder", "version": change.version, "total": len(df), "start": start,
+            "from": sources.tolist(), "rows": dict(zip((start + fresh).tolist(), records))}
+
+
+def _render(file_id: str, viewport: Viewport, changes: list[Change], resync: bool) -> bytes | None:
+    kinds = {change.kind for change in changes}
+    if not resync and kinds <= {"cells", "column"}:
+        message = _patch(viewport, changes)
+    elif not resync and len(changes) == 1 and kinds == {"rows"}:
+        message = _reorder(viewport, changes[0])
+    else:
+        message = _snapshot(file_id, viewport, changes[-1])
+    return None if message is None else dumps(message)
+
+
+def render(file_id: str, viewport: Viewport, changes: list[Change], resync: bool) -> bytes | None:
+    """
+    The message bringing a subscriber at `viewport` up to date with `changes`,
+    or None when nothing it shows changed. A lone change is encoded once per
+    viewport and shared by every subscriber looking at the same rows.
+    """
+    if len(changes) > 1:
+        data = _render(file_id, viewport, changes, resync)
+    else:
+        key = (viewport, resync)
+        rendered = changes[0].rendered
+        if key not in rendered:
+            rendered[key] = _render(file_id, viewport, changes, resync)
+        data = rendered[key]
+    if data is not None:
+        _stats["messages"] += 1
+    return data
+
+
+def get_stats() -> dict:
+    with _lock:
+        subscribers = [s for group in _subscribers.values() for s in group]
+    return {**_stats, "files": len({s.file_id for s in subscribers}), "subscribers": len(subscribers)}
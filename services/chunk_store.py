@@ -0,0 +1,334 @@
+import base64
+import fcntl
+import json
+import os
+import shutil
+import threading
+from contextlib import contextmanager
+from itertools import islice
+from typing import Dict, Iterable, Iterator
+import pandas as pd
+import pyarrow as pa
+
+from exceptions import ExcelOperationError
+from services.excel_parser import open_workbook, stream_sheet
+
+UPLOAD_DIR = "uploads"
+
+# Out-of-core mode for workbooks too large to hold as one DataFrame. Ingest
+# streams the first sheet out of the .xlsx into Arrow IPC chunk files under
+# uploads/{file_id}.chunks/ (next to a manifest.json listing them), and the data
+# endpoints read one chunk at a time: pages here, filters, sorts and column
+# patches in services/out_of_core. memory_store never loads such a file; the
+# in-memory path stays as it was for everything under the threshold.
+#
+# Memory is bounded by EXCELSIOR_CHUNK_MEMORY_MB: chunks are sized from the
+# measured bytes per row so that one chunk plus its working copies fits, and a
+# merge reads one record batch per run, merging in several passes when there
+# are more runs than the budget can hold batches for.
+#
+# Column types are unified across chunks in the manifest (ints with floats
+# become float64, anything else that disagrees becomes text) and every chunk is
+# cast to that schema on read, so pages and sorts see one dtype per column.
+# Edits rewrite the chunks into a new generation; the previous one is kept so
+# a page that is still streaming can finish. There is no undo in this mode.
+
+CHUNKED_THRESHOLD = int(os.getenv("EXCELSIOR_CHUNKED_THRESHOLD_MB", 64)) * 2**20   # .xlsx bytes
+MEMORY_BUDGET = int(os.getenv("EXCELSIOR_CHUNK_MEMORY_MB", 256)) * 2**20
+CHUNK_ROWS = int(os.getenv("EXCELSIOR_CHUNK_ROWS", 250_000))   # upper bound; the budget may ask for fewer
+MIN_CHUNK_ROWS = 1_000
+BATCH_ROWS = 8192       # record batch size inside a chunk file; the unit a merge reads
+CHUNK_OVERHEAD = 8      # budget share per chunk: rows as Python tuples at ingest, copies while sorting
+KEEP_GENERATIONS = 2
+
+_locks: Dict[str, threading.Lock] = {}
+_locks_guard = threading.Lock()
+
+
+def chunk_dir(file_id: str) -> str:
+    return os.path.join(UPLOAD_DIR, f"{file_id}.chunks")
+
+
+def _manifest_path(file_id: str) -> str:
+    return os.path.join(chunk_dir(file_id), "manifest.json")
+
+
+def is_chunked(file_id: str) -> bool:
+    return os.path.exists(_manifest_path(file_id))
+
+
+def wants_chunks(path: str) -> bool:
+    """Whether an uploaded workbook is big enough for the out-of-core mode."""
+    return os.path.getsize(path) > CHUNKED_THRESHOLD
+
+
+# -- manifest -----------------------------------------------------------------
+
+class Manifest:
+    def __init__(self, file_id: str, data: dict):
+        self.file_id = file_id
+        self.generation = data["generation"]
+        self.columns = data["columns"]
+        self.chunks = [(os.path.join(chunk_dir(file_id), c["file"]), c["rows"]) for c in data["chunks"]]
+        self.rows = sum(rows for _, rows in self.chunks)
+        self.row_bytes = data["row_bytes"]
+        self.schema = pa.ipc.read_schema(pa.py_buffer(base64.b64decode(data["schema"])))
+
+    def empty(self) -> pd.DataFrame:
+        return self.schema.empty_table().to_pandas()
+
+
+def load_manifest(file_id: str) -> Manifest | None:
+    try:
+        with open(_manifest_path(file_id)) as f:
+            return Manifest(file_id, json.load(f))
+    except FileNotFoundError:
+        return None
+
+
+def require_manifest(file_id: str) -> Manifest:
+    manifest = load_manifest(file_id)
+    if manifest is None:
+        raise ExcelOperationError(f"File '{file_id}' is not stored in chunks.")
+    return manifest
+
+
+@contextmanager
+def locked(file_id: str):
+    # Threads of this worker, then other workers on the host (uploads/ is local)
+    with _locks_guard:
+        lock = _locks.setdefault(file_id, threading.Lock())
+    with lock, open(os.path.join(chunk_dir(file_id), ".lock"), "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+# -- writing ------------------------------------------------------------------
+
+def _unify(a: pa.DataType, b: pa.DataType) -> pa.DataType:
+    if a == b or pa.types.is_null(b):
+        return a
+    if pa.types.is_null(a):
+        return b
+    if pa.types.is_integer(a) and pa.types.is_integer(b):
+        return pa.int64()
+    if all(pa.types.is_integer(t) or pa.types.is_floating(t) for t in (a, b)):
+        return pa.float64()
+    if pa.types.is_timestamp(a) and pa.types.is_timestamp(b) and a.tz == b.tz:
+        return pa.timestamp("ns", a.tz)
+    return pa.large_string()
+
+
+def _to_table(df: pd.DataFrame) -> pa.Table:
+    """df as a table of plain (non-dictionary) columns; columns Arrow can't type become text."""
+    arrays = []
+    for name in df.columns:
+        col = df[name]
+        if isinstance(col.dtype, pd.CategoricalDtype):
+            col = col.astype(col.dtype.categories.dtype)
+        try:
+            array = pa.array(col, from_pandas=True)
+        except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError):
+            array = pa.array([None if pd.isna(v) else str(v) for v in col], pa.large_string())
+        if pa.types.is_string(array.type):
+            array = array.cast(pa.large_string())
+        arrays.append(array)
+    return pa.Table.from_arrays(arrays, names=[str(name) for name in df.columns])
+
+
+class ChunkWriter:
+    """Appends frames to numbered chunk files under `directory`, sized to the memory budget."""
+
+    def __init__(self, directory: str, row_bytes: float = 0.0):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.files: list[tuple[str, int]] = []
+        self.schema: pa.Schema | None = None
+        self.row_bytes = row_bytes
+        self._sink = self._writer = self._file_schema = None
+        self._rows = 0
+
+    @property
+    def chunk_rows(self) -> int:
+        if not self.row_bytes:
+            return min(CHUNK_ROWS, 10 * MIN_CHUNK_ROWS)
+        return int(min(CHUNK_ROWS, max(MIN_CHUNK_ROWS, MEMORY_BUDGET // (CHUNK_OVERHEAD * self.row_bytes))))
+
+    def add(self, df: pd.DataFrame):
+        # Frames go straight into the open chunk file as record batches, so
+        # nothing is buffered beyond the frame being added.
+        if not len(df):
+            return
+        self.row_bytes = max(self.row_bytes, df.memory_usage(index=False, deep=True).sum() / len(df))
+        table = _to_table(df)
+        while table.num_rows:
+            if self._writer is not None and not self._fits(table.schema):
+                self._close_file()   # a type the open file can't hold starts the next chunk
+            if self._writer is None:
+                self._open_file(table.schema)
+            room = self.chunk_rows - self._rows
+            part, table = table.slice(0, room), table.slice(room)
+            self._writer.write_table(part.cast(self._file_schema), max_chunksize=BATCH_ROWS)
+            self._rows += part.num_rows
+            if self._rows >= self.chunk_rows:
+                self._close_file()
+
+    def _fits(self, schema: pa.Schema) -> bool:
+        return all(_unify(f, t) == f for f, t in zip(self._file_schema.types, schema.types))
+
+    def _open_file(self, schema: pa.Schema):
+        path = os.path.join(self.directory, f"{len(self.files):05d}.arrow")
+        self._sink = pa.OSFile(path, "wb")
+        self._writer = pa.ipc.new_file(self._sink, schema)
+        self._file_schema = schema
+        self.files.append((path, 0))
+        self._rows = 0
+
+    def _close_file(self):
+        schema = self._file_schema
+        self._writer.close()
+        self._sink.close()
+        self._sink = self._writer = None
+        self.files[-1] = (self.files[-1][0], self._rows)
+        if self.schema is None:
+            self.schema = schema
+        else:
+            self.schema = pa.schema([pa.field(f.name, _unify(f.type, t)) for f, t in zip(self.schema, schema.types)])
+
+    def close(self, columns: list[str]) -> "ChunkWriter":
+        if self._writer is not None:
+            self._close_file()
+        if self.schema is None:
+            self.schema = pa.schema([pa.field(str(c), pa.null()) for c in columns])
+        return self
+
+
+def publish(file_id: str, writer: ChunkWriter, generation: int):
+    """Point the manifest at `writer`'s chunks, then drop generations nobody can still be reading."""
+    root = chunk_dir(file_id)
+    data = {
+        "generation": generation,
+        "columns": writer.schema.names,
+        "chunks": [{"file": os.path.relpath(path, root), "rows": rows} for path, rows in writer.files],
+        "row_bytes": writer.row_bytes,
+        "schema": base64.b64encode(writer.schema.serialize().to_pybytes()).decode(),
+    }
+    tmp = _manifest_path(file_id) + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(data, f)
+    os.replace(tmp, _manifest_path(file_id))
+    for name in os.listdir(root):
+        if name.startswith("g") and name[1:].isdigit() and int(name[1:]) <= generation - KEEP_GENERATIONS:
+            shutil.rmtree(os.path.join(root, name), ignore_errors=True)
+
+
+def _unique(headers: list) -> list[str]:
+    # Same suffixes pd.read_excel gives repeated headers: A, A.1, A.2
+    seen: Dict[str, int] = {}
+    out = []
+    for header in map(str, headers):
+        name = header
+        while name in seen:
+            seen[header] += 1
+            name = f"{header}.{seen[header]}"
+        seen[name] = 0
+        out.append(name)
+    return out
+
+
+def _new_file(file_id: str) -> ChunkWriter:
+    shutil.rmtree(chunk_dir(file_id), ignore_errors=True)
+    return ChunkWriter(os.path.join(chunk_dir(file_id), "g1"))
+
+
+def write_frames(file_id: str, frames: Iterable[pd.DataFrame]) -> dict:
+    """Store a sheet that arrives as consecutive row blocks with the same columns as a chunked file."""
+    writer, columns = _new_file(file_id), []
+    for frame in frames:
+        columns = [str(c) for c in frame.columns]
+        writer.add(frame)
+    publish(file_id, writer.close(columns), generation=1)
+    return describe(file_id)
+
+
+def convert(file_id: str, src: str, sheet: str | None = None) -> dict:
+    """Stream a sheet of the workbook at `src` into chunk files. Runs in an ingest worker process."""
+    writer = _new_file(file_id)
+    # A file object: openpyxl goes by the extension, and the spooled upload has none it knows
+    with open(src, "rb") as f, open_workbook(f) as wb:
+        headers, rows = stream_sheet(wb, sheet)
+        columns = _unique(headers)
+        while batch := list(islice(rows, writer.chunk_rows)):
+            writer.add(pd.DataFrame(batch, columns=columns).infer_objects())
+    publish(file_id, writer.close(columns), generation=1)
+    return describe(file_id)
+
+
+# -- reading ------------------------------------------------------------------
+
+def _read(path: str, schema: pa.Schema, columns: list[str] | None = None) -> pd.DataFrame:
+    with pa.memory_map(path, "r") as source:
+        table = pa.ipc.open_file(source).read_all()
+    if columns is not None:
+        table = table.select(columns)
+    return table.cast(pa.schema([schema.field(name) for name in table.column_names])).to_pandas(split_blocks=True)
+
+
+def read_batches(path: str, schema: pa.Schema) -> Iterator[pd.DataFrame]:
+    # One record batch at a time. Read, not mapped: a merge keeps every run open
+    # to the end, and the pages of a map would stay resident that long
+    with pa.OSFile(path, "rb") as source:
+        reader = pa.ipc.open_file(source)
+        for i in range(reader.num_record_batches):
+            batch = pa.Table.from_batches([reader.get_batch(i)])
+            yield batch.cast(schema).to_pandas(split_blocks=True)
+
+
+def iter_chunks(manifest: Manifest, columns: list[str] | None = None) -> Iterator[tuple[int, pd.DataFrame]]:
+    """(position of the chunk's first row, chunk) for each chunk in order."""
+    start = 0
+    for path, rows in manifest.chunks:
+        yield start, _read(path, manifest.schema, columns)
+        start += rows
+
+
+def page(file_id: str, offset: int = 0, end: int | None = None) -> Iterator[pd.DataFrame]:
+    """The rows [offset, end) as a sequence of frames, reading only the chunks they fall in."""
+    manifest = require_manifest(file_id)
+    end = manifest.rows if end is None else min(end, manifest.rows)
+    start = 0
+    for path, rows in manifest.chunks:
+        if start >= end:
+            break
+        if start + rows > offset:
+            chunk = _read(path, manifest.schema)
+            yield chunk.iloc[max(offset - start, 0):end - start]
+        start += rows
+    if offset >= end:
+        yield manifest.empty()   # so consumers still get the columns
+
+
+def head(file_id: str, rows: int) -> pd.DataFrame:
+    return concat_frames(list(page(file_id, 0, rows)))
+
+
+def concat_frames(frames: list[pd.DataFrame]) -> pd.DataFrame:
+    return frames[0] if len(frames) == 1 else pd.concat(frames, ignore_index=True)
+
+
+def describe(file_id: str) -> dict | None:
+    manifest = load_manifest(file_id)
+    if manifest is None:
+        return None
+    return {
+        "mode": "chunked",
+        "rows": manifest.rows,
+        "chunks": len(manifest.chunks),
+        "generation": manifest.generation,
+        "bytes_on_disk": sum(os.path.getsize(path) for path, _ in manifest.chunks),
+        "memory_budget": MEMORY_BUDGET,
+        "columns": {field.name: str(field.type) for field in manifest.schema},
+    }
@@ -0,0 +1,133 @@
+import os
+import threading
+from typing import Dict
+import numpy as np
+import pandas as pd
+
+# Ingest-time dtype pass. Sheets arrive with text as object (or pandas 3's
+# "str") and numbers as int64/float64; most of that width is wasted:
+#   - text with few distinct values (Region, Status) becomes a categorical with
+#     sorted categories, a 1-2 byte code per cell;
+#   - other text becomes the Arrow-backed string dtype;
+#   - integers shrink to the smallest signed type holding their range, floats
+#     to float32 only when every value survives the round trip exactly.
+# Columns mixing types stay object. Code that edits columns widens back through
+# wide_dtype() first, so nothing overflows or truncates after the pass.
+
+# A text column becomes categorical when distinct values <= ratio * non-missing cells
+CATEGORY_RATIO = float(os.getenv("EXCELSIOR_CATEGORY_RATIO", 0.5))
+MIN_CATEGORY_ROWS = int(os.getenv("EXCELSIOR_MIN_CATEGORY_ROWS", 64))
+
+try:
+    TEXT_DTYPE = pd.StringDtype("pyarrow", na_value=np.nan)   # what pandas 3 calls "str"
+except TypeError:
+    TEXT_DTYPE = pd.StringDtype("pyarrow")                    # pandas < 2.3
+
+_INT_TYPES = (np.int8, np.int16, np.int32)
+
+_reports: Dict[str, dict] = {}
+_lock = threading.Lock()
+
+
+def wide_dtype(dtype):
+    """int64/float64 for a (possibly downcast) numpy number dtype, else the dtype unchanged."""
+    if isinstance(dtype, np.dtype):
+        if dtype.kind in "iu":
+            return np.dtype(np.int64) if dtype.kind == "i" or dtype.itemsize < 8 else dtype
+        if dtype.kind == "f":
+            return np.dtype(np.float64)
+    return dtype
+
+
+def _text(col: pd.Series) -> pd.Series | None:
+    valid = col.dropna()
+    if not pd.api.types.is_string_dtype(col.dtype) or (
+            col.dtype == object and pd.api.types.infer_dtype(valid, skipna=False) != "string"):
+        return None
+    text = col.astype(TEXT_DTYPE)
+    if len(valid) >= MIN_CATEGORY_ROWS and text.nunique() <= CATEGORY_RATIO * len(valid):
+        # astype("category") sorts the categories, so codes order like the text
+        return text.astype("category")
+    return text
+
+
+def number_dtype(values: np.ndarray) -> np.dtype:
+    """The narrowest dtype that holds every value of a numeric array exactly."""
+    if values.dtype.kind == "i" and len(values):
+        lo, hi = values.min(), values.max()
+        for dtype in _INT_TYPES:
+            info = np.iinfo(dtype)
+            if info.min <= lo and hi <= info.max:
+                return np.dtype(dtype)
+    elif values.dtype == np.float64:
+        if np.array_equal(values.astype(np.float32).astype(np.float64), values, equal_nan=True):
+            return np.dtype(np.float32)
+    return values.dtype
+
+
+def _number(col: pd.Series) -> pd.Series | None:
+    dtype = number_dtype(col.to_numpy())
+    return col.astype(dtype) if dtype != col.dtype else None
+
+
+def optimize_column(col: pd.Series) -> pd.Series:
+    """The compact form of one column, or the column itself when none applies."""
+    dtype = col.dtype
+    if isinstance(dtype, pd.CategoricalDtype) or pd.api.types.is_bool_dtype(dtype):
+        return col
+    if isinstance(dtype, np.dtype) and dtype.kind in "iuf":
+        compact = _number(col)
+    elif pd.api.types.is_string_dtype(dtype):
+        compact = _text(col)
+    else:
+        compact = None
+    return col if compact is None else compact
+
+
+def column_bytes(df: pd.DataFrame) -> list[int]:
+    return [int(b) for b in df.memory_usage(index=False, deep=True)]
+
+
+def optimize(df: pd.DataFrame) -> tuple[pd.DataFrame, dict]:
+    """
+    Compact copy of `df` (column data shared where nothing changed) plus a
+    report of the bytes before and after, per column and in total.
+    """
+    before = column_bytes(df)
+    out = df.copy(deep=False)
+    for i in range(len(df.columns)):   # by position: headers may repeat
+        col = df.iloc[:, i]
+        compact = optimize_column(col)
+        if compact is not col:
+            out.isetitem(i, compact)
+    after = column_bytes(out)
+    columns = {
+        str(name): {"from": str(df.dtypes.iloc[i]), "to": str(out.dtypes.iloc[i]),
+                    "bytes_before": before[i], "bytes_after": after[i]}
+        for i, name in enumerate(df.columns)
+    }
+    return out, {"rows": len(df), "bytes_before": sum(before), "bytes_after": sum(after), "columns": columns}
+
+
+def record(file_id: str, report: dict):
+    with _lock:
+        _reports[file_id] = report
+
+
+def memory_report(file_id: str, df: pd.DataFrame) -> dict:
+    """Current per-column dtypes and bytes of the cached frame, next to what ingest saw."""
+    sizes = column_bytes(df)
+    with _lock:
+        ingest = _reports.get(file_id)
+    return {
+        "rows": len(df),
+        "bytes": sum(sizes),
+        "columns": {str(name): {"dtype": str(dtype), "bytes": size}
+                    for name, dtype, size in zip(df.columns, df.dtypes, sizes)},
+        "ingest": None if ingest is None else {k: ingest[k] for k in ("bytes_before", "bytes_after")},
+    }
+
+
+def forget(file_id: str):
+    with _lock:
+        _reports.pop(file_id, None)
@@ -1,39 +1,67 @@
 import os
 import pandas as pd
-from services.file_status import update_status
 from exceptions import ExcelOperationError, InvalidActionSchema, FileNotFound
-from services.memory_store import get as get_df, put as put_df
+from services.memory_store import get as get_df, mutation
 from services.file_status import update_status
 from services.action_validator import validate_action_schema
+from services import frame_versions, formula_engine
+from services.action_plan import Plan, compile_plan, estimate, run as run_plan
+from services.metrics import stage
 
 UPLOAD_DIR = "uploads"
 
-def apply_excel_action(file_id: str, action: dict):
-    df = get_df(file_id)
-    if df is None:
-        raise ValueError("File not loaded in memory; upload first or reload.")
-
+def _validate(df: pd.DataFrame, action: dict):
     is_valid, err = validate_action_schema(action, df.columns.tolist())
     if not is_valid:
-        raise ValueError(err)
+        raise InvalidActionSchema(err)
 
+def _plan(df: pd.DataFrame, action: dict) -> Plan:
+    _validate(df, action)
     op = action["operation"]
-    if op == "sort":
-        df.sort_values(
-            by=action["column"],
-            ascending=action.get("order", "asc").lower() == "asc",
-            inplace=True,
-        )
-    elif op == "filter":
-        cond = action["condition"]
-        col, oper, val = action["column"], cond["operator"], cond["value"]
-        expr = f"{col} {oper} @val"
-        df.query(expr, inplace=True)
-    elif op == "update":
-        df[action["column"]] = action["value"]
-    else:
+    if op == "aggregate":
+        # A summary is a read, not an edit: see /data/{file_id}/aggregate
+        raise InvalidActionSchema("'aggregate' doesn't modify the sheet; it is answered without applying it.")
+    if op not in {"sort", "filter", "update", "pipeline"}:
         raise ValueError(f"Bad operation '{op}'")
+    # Validated once above; the plan's steps don't check again
+    return compile_plan(action["steps"] if op == "pipeline" else [action], df.columns.tolist())
+
+def build_action(file_id: str, df: pd.DataFrame, action: dict) -> tuple[pd.DataFrame, object]:
+    """Validate `action` against df and return the new frame plus the delta that undoes it."""
+    if action.get("operation") == "add_column":
+        _validate(df, action)
+        return formula_engine.add_column(file_id, df, action)
+    # Computed columns that read what the action changed are part of the same edit
+    return formula_engine.recalculate(file_id, df, *run_plan(file_id, df, _plan(df, action)))
+
+def plan_action(file_id: str, action: dict) -> dict:
+    """
+    Dry run: the plan `action` compiles to and the rows left after each step,
+    without changing the frame or its history.
+    """
+    df = get_df(file_id)
+    if df is None:
+        raise FileNotFound(file_id)
+    if action.get("operation") == "add_column":
+        _validate(df, action)
+        return formula_engine.plan(file_id, df, action)
+    plan = _plan(df, action)
+    description = plan.describe()
+    for step, rows in zip(description["steps"], estimate(file_id, df, plan)):
+        step["estimated_rows"] = rows
+    return {"rows": len(df), **description}
+
+def apply_excel_action(file_id: str, action: dict) -> int:
+    with mutation(file_id):
+        df = get_df(file_id)
+        if df is None:
+            raise FileNotFound(file_id)
+
+        with stage("frame_op"):
+            df, delta = build_action(file_id, df, action)
 
-    # Store back in memory
-    put_df(file_id, df)
-    update_status(file_id, "modified")
\ No newline at end of file
+        # Store back in memory as a new version (undoable via /data/{file_id}/undo)
+        # and journal the action so it survives a restart
+        version = frame_versions.commit(file_id, df, delta, op={"kind": "action", "action": action})
+    update_status(file_id, "modified")
+    return version
@@ -1,15 +1,76 @@
+from contextlib import contextmanager
+from itertools import islice
 import pandas as pd
+from openpyxl import load_workbook
 
-def parse_excel_preview(path: str):
-    xl = pd.ExcelFile(path)
-    sheet_name = xl.sheet_names[0]
-    df = xl.parse(sheet_name)
-    
-    headers = list(df.columns)
-    sample = df.head().fillna("").values.tolist()
+# openpyxl read-only mode streams rows from the sheet XML instead of building
+# the whole workbook, so a preview costs the same on 1k rows as on 1M.
+
+@contextmanager
+def open_workbook(path: str):
+    wb = load_workbook(path, read_only=True, data_only=True)
+    try:
+        yield wb
+    finally:
+        wb.close()   # read-only workbooks keep the zip handle open otherwise
+
+
+def sheet_names(path: str) -> list[str]:
+    with open_workbook(path) as wb:
+        return wb.sheetnames
+
+
+def _headers(first_row) -> list:
+    # Same placeholder names pandas gives blank header cells
+    return [
+        value if value is not None else f"Unnamed: {i}"
+        for i, value in enumerate(first_row)
+    ]
+
+
+def stream_sheet(wb, sheet: str | None = None):
+    """
+    Return (headers, rows) where `rows` lazily yields the data rows padded to
+    the header width. Blank rows are skipped like pd.read_excel does.
+    """
+    if sheet is not None and sheet not in wb.sheetnames:
+        raise KeyError(sheet)
+    ws = wb[sheet] if sheet is not None else wb.worksheets[0]
+    rows = ws.iter_rows(values_only=True)
+    first = next(rows, None)
+    if first is None:
+        return [], iter(())
+    headers = _headers(first)
+    width = len(headers)
+
+    def data():
+        for row in rows:
+            if all(value is None for value in row):
+                continue
+            yield (row + (None,) * (width - len(row)))[:width]
+
+    return headers, data()
+
+
+def read_rows(path: str, sheet: str | None = None, limit: int | None = None) -> pd.DataFrame:
+    """Read at most `limit` data rows (all when None) of a sheet into a DataFrame."""
+    with open_workbook(path) as wb:
+        headers, rows = stream_sheet(wb, sheet)
+        data = list(islice(rows, limit))
+    return pd.DataFrame(data, columns=headers).infer_objects()
+
+
+def parse_excel_preview(path: str, rows: int = 5, sheet: str | None = None):
+    with open_workbook(path) as wb:
+        names = wb.sheetnames
+        headers, data = stream_sheet(wb, sheet)
+        sample = [
+            ["" if value is None else value for value in row]
+            for row in islice(data, rows)
+        ]
 
     return {
-        "sheets": xl.sheet_names,
+        "sheets": names,
         "headers": headers,
         "sample": sample
-    }
\ No newline at end of file
+    }
@@ -0,0 +1,170 @@
+import asyncio
+import os
+import shutil
+import time
+from typing import Dict
+import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+import pyarrow.parquet as pq
+
+from exceptions import ExcelOperationError
+from services.memory_store import get_with_token
+from services.snapshot import materialize_xlsx
+from services.xlsx_writer import write_xlsx
+
+UPLOAD_DIR = "uploads"
+EXPORT_DIR = os.path.join(UPLOAD_DIR, ".exports")
+
+# Rows per Arrow batch / CSV chunk / Parquet row group
+BATCH_ROWS = int(os.getenv("EXCELSIOR_EXPORT_BATCH_ROWS", 65_536))
+
+FORMATS = {
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    "csv": "text/csv",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+# Exports of the live frame, written off the event loop and kept on disk per
+# frame version (memory_store.get_with_token), so asking again for an unchanged
+# frame is a FileResponse of the existing file. Concurrent requests for the
+# same version share one write.
+
+_exports: Dict[tuple[str, str], tuple[str, str]] = {}   # (file_id, format) -> (token, path)
+_retired: Dict[tuple[str, str], str] = {}               # the previous path, kept for responses still reading it
+_inflight: Dict[tuple, asyncio.Future] = {}
+_stats = {"hits": 0, "misses": 0, "coalesced": 0, "rows": 0, "seconds": 0.0}
+
+
+def export_path(file_id: str, fmt: str, token: str) -> str:
+    return os.path.join(EXPORT_DIR, f"{file_id}.{token}.{fmt}")
+
+
+def _arrow_schema(df: pd.DataFrame) -> pa.Schema | None:
+    # One schema for the whole frame, so every batch agrees on each column's type.
+    # None when a column can't be represented (e.g. it mixes numbers and text).
+    try:
+        return pa.Schema.from_pandas(df, preserve_index=False)
+    except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError):
+        return None
+
+
+def _arrow_batches(df: pd.DataFrame, schema: pa.Schema):
+    for start in range(0, len(df), BATCH_ROWS):
+        yield pa.RecordBatch.from_pandas(df.iloc[start:start + BATCH_ROWS], schema=schema, preserve_index=False)
+
+
+def _write_csv(df: pd.DataFrame, path: str):
+    schema = _arrow_schema(df)
+    if schema is None:
+        df.to_csv(path, index=False, chunksize=BATCH_ROWS)   # slower, but takes anything
+        return
+    with pa_csv.CSVWriter(path, schema) as writer:
+        for batch in _arrow_batches(df, schema):
+            writer.write_batch(batch)
+
+
+def _write_parquet(df: pd.DataFrame, path: str):
+    schema = _arrow_schema(df)
+    if schema is None:
+        raise ExcelOperationError("This sheet mixes types within a column, which Parquet can't store; "
+                                  "export it as xlsx or CSV instead.")
+    with pq.ParquetWriter(path, schema) as writer:
+        for batch in _arrow_batches(df, schema):
+            writer.write_batch(batch)
+
+
+_WRITERS = {"xlsx": write_xlsx, "csv": _write_csv, "parquet": _write_parquet}
+
+
+def write_export(df: pd.DataFrame, path: str, fmt: str):
+    """Write df to `path` in `fmt`; the file appears atomically."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = f"{path}.tmp.{fmt}"   # keep the extension: write_xlsx/to_csv don't care, readers might
+    start = time.perf_counter()
+    try:
+        _WRITERS[fmt](df, tmp)
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    _stats["rows"] += len(df)
+    _stats["seconds"] += time.perf_counter() - start
+
+
+async def _single_flight(key: tuple, work):
+    # Same pattern as llm_client.complete_json: later callers await the first one's result
+    pending = _inflight.get(key)
+    if pending is not None:
+        _stats["coalesced"] += 1
+        return await asyncio.shield(pending)
+
+    future = asyncio.get_running_loop().create_future()
+    _inflight[key] = future
+    try:
+        result = await work()
+        future.set_result(result)
+        return result
+    except asyncio.CancelledError:
+        future.cancel()
+        raise
+    except Exception as e:
+        future.set_exception(e)
+        future.exception()   # nobody else may be waiting
+        raise
+    finally:
+        del _inflight[key]
+
+
+def _publish(file_id: str, fmt: str, token: str, path: str):
+    key = (file_id, fmt)
+    previous = _exports.get(key)
+    _exports[key] = (token, path)
+    if previous is not None and previous[1] != path:
+        old = _retired.pop(key, None)
+        if old is not None and os.path.exists(old):
+            os.remove(old)
+        _retired[key] = previous[1]
+
+
+async def export(file_id: str, fmt: str = "xlsx") -> str | None:
+    """
+    Path of the file_id's current frame written as `fmt` (xlsx, csv or
+    parquet), or None if the file isn't loaded. Raises ExcelOperationError
+    when the frame can't be written in that format.
+    """
+    if fmt not in FORMATS:
+        raise ExcelOperationError(f"Unsupported export format '{fmt}'.")
+    df, token = get_with_token(file_id)
+    if df is None:
+        return None
+
+    cached = _exports.get((file_id, fmt))
+    if cached is not None and cached[0] == token and os.path.exists(cached[1]):
+        _stats["hits"] += 1
+        return cached[1]
+
+    async def work():
+        _stats["misses"] += 1
+        path = export_path(file_id, fmt, token)
+        await asyncio.to_thread(write_export, df, path, fmt)
+        _publish(file_id, fmt, token, path)
+        return path
+
+    return await _single_flight((file_id, fmt, token), work)
+
+
+async def saved_xlsx(file_id: str) -> str | None:
+    """uploads/{file_id}.xlsx brought up to date with the saved snapshot, off the event loop."""
+    return await _single_flight((file_id, "saved"), lambda: asyncio.to_thread(materialize_xlsx, file_id))
+
+
+def clear():
+    """Drop every cached export, e.g. at startup: tokens from another process never match."""
+    _exports.clear()
+    _retired.clear()
+    shutil.rmtree(EXPORT_DIR, ignore_errors=True)
+
+
+def get_stats() -> dict:
+    return {**_stats, "cached": len(_exports)}
@@ -1,30 +1,118 @@
 import json
 import os
+import sqlite3
+import threading
 from datetime import datetime
 
-STATUS_FILE = "file_statuses.json"
+from services.metrics import stage
 
-def load_statuses():
-    if not os.path.exists(STATUS_FILE):
-        return {}
-    with open(STATUS_FILE, "r") as f:
-        return json.load(f)
+STATUS_DB = os.getenv("EXCELSIOR_STATUS_DB", "file_statuses.db")
+STATUS_FILE = "file_statuses.json"   # legacy store, imported into STATUS_DB once
+
+# SQLite in WAL mode: readers never block the single writer, writers from other
+# threads/uvicorn workers queue on the database lock instead of clobbering each
+# other, and an update touches one row instead of rewriting every status.
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS file_status (
+    file_id   TEXT PRIMARY KEY,
+    status    TEXT NOT NULL,
+    timestamp TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS status_history (
+    id        INTEGER PRIMARY KEY AUTOINCREMENT,
+    file_id   TEXT NOT NULL,
+    status    TEXT NOT NULL,
+    timestamp TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS status_history_file ON status_history (file_id, id);
+CREATE TABLE IF NOT EXISTS meta (
+    key   TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+_local = threading.local()
+
+
+def _import_legacy_json(conn: sqlite3.Connection):
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        done = conn.execute("SELECT 1 FROM meta WHERE key = 'legacy_json_imported'").fetchone()
+        if not done and os.path.exists(STATUS_FILE):
+            with open(STATUS_FILE, "r") as f:
+                statuses = json.load(f)
+            rows = [(fid, s["status"], s["timestamp"]) for fid, s in statuses.items()]
+            conn.executemany("INSERT OR IGNORE INTO file_status VALUES (?, ?, ?)", rows)
+            conn.executemany(
+                "INSERT INTO status_history (file_id, status, timestamp) VALUES (?, ?, ?)", rows
+            )
+        if not done:
+            conn.execute("INSERT INTO meta VALUES ('legacy_json_imported', ?)", (_now(),))
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+
+def _connect() -> sqlite3.Connection:
+    # One connection per thread and process; a forked child must not reuse its parent's
+    conn = getattr(_local, "conn", None)
+    if conn is not None and _local.pid == os.getpid() and _local.path == STATUS_DB:
+        return conn
+
+    conn = sqlite3.connect(STATUS_DB, timeout=30, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.executescript(_SCHEMA)
+    _import_legacy_json(conn)
+
+    _local.conn, _local.pid, _local.path = conn, os.getpid(), STATUS_DB
+    return conn
+
+
+def _now() -> str:
+    return datetime.utcnow().isoformat() + "Z"
 
-def save_statuses(statuses):
-    with open(STATUS_FILE, "w") as f:
-        json.dump(statuses, f, indent=2)
 
 def update_status(file_id: str, status: str):
-    statuses = load_statuses()
-    statuses[file_id] = {
-        "status": status,
-        "timestamp": datetime.utcnow().isoformat() + "Z"  
-    }
-    save_statuses(statuses)
+    with stage("status_write"):
+        _write_status(file_id, status)
+
+
+def _write_status(file_id: str, status: str):
+    conn = _connect()
+    timestamp = _now()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.execute(
+            "INSERT INTO file_status VALUES (?, ?, ?) "
+            "ON CONFLICT (file_id) DO UPDATE SET status = excluded.status, timestamp = excluded.timestamp",
+            (file_id, status, timestamp),
+        )
+        conn.execute(
+            "INSERT INTO status_history (file_id, status, timestamp) VALUES (?, ?, ?)",
+            (file_id, status, timestamp),
+        )
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
 
 def get_status(file_id: str):
-    statuses = load_statuses()
-    return statuses.get(file_id, {
-        "status": "not_found",
-        "timestamp": None
-    })
\ No newline at end of file
+    row = _connect().execute(
+        "SELECT status, timestamp FROM file_status WHERE file_id = ?", (file_id,)
+    ).fetchone()
+    if row is None:
+        return {
+            "status": "not_found",
+            "timestamp": None
+        }
+    return {"status": row[0], "timestamp": row[1]}
+
+
+def get_history(file_id: str) -> list[dict]:
+    rows = _connect().execute(
+        "SELECT status, timestamp FROM status_history WHERE file_id = ? ORDER BY id", (file_id,)
+    ).fetchall()
+    return [{"status": status, "timestamp": timestamp} for status, timestamp in rows]
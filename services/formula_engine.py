@@ -0,0 +1,900 @@
+import json
+import operator
+import os
+import re
+import threading
+from dataclasses import dataclass, field
+import numpy as np
+import pandas as pd
+
+from exceptions import ExcelOperationError, InvalidActionSchema
+from services.cell_patch import patch_cells
+from services.dtype_optimizer import optimize_column
+from services.frame_versions import CellDelta, ColumnDelta, CompositeDelta
+
+# Computed columns: {"operation": "add_column", "column": "Margin",
+# "formula": "=IF([@Sales]>0, [@Profit]/[@Sales], 0)"} adds (or redefines) a
+# column whose values come from an Excel-style formula. The formula is parsed
+# once and evaluated over whole columns with NumPy/pandas, never cell by cell.
+#
+# References, with row 1 as the header and row 2 the first data row:
+#   [@Sales], [@[Order Date]], Sales   the value in the same row
+#   C2, $C2                            same row of column C (relative refs must point at row 2)
+#   $C$5, C$5                          one fixed cell
+#   [Sales], C:C, C2:C100, A:C         a range (SUM/AVERAGE/MIN/MAX/COUNT, VLOOKUP/XLOOKUP tables)
+#
+# Operators + - * / ^ & % and comparisons; functions in _FUNCTIONS. Errors
+# (#DIV/0!, #N/A, ...) become missing values, which IFERROR replaces.
+#
+# Each file's formulas live in uploads/{file_id}.formulas.json and form a
+# dependency graph. After any edit, recalculate() recomputes the computed
+# columns that read a changed column: only the changed rows when the column is
+# read row by row, the whole column when it is read as a range (a SUM, a
+# lookup table) or rows moved. Computed values are part of the same version
+# as the edit, so undo and journal replay need no recalculation. Computed
+# columns can't be edited directly; redefine them instead.
+
+UPLOAD_DIR = "uploads"
+# More changed rows than this are recomputed as a whole column
+INCREMENTAL_MAX_ROWS = int(os.getenv("EXCELSIOR_FORMULA_INCREMENTAL_ROWS", 10_000))
+FIRST_ROW = 2   # the sheet row holding df row 0
+
+# name: (min args, max args or None, argument positions read as ranges: "all" or a set)
+_FUNCTIONS = {
+    "IF": (2, 3, ()), "IFERROR": (2, 2, ()), "AND": (1, None, ()), "OR": (1, None, ()),
+    "NOT": (1, 1, ()), "ISBLANK": (1, 1, ()),
+    "ABS": (1, 1, ()), "INT": (1, 1, ()), "MOD": (2, 2, ()), "ROUND": (1, 2, ()),
+    "SUM": (1, None, "all"), "AVERAGE": (1, None, "all"), "MIN": (1, None, "all"),
+    "MAX": (1, None, "all"), "COUNT": (1, None, "all"),
+    "LEN": (1, 1, ()), "UPPER": (1, 1, ()), "LOWER": (1, 1, ()), "TRIM": (1, 1, ()),
+    "LEFT": (1, 2, ()), "RIGHT": (1, 2, ()), "MID": (3, 3, ()), "SUBSTITUTE": (3, 3, ()),
+    "CONCAT": (1, None, ()), "CONCATENATE": (1, None, ()),
+    "VLOOKUP": (3, 4, {1}), "XLOOKUP": (3, 4, {1, 2}),
+}
+
+_TOKEN = re.compile(r"""\s*(?:
+      (?P<number>(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?)
+    | (?P<string>"(?:[^"]|"")*")
+    | (?P<field>\[@?(?:\[[^\]]+\]|[^\[\]]+)\])
+    | (?P<colrange>\$?[A-Za-z]{1,3}:\$?[A-Za-z]{1,3}(?![\w(]))
+    | (?P<cell>\$?[A-Za-z]{1,3}\$?\d+(?![\w(]))
+    | (?P<name>[A-Za-z_][A-Za-z0-9_.]*)
+    | (?P<op><>|<=|>=|[-+*/^&=<>%(),;:])
+    )""", re.X)
+_CELL = re.compile(r"(\$?)([A-Za-z]{1,3})(\$?)(\d+)")
+
+_COMPARE = {"=": operator.eq, "<>": operator.ne, "<": operator.lt, ">": operator.gt,
+            "<=": operator.le, ">=": operator.ge}
+_PRECEDENCE = {**{op: 1 for op in _COMPARE}, "&": 2, "+": 3, "-": 3, "*": 4, "/": 4, "^": 5}
+
+
+# -- syntax tree ----------------------------------------------------------------
+
+@dataclass(frozen=True)
+class Lit:
+    value: object
+
+
+@dataclass(frozen=True)
+class Ref:
+    column: str
+    mode: str = "row"     # "row"; "either" until resolved: [Sales] is a range inside SUM, the row elsewhere
+
+
+@dataclass(frozen=True)
+class Cell:
+    column: str
+    row: int              # df row position
+
+
+@dataclass(frozen=True)
+class Area:
+    columns: tuple
+    start: int | None = None   # df row positions, stop exclusive
+    stop: int | None = None
+
+
+@dataclass(frozen=True)
+class Unary:
+    op: str
+    operand: object
+
+
+@dataclass(frozen=True)
+class Binary:
+    op: str
+    left: object
+    right: object
+
+
+@dataclass(frozen=True)
+class Call:
+    name: str
+    args: tuple
+
+
+def _tokenize(text: str) -> list[tuple[str, str]]:
+    tokens, pos = [], 0
+    text = text.strip()
+    if text.startswith("="):
+        pos = 1
+    while pos < len(text):
+        match = _TOKEN.match(text, pos)
+        if match is None or match.end() == pos:
+            if not text[pos:].strip():
+                break
+            raise InvalidActionSchema(f"Unexpected '{text[pos:].strip()[:10]}' in formula")
+        pos = match.end()
+        tokens.append((match.lastgroup, match.group(match.lastgroup)))
+    return tokens
+
+
+class _Parser:
+    def __init__(self, text: str, columns: list[str]):
+        self.tokens = _tokenize(text)
+        self.pos = 0
+        self.columns = columns
+        self.lookup = {str(c).casefold(): c for c in columns}
+
+    def peek(self) -> tuple[str | None, str | None]:
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else (None, None)
+
+    def take(self, value: str | None = None) -> tuple[str, str]:
+        kind, text = self.peek()
+        if kind is None or (value is not None and text != value):
+            raise InvalidActionSchema(f"Expected '{value}' in formula" if value else "Formula ends too early")
+        self.pos += 1
+        return kind, text
+
+    def parse(self):
+        if not self.tokens:
+            raise InvalidActionSchema("Empty formula")
+        node = self.expression(1)
+        if self.pos < len(self.tokens):
+            raise InvalidActionSchema(f"Unexpected '{self.tokens[self.pos][1]}' in formula")
+        return node
+
+    def expression(self, level: int):
+        left = self.unary()
+        while True:
+            kind, text = self.peek()
+            if kind != "op" or _PRECEDENCE.get(text, 0) < level:
+                return left
+            self.pos += 1
+            # ^ and everything else are left-associative in Excel
+            left = Binary(text, left, self.expression(_PRECEDENCE[text] + 1))
+
+    def unary(self):
+        kind, text = self.peek()
+        if kind == "op" and text in "+-":
+            self.pos += 1
+            operand = self.unary()
+            return Unary("-", operand) if text == "-" else operand
+        node = self.primary()
+        while self.peek() == ("op", "%"):
+            self.pos += 1
+            node = Binary("/", node, Lit(100.0))
+        return node
+
+    def primary(self):
+        kind, text = self.take()
+        if kind == "number":
+            return Lit(float(text))
+        if kind == "string":
+            return Lit(text[1:-1].replace('""', '"'))
+        if kind == "op" and text == "(":
+            node = self.expression(1)
+            self.take(")")
+            return node
+        if kind == "field":
+            return self.field(text)
+        if kind == "colrange":
+            first, last = text.replace("$", "").split(":")
+            return Area(self.span(first, last))
+        if kind == "cell":
+            return self.cell(text)
+        if kind == "name":
+            return self.name(text)
+        raise InvalidActionSchema(f"Unexpected '{text}' in formula")
+
+    def column(self, name: str) -> str:
+        column = self.lookup.get(name.casefold())
+        if column is None:
+            raise InvalidActionSchema(f"Column '{name}' not found in Excel sheet.")
+        return column
+
+    def letter(self, letters: str) -> int:
+        index = 0
+        for ch in letters.upper():
+            index = index * 26 + ord(ch) - 64
+        if index > len(self.columns):
+            raise InvalidActionSchema(f"Column {letters.upper()} is outside the sheet ({len(self.columns)} columns)")
+        return index - 1
+
+    def span(self, first: str, last: str) -> tuple:
+        lo, hi = sorted((self.letter(first), self.letter(last)))
+        return tuple(self.columns[lo:hi + 1])
+
+    def field(self, text: str):
+        inner = text[1:-1]
+        at = inner.startswith("@")
+        inner = inner.lstrip("@")
+        if inner.startswith("[") and inner.endswith("]"):
+            inner = inner[1:-1]
+        ref = Ref(self.column(inner), "row" if at else "either")
+        if not at and self.peek() == ("op", ":"):
+            self.pos += 1
+            _, other = self.take()
+            end = self.column(other.strip("[]@"))
+            lo, hi = sorted((self.columns.index(ref.column), self.columns.index(end)))
+            return Area(tuple(self.columns[lo:hi + 1]))
+        return ref
+
+    def cell(self, text: str):
+        _, letters, fixed_row, row = _CELL.fullmatch(text).groups()
+        column, row = self.columns[self.letter(letters)], int(row)
+        if self.peek() == ("op", ":"):
+            self.pos += 1
+            kind, other = self.take()
+            match = _CELL.fullmatch(other) if kind == "cell" else None
+            if match is None:
+                raise InvalidActionSchema(f"Bad range '{text}:{other}'")
+            end_row = int(match.group(4))
+            lo, hi = sorted((row, end_row))
+            return Area(self.span(letters, match.group(2)), max(lo - FIRST_ROW, 0), hi - FIRST_ROW + 1)
+        if fixed_row:
+            if row < FIRST_ROW:
+                raise InvalidActionSchema(f"{text} is the header row")
+            return Cell(column, row - FIRST_ROW)
+        if row != FIRST_ROW:
+            raise InvalidActionSchema(f"Relative reference {text}: write it for row {FIRST_ROW} "
+                                      f"(e.g. {letters.upper()}{FIRST_ROW}), or use ${letters.upper()}${row} for a fixed cell")
+        return Ref(column)
+
+    def name(self, text: str):
+        upper = text.upper()
+        if self.peek() == ("op", "("):
+            self.pos += 1
+            if upper not in _FUNCTIONS:
+                raise InvalidActionSchema(f"Unsupported function {upper}()")
+            args = []
+            if self.peek() != ("op", ")"):
+                while True:
+                    args.append(self.expression(1))
+                    if self.peek() in {("op", ","), ("op", ";")}:
+                        self.pos += 1
+                        continue
+                    break
+            self.take(")")
+            low, high, _ = _FUNCTIONS[upper]
+            if len(args) < low or (high is not None and len(args) > high):
+                raise InvalidActionSchema(f"{upper}() takes {low}{'' if high == low else '+' if high is None else f'-{high}'} arguments")
+            return Call(upper, tuple(args))
+        if upper in {"TRUE", "FALSE"}:
+            return Lit(upper == "TRUE")
+        return Ref(self.column(text), "either")
+
+
+def _resolve(node, as_range: bool = False):
+    """Settle [Sales]-style references by where they appear; reject ranges outside range arguments."""
+    if isinstance(node, Ref) and node.mode == "either":
+        return Area((node.column,)) if as_range else Ref(node.column)
+    if isinstance(node, Area) and not as_range:
+        raise InvalidActionSchema("A range can only be used inside SUM, AVERAGE, MIN, MAX, COUNT, VLOOKUP or XLOOKUP")
+    if isinstance(node, Unary):
+        return Unary(node.op, _resolve(node.operand))
+    if isinstance(node, Binary):
+        return Binary(node.op, _resolve(node.left), _resolve(node.right))
+    if isinstance(node, Call):
+        ranges = _FUNCTIONS[node.name][2]
+        args = tuple(_resolve(arg, ranges == "all" or i in ranges) for i, arg in enumerate(node.args))
+        for i in () if ranges == "all" else ranges:
+            if i < len(args) and not isinstance(args[i], Area):
+                raise InvalidActionSchema(f"Argument {i + 1} of {node.name}() must be a range")
+        if node.name == "XLOOKUP" and (len(args[1].columns) != 1 or len(args[2].columns) != 1):
+            raise InvalidActionSchema("XLOOKUP() takes single-column ranges")
+        return Call(node.name, args)
+    return node
+
+
+def _references(node, inputs: set, ranges: set):
+    if isinstance(node, Ref):
+        inputs.add(node.column)
+    elif isinstance(node, Cell):
+        ranges.add(node.column)
+    elif isinstance(node, Area):
+        ranges.update(node.columns)
+    elif isinstance(node, Unary):
+        _references(node.operand, inputs, ranges)
+    elif isinstance(node, Binary):
+        _references(node.left, inputs, ranges)
+        _references(node.right, inputs, ranges)
+    elif isinstance(node, Call):
+        for arg in node.args:
+            _references(arg, inputs, ranges)
+
+
+@dataclass
+class Formula:
+    column: str
+    text: str
+    columns: list                  # the sheet's columns when defined: A1 references resolve against these
+    tree: object = field(repr=False)
+    inputs: frozenset              # columns read in the same row
+    ranges: frozenset              # columns read whole: ranges, lookup tables, fixed cells
+
+    @property
+    def depends_on(self) -> frozenset:
+        return self.inputs | self.ranges
+
+    def describe(self) -> dict:
+        return {"column": self.column, "formula": self.text,
+                "inputs": sorted(map(str, self.inputs)), "ranges": sorted(map(str, self.ranges))}
+
+
+def compile_formula(text: str, columns: list[str], column: str | None = None) -> Formula:
+    """Parse `text` against the sheet's `columns`. Raises InvalidActionSchema for anything unsupported."""
+    if not isinstance(text, str):
+        raise InvalidActionSchema("'formula' must be a string")
+    tree = _resolve(_Parser(text, list(columns)).parse())
+    inputs, ranges = set(), set()
+    _references(tree, inputs, ranges)
+    return Formula(column, text, list(columns), tree, frozenset(inputs), frozenset(ranges))
+
+
+# -- evaluation -----------------------------------------------------------------
+#
+# A value is a scalar or a pd.Series with one entry per evaluated row.
+
+_EXCEL_EPOCH = pd.Timestamp("1899-12-30")
+
+
+class _Env:
+    def __init__(self, df: pd.DataFrame, rows: np.ndarray | None = None):
+        self.df, self.rows = df, rows
+        self.n = len(df) if rows is None else len(rows)
+        self._ranges = {}
+
+    def row(self, column: str) -> pd.Series:
+        col = self.df[column]
+        return _plain(col if self.rows is None else col.take(self.rows))
+
+    def range(self, area: Area) -> list[pd.Series]:
+        # Whole-column reads are shared by every function in this evaluation
+        if area not in self._ranges:
+            self._ranges[area] = [_plain(self.df[c].iloc[area.start:area.stop]) for c in area.columns]
+        return self._ranges[area]
+
+
+def _plain(col: pd.Series) -> pd.Series:
+    if isinstance(col.dtype, pd.CategoricalDtype):
+        return pd.Series(np.asarray(col, dtype=object))
+    if pd.api.types.is_datetime64_any_dtype(col.dtype):
+        # Dates as Excel serial numbers, so date arithmetic works
+        return (col.reset_index(drop=True) - _EXCEL_EPOCH) / pd.Timedelta(days=1)
+    return col.reset_index(drop=True)
+
+
+def _is_series(value) -> bool:
+    return isinstance(value, pd.Series)
+
+
+def _missing(value) -> bool:
+    return value is None or (isinstance(value, float) and np.isnan(value))
+
+
+def _is_text(value) -> bool:
+    if _is_series(value):
+        return not (pd.api.types.is_numeric_dtype(value.dtype) or pd.api.types.is_bool_dtype(value.dtype))
+    return isinstance(value, str)
+
+
+def _num(value):
+    if _is_series(value):
+        if pd.api.types.is_bool_dtype(value.dtype) or pd.api.types.is_numeric_dtype(value.dtype):
+            return value.astype(np.float64)
+        return pd.to_numeric(value, errors="coerce").astype(np.float64)
+    if isinstance(value, str):
+        try:
+            return float(value)
+        except ValueError:
+            return np.nan
+    return np.nan if value is None else float(value)
+
+
+def _format(value) -> str:
+    if _missing(value):
+        return ""
+    if isinstance(value, (bool, np.bool_)):
+        return "TRUE" if value else "FALSE"
+    if isinstance(value, (float, np.floating)) and float(value).is_integer():
+        return str(int(value))
+    return str(value)
+
+
+def _text(value):
+    """As Excel shows it: 2.0 -> "2", TRUE -> "TRUE", blank -> ""."""
+    if _is_series(value):
+        if pd.api.types.is_string_dtype(value.dtype) and (not pd.api.types.is_object_dtype(value.dtype)
+                                                          or pd.api.types.infer_dtype(value) in {"string", "empty"}):
+            return value.astype(object).where(value.notna(), "")
+        return value.map(_format).astype(object)
+    return _format(value)
+
+
+def _truth(value):
+    if _is_series(value):
+        if pd.api.types.is_bool_dtype(value.dtype):
+            return value.fillna(False).astype(bool)
+        if _is_text(value):
+            return _text(value).str.upper() == "TRUE"
+        return _num(value).fillna(0) != 0
+    if isinstance(value, str):
+        return value.upper() == "TRUE"
+    return not _missing(value) and bool(value)
+
+
+def _column(value, n: int) -> pd.Series:
+    return value if _is_series(value) else pd.Series([value] * n if isinstance(value, str) else np.full(n, value))
+
+
+def _blend(a: pd.Series, b: pd.Series) -> tuple[pd.Series, pd.Series]:
+    # One dtype both branches of an IF fit: numbers stay numbers, anything else is object
+    numeric = [not _is_text(s) and not pd.api.types.is_bool_dtype(s.dtype) for s in (a, b)]
+    if all(numeric):
+        return a.astype(np.float64), b.astype(np.float64)
+    if a.dtype == b.dtype:
+        return a, b
+    return a.astype(object), b.astype(object)
+
+
+def _choose(cond, a, b, n: int):
+    if not _is_series(cond):
+        return a if cond else b
+    a, b = _blend(_column(a, n), _column(b, n))
+    return a.where(cond.to_numpy(), b)
+
+
+def _arith(op: str, left, right):
+    a, b = _num(left), _num(right)
+    if op == "+":
+        out = a + b
+    elif op == "-":
+        out = a - b
+    elif op == "*":
+        out = a * b
+    elif op == "/":
+        out = a / b
+    else:
+        out = a ** b
+    if _is_series(out):
+        return out.replace([np.inf, -np.inf], np.nan)
+    return np.nan if np.isinf(out) else out
+
+
+def _compare(op: str, left, right):
+    if _is_text(left) or _is_text(right):
+        # Text compares case-insensitively, as in Excel
+        a, b = _text(left), _text(right)
+        a = a.str.casefold() if _is_series(a) else a.casefold()
+        b = b.str.casefold() if _is_series(b) else b.casefold()
+    else:
+        a, b = _num(left), _num(right)
+    out = _COMPARE[op](a, b)
+    return out.astype(bool) if _is_series(out) else bool(out)
+
+
+def _str_map(value, fn):
+    """fn(series.str accessor) over a value's text, for scalars too."""
+    text = _text(value)
+    if _is_series(text):
+        return fn(text.str)
+    return fn(pd.Series([text], dtype=object).str).iloc[0]
+
+
+def _count(value, default: int = 1):
+    count = _num(value)
+    if _is_series(count):
+        raise ExcelOperationError("Character counts must be single values")
+    return default if np.isnan(count) else max(int(count), 0)
+
+
+def _round(value, digits):
+    scale = 10.0 ** _num(digits)
+    x = _num(value)
+    # Half away from zero, like Excel (NumPy rounds half to even)
+    return np.sign(x) * np.floor(np.abs(x) * scale + 0.5) / scale
+
+
+def _reduce(name: str, args: tuple, env: _Env):
+    values = []     # flat arrays from ranges and single values
+    rows = []       # per-row operands
+    for arg in args:
+        if isinstance(arg, Area):
+            values.extend(_num(col).to_numpy() for col in env.range(arg))
+            continue
+        value = _eval(arg, env)
+        if _is_series(value):
+            rows.append(_num(value).to_numpy())
+        else:
+            values.append(np.atleast_1d(_num(value)))
+    flat = np.concatenate(values) if values else np.empty(0)
+    total, count = np.nansum(flat), np.count_nonzero(~np.isnan(flat))
+    lo = np.nanmin(flat) if count else np.nan
+    hi = np.nanmax(flat) if count else np.nan
+    if rows:
+        stack = np.column_stack(rows)
+        total = np.nansum(stack, axis=1) + total
+        count = np.count_nonzero(~np.isnan(stack), axis=1) + count
+        lo = np.fmin(np.fmin.reduce(stack, axis=1), lo)
+        hi = np.fmax(np.fmax.reduce(stack, axis=1), hi)
+    with np.errstate(all="ignore"):
+        result = {"SUM": total, "COUNT": count, "AVERAGE": total / np.where(count == 0, np.nan, count),
+                  "MIN": np.where(np.isnan(lo), 0.0, lo), "MAX": np.where(np.isnan(hi), 0.0, hi)}[name]
+    if rows:
+        return pd.Series(np.asarray(result, dtype=np.float64))
+    return float(result)
+
+
+def _keys(value):
+    if _is_text(value):
+        return _text(value).str.casefold() if _is_series(value) else _text(value).casefold()
+    return _num(value)
+
+
+def _lookup(key, table: pd.Series, results: pd.Series, exact: bool, n: int):
+    keys = _keys(table).reset_index(drop=True)
+    results = results.reset_index(drop=True)
+    wanted = _column(_keys(key), n)
+    if exact:
+        # The first row holding each key, as Excel's exact match returns
+        first = np.flatnonzero(~keys.duplicated().to_numpy())
+        hits = pd.Index(keys.iloc[first]).get_indexer(wanted)
+        positions = np.where(hits >= 0, first[np.maximum(hits, 0)], -1)
+    else:
+        # Approximate match: the last key <= the value, with the table sorted ascending
+        positions = np.searchsorted(keys.to_numpy(), wanted.to_numpy(), side="right") - 1
+    found = (positions >= 0) & wanted.notna().to_numpy()
+    if not len(results):
+        out = pd.Series(np.full(len(wanted), np.nan))
+    else:
+        out = results.take(np.where(found, positions, 0)).reset_index(drop=True)
+        if not found.all():
+            out = out.where(found)
+    return out if _is_series(key) else out.iloc[0]
+
+
+def _call(node: Call, env: _Env):
+    name, args = node.name, node.args
+    if name in {"SUM", "AVERAGE", "MIN", "MAX", "COUNT"}:
+        return _reduce(name, args, env)
+    if name == "VLOOKUP":
+        area = args[1]
+        index = _num(_eval(args[2], env))
+        if _is_series(index) or not 1 <= index <= len(area.columns):
+            raise ExcelOperationError(f"VLOOKUP column index must be 1-{len(area.columns)}")
+        table = env.range(area)
+        exact = len(args) == 4 and not _truth(_eval(args[3], env))
+        return _lookup(_eval(args[0], env), table[0], table[int(index) - 1], exact, env.n)
+    if name == "XLOOKUP":
+        found = _lookup(_eval(args[0], env), env.range(args[1])[0], env.range(args[2])[0], True, env.n)
+        if len(args) == 4:
+            fallback = _eval(args[3], env)
+            if _is_series(found):
+                return _choose(found.isna(), fallback, found, env.n)
+            return fallback if _missing(found) else found
+        return found
+
+    values = [_eval(arg, env) for arg in args]
+    if name == "IF":
+        return _choose(_truth(values[0]), values[1], values[2] if len(values) > 2 else False, env.n)
+    if name == "IFERROR":
+        value = values[0]
+        if _is_series(value):
+            return _choose(value.isna(), values[1], value, env.n)
+        return values[1] if _missing(value) else value
+    if name in {"AND", "OR"}:
+        truths = [_truth(v) for v in values]
+        out = truths[0]
+        for t in truths[1:]:
+            out = (out & t) if name == "AND" else (out | t)
+        return out
+    if name == "NOT":
+        t = _truth(values[0])
+        return ~t if _is_series(t) else not t
+    if name == "ISBLANK":
+        v = values[0]
+        return v.isna() if _is_series(v) else _missing(v)
+    if name == "ABS":
+        return abs(_num(values[0]))
+    if name == "INT":
+        return np.floor(_num(values[0]))
+    if name == "MOD":
+        return _arith("-", values[0], _arith("*", values[1], np.floor(_arith("/", values[0], values[1]))))
+    if name == "ROUND":
+        return _round(values[0], values[1] if len(values) > 1 else 0.0)
+    if name == "LEN":
+        return _num(_str_map(values[0], lambda s: s.len()))
+    if name in {"UPPER", "LOWER"}:
+        return _str_map(values[0], lambda s: s.upper() if name == "UPPER" else s.lower())
+    if name == "TRIM":
+        return _str_map(values[0], lambda s: s.strip().str.replace(r" {2,}", " ", regex=True))
+    if name == "LEFT":
+        n = _count(values[1]) if len(values) > 1 else 1
+        return _str_map(values[0], lambda s: s[:n])
+    if name == "RIGHT":
+        n = _count(values[1]) if len(values) > 1 else 1
+        return _str_map(values[0], lambda s: s[-n:] if n else s[:0])
+    if name == "MID":
+        start, n = _count(values[1]), _count(values[2])
+        if start < 1:
+            raise ExcelOperationError("MID start must be at least 1")
+        return _str_map(values[0], lambda s: s[start - 1:start - 1 + n])
+    if name == "SUBSTITUTE":
+        old, new = _text(values[1]), _text(values[2])
+        if _is_series(old) or _is_series(new):
+            raise ExcelOperationError("SUBSTITUTE text to find and replace must be single values")
+        return _str_map(values[0], lambda s: s.replace(old, new, regex=False) if old else s[:])
+    # CONCAT / CONCATENATE
+    out = _text(values[0])
+    for v in values[1:]:
+        out = out + _text(v)
+    return out
+
+
+def _eval(node, env: _Env):
+    if isinstance(node, Lit):
+        return node.value
+    if isinstance(node, Ref):
+        return env.row(node.column)
+    if isinstance(node, Cell):
+        col = env.df[node.column]
+        return _plain(col.iloc[node.row:node.row + 1]).iloc[0] if node.row < len(col) else None
+    if isinstance(node, Unary):
+        return -_num(_eval(node.operand, env))
+    if isinstance(node, Binary):
+        left, right = _eval(node.left, env), _eval(node.right, env)
+        if node.op in _COMPARE:
+            return _compare(node.op, left, right)
+        if node.op == "&":
+            return _text(left) + _text(right)
+        return _arith(node.op, left, right)
+    return _call(node, env)
+
+
+def evaluate(formula: Formula, df: pd.DataFrame, rows: np.ndarray | None = None) -> pd.Series:
+    """The formula's values for `rows` of df (every row when None), as one column."""
+    env = _Env(df, rows)
+    try:
+        with np.errstate(all="ignore"):
+            value = _eval(formula.tree, env)
+    except (TypeError, ValueError) as e:
+        raise ExcelOperationError(f"Cannot evaluate {formula.text}: {e}")
+    out = _column(value, env.n)
+    if pd.api.types.is_bool_dtype(out.dtype):
+        return out.astype(bool)
+    if not _is_text(out):
+        return out.astype(np.float64)
+    return out.astype(object).where(out.notna(), None)
+
+
+def _filled(formula: Formula, df: pd.DataFrame) -> pd.Series:
+    # Stored like an ingested column: low-cardinality text (IF(..., "high", "low"))
+    # becomes categorical, where a one-row recalculation rewrites a code, not the text
+    values = evaluate(formula, df).set_axis(df.index)
+    if values.dtype == object and pd.api.types.infer_dtype(values, skipna=True) == "string":
+        values = values.astype("str")
+    return optimize_column(values)
+
+
+# -- registry and dependency graph ------------------------------------------------
+
+_registries: dict[str, tuple[int | None, dict]] = {}   # file_id -> (sidecar mtime, {column: Formula})
+_lock = threading.Lock()
+
+
+def _path(file_id: str) -> str:
+    return os.path.join(UPLOAD_DIR, f"{file_id}.formulas.json")
+
+
+def formulas(file_id: str) -> dict[str, Formula]:
+    """The file's computed columns, {column: Formula} in definition order. Re-read when the sidecar changes."""
+    path = _path(file_id)
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        mtime = None
+    with _lock:
+        cached = _registries.get(file_id)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+    registry = {}
+    if mtime is not None:
+        with open(path) as f:
+            for item in json.load(f):
+                try:
+                    registry[item["column"]] = compile_formula(item["formula"], item["columns"], item["column"])
+                except InvalidActionSchema as e:
+                    print(f"[FORMULA] {file_id}: dropped '{item['column']}': {e.message}")
+    with _lock:
+        _registries[file_id] = (mtime, registry)
+    return registry
+
+
+def _save(file_id: str, registry: dict[str, Formula]):
+    path = _path(file_id)
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump([{"column": f_.column, "formula": f_.text, "columns": f_.columns} for f_ in registry.values()], f)
+    os.replace(tmp, path)
+    with _lock:
+        _registries[file_id] = (os.stat(path).st_mtime_ns, registry)
+
+
+def order(registry: dict[str, Formula]) -> list[str]:
+    """Computed columns with every column after the ones it reads. Raises InvalidActionSchema on a cycle."""
+    done, visiting, out = set(), [], []
+
+    def visit(column):
+        if column in done:
+            return
+        if column in visiting:
+            cycle = visiting[visiting.index(column):] + [column]
+            raise InvalidActionSchema(f"Circular reference: {' -> '.join(map(str, cycle))}")
+        visiting.append(column)
+        for dep in registry[column].depends_on:
+            if dep in registry:
+                visit(dep)
+        visiting.pop()
+        done.add(column)
+        out.append(column)
+
+    for column in registry:
+        visit(column)
+    return out
+
+
+def active(file_id: str, df: pd.DataFrame) -> dict[str, Formula]:
+    # A formula whose column is gone (its add_column was undone) is dormant until the column returns
+    return {c: f for c, f in formulas(file_id).items() if c in df.columns}
+
+
+def describe(file_id: str, df: pd.DataFrame) -> dict:
+    registry = active(file_id, df)
+    items = []
+    for column in order(registry):
+        item = registry[column].describe()
+        item["dependents"] = sorted(str(c) for c, f in registry.items() if column in f.depends_on)
+        items.append(item)
+    return {"formulas": items}
+
+
+def _define(file_id: str, column: str, formula: Formula | None):
+    registry = dict(formulas(file_id))
+    if formula is None:
+        registry.pop(column, None)
+    else:
+        registry[column] = formula
+    _save(file_id, registry)
+
+
+@dataclass
+class Definition:
+    """The formula step of an add_column version: leaves the frame alone, swaps the definition on undo/redo."""
+    column: str
+    old: Formula | None
+    new: Formula
+    kind: str = "formula"
+
+    def apply(self, df: pd.DataFrame) -> pd.DataFrame:
+        return df
+
+    def revert(self, df: pd.DataFrame) -> pd.DataFrame:
+        return df
+
+    def settle(self, file_id: str, reverted: bool):
+        # Also on commit: the sidecar only changes once the version is stored and journalled
+        _define(file_id, self.column, self.old if reverted else self.new)
+
+
+def add_column(file_id: str, df: pd.DataFrame, action: dict) -> tuple[pd.DataFrame, object]:
+    """Define (or redefine) a computed column and fill it; returns the new frame and its delta."""
+    column = action["column"]
+    registry = formulas(file_id)
+    if column in df.columns and column not in registry:
+        raise InvalidActionSchema(f"Column '{column}' already exists; add the formula under a new name.")
+    formula = compile_formula(action["formula"], df.columns.tolist(), column)
+    order({**registry, column: formula})   # no cycles
+
+    out = df.copy(deep=False)
+    out[column] = _filled(formula, df)
+    out, delta = recalculate(file_id, df, out, ColumnDelta.capture(df, out, column), defining=formula)
+    steps = delta.deltas if isinstance(delta, CompositeDelta) else [delta]
+    return out, CompositeDelta([Definition(column, registry.get(column), formula), *steps], kind="add_column")
+
+
+def plan(file_id: str, df: pd.DataFrame, action: dict) -> dict:
+    """Dry run of an add_column action: what it computes from and what it would recalculate."""
+    registry = formulas(file_id)
+    formula = compile_formula(action["formula"], df.columns.tolist(), action["column"])
+    order({**registry, action["column"]: formula})
+    dependents = sorted(str(c) for c, f in active(file_id, df).items() if action["column"] in f.depends_on)
+    return {"rows": len(df), "submitted": 1, "dropped": [],
+            "steps": [{"operation": "add_column", **formula.describe(), "dependents": dependents,
+                       "estimated_rows": len(df)}]}
+
+
+def _changes(delta) -> tuple[dict, bool]:
+    # ({column: changed row positions, or None for all of them}, whether rows moved)
+    if delta.kind == "cells":
+        return {c: np.asarray(rows) for c, (rows, *_) in delta.changes.items()}, False
+    if delta.kind == "column":
+        return {delta.column: None}, False
+    if delta.kind == "rows":
+        return {}, True
+    changed, moved = {}, False
+    for part in delta.deltas:
+        inner, inner_moved = _changes(part)
+        changed.update(dict.fromkeys(inner))   # positions shift between steps
+        moved |= inner_moved
+    return changed, moved
+
+
+def recalculate(file_id: str, before: pd.DataFrame, after: pd.DataFrame, delta,
+                defining: Formula | None = None) -> tuple[pd.DataFrame, object]:
+    """
+    Bring the computed columns up to date with the edit `delta` (before ->
+    after). Returns the final frame and one delta covering the edit plus the
+    recalculation; a cell edit whose dependents were patched row by row stays
+    a single CellDelta. `defining` is the formula an add_column is about to
+    define: its column is already filled, and it counts as defined for the
+    columns that read it.
+    """
+    registry = active(file_id, after)
+    defined = None
+    if defining is not None:
+        registry = {**registry, defining.column: defining}
+        defined = defining.column
+    if not registry:
+        return after, delta
+    changed, moved = _changes(delta)
+    for column in changed:
+        if column in registry and column != defined:
+            raise ExcelOperationError(f"Column '{column}' is computed by {registry[column].text}; "
+                                      f"edit its inputs or redefine it with add_column.")
+
+    current, steps = after, []
+    for column in order(registry):
+        if column == defined:
+            continue
+        formula = registry[column]
+        hits = [changed[c] for c in formula.inputs if c in changed]
+        full = (moved and formula.ranges) or any(c in changed for c in formula.ranges) \
+            or any(rows is None for rows in hits)
+        rows = None
+        if not full:
+            if not hits:
+                continue
+            rows = np.unique(np.concatenate(hits))
+            full = len(rows) > INCREMENTAL_MAX_ROWS
+        if full:
+            new = current.copy(deep=False)
+            new[column] = _filled(formula, current)
+            steps.append(ColumnDelta.capture(current, new, column))
+            changed[column] = None
+        else:
+            values = evaluate(formula, current, rows).tolist()
+            new, touched = patch_cells(current, [{"row": r, "column": column, "value": v}
+                                                 for r, v in zip(rows.tolist(), values)])
+            steps.append(CellDelta.capture(current, new, touched))
+            changed[column] = rows
+        current = new
+
+    if not steps:
+        return after, delta
+    if isinstance(delta, CellDelta) and all(isinstance(step, CellDelta) for step in steps):
+        merged = dict(delta.changes)
+        for step in steps:
+            merged.update(step.changes)
+        return current, CellDelta(merged)
+    return current, CompositeDelta([delta, *steps])
@@ -1,35 +1,63 @@
-import json
-import os
-from openai import OpenAI
-from dotenv import load_dotenv
+from services.llm_client import complete_json
+from services.intent_parser import parse_intent, MIN_CONFIDENCE
+from services.metrics import stage
 
-load_dotenv()
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+MODEL = "gpt-3.5-turbo"
 
-def generate_excel_formula(prompt: str) -> dict:
-    system_msg = """
+# Which path produced each action: the local intent rules or the LLM
+source_counts = {"rules": 0, "llm": 0}
+
+SYSTEM_MSG = """
     You are an AI assistant for generating structured Excel modification instructions.
 
     Respond ONLY in JSON like the following:
     - For a sort: {"operation": "sort", "column": "Status", "order": "asc"}
     - For a filter: {"operation": "filter", "column": "Profit", "condition": {"operator": ">", "value": 300}}
+    - For a filter on several conditions: {"operation": "filter", "where": {"and": [{"column": "Region", "op": "in", "value": ["West", "East"]}, {"or": [{"column": "Profit", "op": ">", "value": 300}, {"column": "Status", "op": "contains", "value": "urgent"}]}]}}
+      ("where" supports and, or, not; ops ==, !=, >, <, >=, <=, in, not_in, between, contains, startswith, endswith, is_null, not_null)
     - For an update: {"operation": "update", "column": "Status", "value": "Complete"}
+    - For a summary: {"operation": "aggregate", "group_by": ["Region"], "pivot": "Status", "aggregations": [{"column": "Sales", "func": "sum"}, {"func": "count"}]}
+      (funcs sum, mean, count, min, max, nunique; "pivot" is optional and spreads one column's values across the result)
+    - For several steps in one go: {"operation": "pipeline", "steps": [{"operation": "filter", "column": "Region", "condition": {"operator": "==", "value": "West"}}, {"operation": "sort", "column": "Profit", "order": "desc"}, {"operation": "update", "column": "Status", "value": "Done"}]}
+      (steps are sort, filter or update actions, applied in order)
+    - For a computed column: {"operation": "add_column", "column": "Margin", "formula": "=IF([@Sales]>0, [@Profit]/[@Sales], 0)"}
+      (Excel syntax: [@Column] for the same row, [Column] or A:A for a whole column; + - * / ^ & and comparisons;
+      IF, IFERROR, AND, OR, NOT, ISBLANK, ABS, INT, MOD, ROUND, SUM, AVERAGE, MIN, MAX, COUNT, VLOOKUP, XLOOKUP,
+      LEN, UPPER, LOWER, TRIM, LEFT, RIGHT, MID, SUBSTITUTE, CONCAT)
 
+    Use only the column names listed with the instruction.
     Do NOT add explanations. Do NOT include markdown.
     Only return valid JSON.
     """
 
+
+def column_schema(df) -> list[list[str]]:
+    """[[name, dtype], ...] for the prompt and the response cache key."""
+    return [[str(col), str(dtype)] for col, dtype in df.dtypes.items()]
+
+
+async def generate_excel_formula(prompt: str, headers: list | None = None) -> dict:
+    user_msg = prompt
+    if headers:
+        columns = ", ".join(f"{name} ({dtype})" for name, dtype in headers)
+        user_msg = f"Instruction: {prompt}\nColumns: {columns}"
+
     try:
-        response = client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=[
-                {"role": "system", "content": system_msg},
-                {"role": "user", "content": prompt}
-            ]
-        )
-        content = response.choices[0].message.content.strip()
-        print("[LLM Raw Output]", content)
-        return json.loads(content)
+        with stage("llm_formula"):
+            return await complete_json(SYSTEM_MSG, user_msg, MODEL, schema=headers)
     except Exception as e:
         print("[LLM ERROR]", str(e))
-        return {"error": "Could not parse LLM response"}
\ No newline at end of file
+        return {"error": "Could not parse LLM response"}
+
+
+async def resolve_action(prompt: str, df) -> tuple[dict, str]:
+    """
+    (action, source) for `prompt` against df. Simple commands are parsed
+    locally; the LLM only sees prompts the rules can't answer confidently.
+    """
+    intent = parse_intent(prompt, df)
+    if intent is not None and intent.confidence >= MIN_CONFIDENCE:
+        source_counts["rules"] += 1
+        return intent.action, "rules"
+    source_counts["llm"] += 1
+    return await generate_excel_formula(prompt, column_schema(df)), "llm"
@@ -0,0 +1,197 @@
+import threading
+from dataclasses import dataclass
+from typing import Dict
+import numpy as np
+import pandas as pd
+
+from services.frame_versions import current_version, sort_order
+
+# Per-(file, column) sort permutations and value indexes for /sort and /filter.
+# Entries are tagged with the frame version they were built from; any mutation
+# bumps the version (see services/frame_versions), which makes them stale.
+
+RANGE_OPS = {">", "<", ">=", "<="}
+EQUALITY_OPS = {"==", "!="}
+
+
+@dataclass
+class HashIndex:
+    uniques: pd.Index     # distinct non-missing values
+    order: np.ndarray     # row positions grouped by value code, ascending within a group
+    starts: np.ndarray    # order[starts[c]:starts[c + 1]] are the rows holding uniques[c]
+    n_rows: int
+
+    @classmethod
+    def build(cls, col: pd.Series) -> "HashIndex":
+        codes, uniques = pd.factorize(col, use_na_sentinel=True)
+        order = np.argsort(codes, kind="stable")
+        counts = np.bincount(codes[codes >= 0], minlength=len(uniques))
+        n_missing = int((codes < 0).sum())
+        starts = np.concatenate([[n_missing], n_missing + np.cumsum(counts)])
+        return cls(pd.Index(uniques), order, starts, len(col))
+
+    def equal(self, value) -> np.ndarray:
+        code = self.uniques.get_indexer([value])[0]
+        if code < 0:
+            return np.empty(0, dtype=np.intp)
+        return self.order[self.starts[code]:self.starts[code + 1]]
+
+    def not_equal(self, value) -> np.ndarray:
+        keep = np.ones(self.n_rows, dtype=bool)
+        keep[self.equal(value)] = False
+        return np.flatnonzero(keep)
+
+
+@dataclass
+class SortedIndex:
+    perm: np.ndarray        # ascending stable order, missing values last
+    values: np.ndarray      # column values in `perm` order, missing values excluded
+
+    @classmethod
+    def build(cls, col: pd.Series, perm: np.ndarray) -> "SortedIndex":
+        n_valid = int(col.notna().sum())
+        return cls(perm, col.to_numpy()[perm[:n_valid]])
+
+    def range(self, op: str, value) -> np.ndarray:
+        n = len(self.values)
+        if op == ">":
+            lo, hi = np.searchsorted(self.values, value, side="right"), n
+        elif op == ">=":
+            lo, hi = np.searchsorted(self.values, value, side="left"), n
+        elif op == "<":
+            lo, hi = 0, np.searchsorted(self.values, value, side="left")
+        else:
+            lo, hi = 0, np.searchsorted(self.values, value, side="right")
+        # back to original row order, as a filter would return them
+        return np.sort(self.perm[lo:hi])
+
+
+# {(file_id, column, kind): (version, data)}
+_cache: Dict[tuple, tuple[int, object]] = {}
+_topn_seen: Dict[tuple, int] = {}   # (file_id, column, ascending) -> version of the last cold top-N
+_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0, "partial": 0}
+
+
+def _cached(file_id: str, column: str, kind, version: int, build):
+    key = (file_id, column, kind)
+    with _lock:
+        entry = _cache.get(key)
+        if entry is not None and entry[0] == version:
+            _stats["hits"] += 1
+            return entry[1]
+        _stats["misses"] += 1
+    data = build()
+    with _lock:
+        # anything built from an older version of this file is dead weight now
+        for stale in [k for k, (v, _) in _cache.items() if k[0] == file_id and v != version]:
+            del _cache[stale]
+        _cache[key] = (version, data)
+    return data
+
+
+def _top_n(col: pd.Series, ascending: bool, n: int) -> np.ndarray | None:
+    """
+    First `n` positions of a stable sort by `col` via partial selection, O(len)
+    instead of O(len log len). Only numeric columns; None means "do a full sort".
+    """
+    if not pd.api.types.is_numeric_dtype(col.dtype) or pd.api.types.is_bool_dtype(col.dtype):
+        return None
+    values = col.to_numpy(dtype=np.float64, na_value=np.nan)
+    valid = np.flatnonzero(~np.isnan(values))
+    keys = values[valid] if ascending else -values[valid]
+    if n >= len(keys):
+        picked = np.arange(len(keys))
+    else:
+        # everything strictly inside the cut, then the earliest rows tied at it
+        kth = np.partition(keys, n - 1)[n - 1]
+        inside = np.flatnonzero(keys < kth)
+        tied = np.flatnonzero(keys == kth)[: n - len(inside)]
+        picked = np.concatenate([inside, tied])
+    picked = picked[np.lexsort((picked, keys[picked]))]
+    positions = valid[picked]
+    if len(positions) < n:
+        missing = np.flatnonzero(np.isnan(values))[: n - len(positions)]
+        positions = np.concatenate([positions, missing])
+    return positions
+
+
+def sort_positions(file_id: str, df: pd.DataFrame, column: str, ascending: bool = True,
+                   limit: int | None = None) -> np.ndarray:
+    """
+    Row positions of `df` stably sorted by `column` (missing values last).
+    With `limit`, only the first `limit` positions are guaranteed: a cold
+    top-N uses partial selection, and the full permutation is built and cached
+    once the same sort is asked for again.
+    """
+    version = current_version(file_id)
+    key = (file_id, column, ("sort", ascending))
+    with _lock:
+        entry = _cache.get(key)
+        if entry is not None and entry[0] == version:
+            _stats["hits"] += 1
+            return entry[1] if limit is None else entry[1][:limit]
+        seen = _topn_seen.get(key[:2] + (ascending,))
+
+    if limit is not None and limit < len(df) and seen != version:
+        top = _top_n(df[column], ascending, limit)
+        if top is not None:
+            with _lock:
+                _topn_seen[key[:2] + (ascending,)] = version
+                _stats["partial"] += 1
+            return top
+
+    perm = _cached(file_id, column, ("sort", ascending), version,
+                   lambda: sort_order(df, column, ascending))
+    return perm if limit is None else perm[:limit]
+
+
+def filter_positions(file_id: str, df: pd.DataFrame, column: str, op: str, value) -> np.ndarray | None:
+    """
+    Row positions (in frame order) where `column op value` holds, answered from
+    a cached index. Returns None when the index can't answer (e.g. a value that
+    doesn't compare with the column); callers then fall back to a scan.
+    """
+    version = current_version(file_id)
+    col = df[column]
+    try:
+        if op in EQUALITY_OPS:
+            index = _cached(file_id, column, "hash", version, lambda: HashIndex.build(col))
+            return index.equal(value) if op == "==" else index.not_equal(value)
+        if op in RANGE_OPS:
+            perm = sort_positions(file_id, df, column, ascending=True)
+            index = _cached(file_id, column, "sorted", version, lambda: SortedIndex.build(col, perm))
+            return index.range(op, value)
+    except (TypeError, ValueError):
+        return None
+    return None
+
+
+def _factorize(col: pd.Series) -> tuple[np.ndarray, int]:
+    try:
+        codes, uniques = pd.factorize(col, sort=True, use_na_sentinel=True)
+    except TypeError:
+        # Mixed types that don't compare: categories in first-seen order
+        codes, uniques = pd.factorize(col, use_na_sentinel=True)
+    return codes.astype(np.int64), len(uniques)
+
+
+def key_codes(file_id: str, df: pd.DataFrame, column: str) -> tuple[np.ndarray, int]:
+    """
+    Categorical codes of `column` in sorted category order (-1 where missing)
+    and the number of categories, for group-by keys.
+    """
+    return _cached(file_id, column, "codes", current_version(file_id), lambda: _factorize(df[column]))
+
+
+def forget(file_id: str):
+    with _lock:
+        for key in [k for k in _cache if k[0] == file_id]:
+            del _cache[key]
+        for key in [k for k in _topn_seen if k[0] == file_id]:
+            del _topn_seen[key]
+
+
+def get_stats() -> dict:
+    with _lock:
+        return {**_stats, "entries": len(_cache)}
@@ -0,0 +1,272 @@
+import fcntl
+import os
+import socket
+import threading
+import time
+import uuid
+from contextlib import contextmanager, nullcontext
+from urllib.parse import urlparse
+import pandas as pd
+
+from exceptions import ExcelOperationError
+from services.snapshot import read_frame, write_frame, frame_to_bytes, frame_from_bytes
+
+# Where cached frames are shared between worker processes (uvicorn/gunicorn
+# --workers N). memory_store keeps serving its in-process copy and asks the
+# backend only for the current version token, a stat or one round trip; the
+# frame itself is fetched again only after another worker published a new one.
+# Mutations hold the backend's per-file lock, so edits from different workers
+# are applied one after another and the journal stays in order.
+#
+# EXCELSIOR_STORE:
+#   local  (default) nothing shared; one worker per deployment
+#   shm    Arrow files in EXCELSIOR_SHARED_DIR (default /dev/shm/excelsior),
+#          memory-mapped by every worker on the host, flock for the lock
+#   redis  any server speaking the Redis protocol at EXCELSIOR_REDIS_URL;
+#          frames are stored as Arrow IPC bytes, the lock is SET NX PX.
+# Columns Arrow can't type (numbers mixed with text) are stored as tagged JSON
+# text (services/snapshot), never pickles: nothing read back from the store
+# can run code.
+
+STORE = os.getenv("EXCELSIOR_STORE", "local")
+SHARED_DIR = os.getenv("EXCELSIOR_SHARED_DIR", "/dev/shm/excelsior" if os.path.isdir("/dev/shm") else "uploads/.shared")
+REDIS_URL = os.getenv("EXCELSIOR_REDIS_URL", "redis://127.0.0.1:6379/0")
+LOCK_TIMEOUT = float(os.getenv("EXCELSIOR_STORE_LOCK_TIMEOUT", 30))
+
+
+def token_seq(token: str) -> int:
+    """Journal seq of a version token, "<epoch>-<seq>"."""
+    return int(token.rsplit("-", 1)[1])
+
+
+class LocalStore:
+    name = "local"
+    shared = False
+
+    def current(self, file_id: str) -> str | None:
+        return None
+
+    def fetch(self, file_id: str) -> tuple[pd.DataFrame, str] | None:
+        return None
+
+    def publish(self, file_id: str, df: pd.DataFrame, token: str):
+        pass
+
+    def delete(self, file_id: str):
+        pass
+
+    def lock(self, file_id: str):
+        return nullcontext()
+
+
+class SharedMemoryStore(LocalStore):
+    name = "shm"
+    shared = True
+
+    def __init__(self, directory: str = SHARED_DIR):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self._pointers: dict[str, tuple[tuple, str]] = {}   # file_id -> ((inode, mtime), token)
+
+    def _pointer(self, file_id: str) -> str:
+        return os.path.join(self.directory, f"{file_id}.current")
+
+    def _data(self, file_id: str, token: str, ext: str) -> str:
+        return os.path.join(self.directory, f"{file_id}.{token}.{ext}")
+
+    def current(self, file_id: str) -> str | None:
+        # A publish replaces the pointer file, so its inode tells whether to re-read it
+        try:
+            st = os.stat(self._pointer(file_id))
+        except FileNotFoundError:
+            return None
+        stamp = (st.st_ino, st.st_mtime_ns)
+        cached = self._pointers.get(file_id)
+        if cached is not None and cached[0] == stamp:
+            return cached[1]
+        try:
+            with open(self._pointer(file_id)) as f:
+                token = f.read().strip()
+        except FileNotFoundError:
+            return None
+        self._pointers[file_id] = (stamp, token)
+        return token
+
+    def fetch(self, file_id: str) -> tuple[pd.DataFrame, str] | None:
+        for _ in range(3):   # a publish may replace the data between reading the pointer and the file
+            token = self.current(file_id)
+            if token is None:
+                return None
+            df = read_frame(self._data(file_id, token, "arrow"))
+            if df is not None:
+                return df, token
+        return None
+
+    def publish(self, file_id: str, df: pd.DataFrame, token: str):
+        write_frame(self._data(file_id, token, "arrow"), df, token_seq(token), mixed=True)
+        tmp = f"{self._pointer(file_id)}.{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
+            f.write(token)
+        os.replace(tmp, self._pointer(file_id))
+        # Older versions go; workers that still map one keep their pages until they drop it
+        self._remove_data(file_id, keep=token)
+
+    def _remove_data(self, file_id: str, keep: str | None = None):
+        prefix = f"{file_id}."
+        for name in os.listdir(self.directory):
+            if name.startswith(prefix) and name.endswith(".arrow") \
+                    and name[len(prefix):].rsplit(".", 1)[0] != keep:
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                except FileNotFoundError:
+                    pass
+
+    def delete(self, file_id: str):
+        try:
+            os.remove(self._pointer(file_id))
+        except FileNotFoundError:
+            pass
+        self._pointers.pop(file_id, None)
+        self._remove_data(file_id)
+
+    @contextmanager
+    def lock(self, file_id: str):
+        with open(os.path.join(self.directory, f"{file_id}.lock"), "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+class RespError(Exception):
+    pass
+
+
+class _RespClient:
+    """Just enough of the Redis protocol (RESP2) for RespStore: one connection per thread."""
+
+    def __init__(self, url: str):
+        parsed = urlparse(url)
+        self.host, self.port = parsed.hostname or "127.0.0.1", parsed.port or 6379
+        self.db = int(parsed.path.lstrip("/") or 0)
+        self.password = parsed.password
+        self._local = threading.local()
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            sock = socket.create_connection((self.host, self.port))
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            conn = self._local.conn = (sock, sock.makefile("rb"))
+            self._local.pid = os.getpid()
+            if self.password:
+                self.execute("AUTH", self.password)
+            if self.db:
+                self.execute("SELECT", self.db)
+        return conn
+
+    def _read(self, reader):
+        line = reader.readline()
+        if not line:
+            raise ConnectionError("Redis connection closed")
+        kind, rest = line[:1], line[1:-2]
+        if kind == b"+":
+            return rest.decode()
+        if kind == b"-":
+            raise RespError(rest.decode())
+        if kind == b":":
+            return int(rest)
+        if kind == b"$":
+            size = int(rest)
+            if size < 0:
+                return None
+            data = reader.read(size + 2)
+            return data[:-2]
+        if kind == b"*":
+            size = int(rest)
+            return None if size < 0 else [self._read(reader) for _ in range(size)]
+        raise RespError(f"Unexpected reply {line[:20]!r}")
+
+    def execute(self, *args):
+        sock, reader = self._connection()
+        parts = [b"*%d\r\n" % len(args)]
+        for arg in args:
+            data = arg if isinstance(arg, bytes) else str(arg).encode()
+            parts += [b"$%d\r\n" % len(data), data, b"\r\n"]
+        try:
+            sock.sendall(b"".join(parts))
+            return self._read(reader)
+        except (OSError, ConnectionError):
+            self._local.conn = None   # reconnect on the next call
+            raise
+
+
+# Deletes the lock key only if it still holds this owner's token
+_RELEASE = "if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('del', KEYS[1]) end return 0"
+
+
+class RespStore(LocalStore):
+    name = "redis"
+    shared = True
+
+    def __init__(self, url: str = REDIS_URL, prefix: str = "excelsior"):
+        self.client = _RespClient(url)
+        self.prefix = prefix
+
+    def _key(self, file_id: str, *parts) -> str:
+        return ":".join((self.prefix, file_id) + parts)
+
+    def current(self, file_id: str) -> str | None:
+        token = self.client.execute("GET", self._key(file_id, "current"))
+        return token.decode() if token is not None else None
+
+    def fetch(self, file_id: str) -> tuple[pd.DataFrame, str] | None:
+        for _ in range(3):
+            token = self.current(file_id)
+            if token is None:
+                return None
+            data = self.client.execute("GET", self._key(file_id, "data", token))
+            if data is not None:
+                return frame_from_bytes(data), token
+        return None
+
+    def publish(self, file_id: str, df: pd.DataFrame, token: str):
+        data = frame_to_bytes(df, token_seq(token), mixed=True)
+        self.client.execute("SET", self._key(file_id, "data", token), data)
+        old = self.client.execute("SET", self._key(file_id, "current"), token, "GET")
+        if old is not None and old.decode() != token:
+            self.client.execute("DEL", self._key(file_id, "data", old.decode()))
+
+    def delete(self, file_id: str):
+        token = self.current(file_id)
+        self.client.execute("DEL", self._key(file_id, "current"))
+        if token is not None:
+            self.client.execute("DEL", self._key(file_id, "data", token))
+
+    @contextmanager
+    def lock(self, file_id: str):
+        key, owner = self._key(file_id, "lock"), uuid.uuid4().hex
+        deadline = time.monotonic() + LOCK_TIMEOUT
+        delay = 0.001
+        # Expires on its own if the holder dies mid-edit
+        while self.client.execute("SET", key, owner, "NX", "PX", int(LOCK_TIMEOUT * 1000)) is None:
+            if time.monotonic() > deadline:
+                raise ExcelOperationError(f"File '{file_id}' is busy; try again.")
+            time.sleep(delay)
+            delay = min(delay * 2, 0.05)
+        try:
+            yield
+        finally:
+            # Compare and delete in one step: if ours expired, the key may be another worker's lock now
+            self.client.execute("EVAL", _RELEASE, 1, key, owner)
+
+
+def make_backend(name: str = STORE) -> LocalStore:
+    if name == "local":
+        return LocalStore()
+    if name == "shm":
+        return SharedMemoryStore()
+    if name == "redis":
+        return RespStore()
+    raise ValueError(f"Unknown EXCELSIOR_STORE '{name}' (expected local, shm or redis)")
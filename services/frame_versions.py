@@ -0,0 +1,373 @@
+import os
+import threading
+from dataclasses import dataclass, field
+from typing import Dict
+import numpy as np
+import pandas as pd
+
+from services import change_feed, op_journal
+from services.metrics import stage
+from services.memory_store import get as get_df, put as put_df, get_with_seq, journal_seq, mark_clean
+from services.memory_store import generation, mutation
+
+# Version history for cached frames. Each mutation is recorded as a delta that
+# can be re-applied or reverted, holding only the data it changed: the touched
+# cells, the replaced column (a pandas copy-on-write reference, not a copy), or
+# a row-position array plus whatever rows a filter dropped. Versions therefore
+# cost memory proportional to the edit, not to the frame.
+
+MAX_VERSIONS = int(os.getenv("EXCELSIOR_MAX_VERSIONS", 50))
+
+# Always on from pandas 3; on 2.x it has to be opted into for versions to share columns
+if int(pd.__version__.split(".")[0]) < 3:
+    pd.options.mode.copy_on_write = True
+
+
+@dataclass
+class CellDelta:
+    # {column: (row positions, old values, new values, old dtype, new dtype)}
+    changes: dict
+    kind: str = "cells"
+
+    @classmethod
+    def capture(cls, old: pd.DataFrame, new: pd.DataFrame, touched: dict[str, np.ndarray]) -> "CellDelta":
+        changes = {}
+        for col, rows in touched.items():
+            changes[col] = (
+                rows,
+                old[col].array.take(rows),
+                new[col].array.take(rows),
+                old[col].dtype,
+                new[col].dtype,
+            )
+        return cls(changes)
+
+    def apply(self, df: pd.DataFrame) -> pd.DataFrame:
+        out = df.copy(deep=False)
+        for col, (rows, _, new_vals, _, new_dtype) in self.changes.items():
+            # Widen first (e.g. int -> float) so the new values fit
+            target = out[col].array.astype(new_dtype, copy=True)
+            target[rows] = new_vals
+            out[col] = pd.Series(target, index=out.index, name=col)
+        return out
+
+    def revert(self, df: pd.DataFrame) -> pd.DataFrame:
+        out = df.copy(deep=False)
+        for col, (rows, old_vals, _, old_dtype, new_dtype) in self.changes.items():
+            # Narrow back only after the widened values are gone
+            target = out[col].array.copy()
+            if isinstance(target.dtype, pd.CategoricalDtype):
+                old_vals = old_vals.astype(target.dtype)   # the new categories include the old ones
+            target[rows] = old_vals
+            if old_dtype != new_dtype:
+                target = target.astype(old_dtype)
+            out[col] = pd.Series(target, index=out.index, name=col)
+        return out
+
+
+@dataclass
+class ColumnDelta:
+    column: str
+    old: pd.Series | None      # None when the column was added
+    new: pd.Series | None      # None when the column was dropped
+    position: int = -1         # where the column sat, for restoring order
+    kind: str = "column"
+
+    @classmethod
+    def capture(cls, old: pd.DataFrame, new: pd.DataFrame, column: str) -> "ColumnDelta":
+        return cls(
+            column,
+            old[column] if column in old.columns else None,
+            new[column] if column in new.columns else None,
+            old.columns.get_loc(column) if column in old.columns else -1,
+        )
+
+    def _set(self, df: pd.DataFrame, series: pd.Series | None) -> pd.DataFrame:
+        out = df.copy(deep=False)
+        if series is None:
+            return out.drop(columns=[self.column])
+        if self.column not in out.columns and 0 <= self.position <= len(out.columns):
+            out.insert(self.position, self.column, series.to_numpy(copy=False))
+        else:
+            out[self.column] = series
+        return out
+
+    def apply(self, df: pd.DataFrame) -> pd.DataFrame:
+        return self._set(df, self.new)
+
+    def revert(self, df: pd.DataFrame) -> pd.DataFrame:
+        return self._set(df, self.old)
+
+
+@dataclass
+class RowDelta:
+    positions: np.ndarray          # new frame = old.take(positions)
+    removed_positions: np.ndarray  # rows a filter dropped ...
+    removed: pd.DataFrame          # ... and their data, so the filter can be undone
+    kind: str = "rows"
+
+    @classmethod
+    def take(cls, df: pd.DataFrame, positions: np.ndarray) -> tuple[pd.DataFrame, "RowDelta"]:
+        positions = np.asarray(positions, dtype=np.intp)
+        if len(positions) < len(df):
+            keep = np.zeros(len(df), dtype=bool)
+            keep[positions] = True
+            removed_positions = np.flatnonzero(~keep)
+        else:
+            removed_positions = np.empty(0, dtype=np.intp)
+        delta = cls(positions, removed_positions, df.take(removed_positions).reset_index(drop=True))
+        return delta.apply(df), delta
+
+    @property
+    def is_permutation(self) -> bool:
+        return len(self.removed_positions) == 0
+
+    def apply(self, df: pd.DataFrame) -> pd.DataFrame:
+        return df.take(self.positions).reset_index(drop=True)
+
+    def revert(self, df: pd.DataFrame) -> pd.DataFrame:
+        combined = pd.concat([df, self.removed], ignore_index=True) if len(self.removed) else df
+        order = np.argsort(np.concatenate([self.positions, self.removed_positions]), kind="stable")
+        return combined.take(order).reset_index(drop=True)
+
+
+@dataclass
+class CompositeDelta:
+    deltas: list                   # one per step, in the order they were applied
+    kind: str = "pipeline"         # or "add_column" (services/formula_engine)
+
+    def apply(self, df: pd.DataFrame) -> pd.DataFrame:
+        for delta in self.deltas:
+            df = delta.apply(df)
+        return df
+
+    def revert(self, df: pd.DataFrame) -> pd.DataFrame:
+        for delta in reversed(self.deltas):
+            df = delta.revert(df)
+        return df
+
+
+def sort_order(df: pd.DataFrame, column: str, ascending: bool = True) -> np.ndarray:
+    """Row positions that stably sort `df` by `column`, missing values last."""
+    ordered = df[column].reset_index(drop=True).sort_values(ascending=ascending, kind="stable")
+    return ordered.index.to_numpy()
+
+
+@dataclass
+class History:
+    # Version ids are never reused: undo steps back to an earlier id and a new
+    # edit after an undo gets a fresh one, so anything cached per (file, version)
+    # stays correct.
+    ids: list = field(default_factory=lambda: [0])   # versions on the undo path, current last
+    undo: list = field(default_factory=list)         # undo[i] turns ids[i] into ids[i + 1]
+    redo: list = field(default_factory=list)         # (delta, version), next redo step last
+    next_id: int = 1
+    generation: int = 0                              # memory_store.generation() the deltas describe
+    # How many of the newest undo / redo entries replay rebuilds from the journal:
+    # the ones recorded since the last checkpoint. Steps past them need one.
+    journaled: int = 0
+    journaled_redo: int = 0
+
+    @property
+    def version(self) -> int:
+        return self.ids[-1]
+
+
+_histories: Dict[str, History] = {}
+_lock = threading.RLock()
+
+
+def _history(file_id: str) -> History:
+    current = generation(file_id)
+    history = _histories.get(file_id)
+    if history is None:
+        history = _histories[file_id] = History(generation=current)
+    elif history.generation != current:
+        # Another worker's edit replaced the frame: these deltas don't apply to it.
+        # Undo restarts here, under a fresh id so per-version caches miss.
+        history = _histories[file_id] = History(ids=[history.next_id], next_id=history.next_id + 1,
+                                                generation=current)
+    return history
+
+
+def current_version(file_id: str) -> int:
+    with _lock:
+        return _history(file_id).version
+
+
+def _store(file_id: str, df: pd.DataFrame, op: dict | None):
+    # Journal first: an edit that can't be logged is not applied
+    seq = journal_seq(file_id) + 1
+    if op is not None:
+        with stage("journal_write"):
+            op_journal.record(file_id, seq, op)
+    put_df(file_id, df, seq=seq)
+
+
+def commit(file_id: str, df: pd.DataFrame, delta, op: dict | None = None) -> int:
+    """
+    Store `df` as the next version of `file_id`, recording `delta` for undo.
+    `op` is the replayable description of the edit written to the journal
+    (replayed by services/operations replay/recover_all); only replay itself
+    passes None.
+    """
+    with _lock:
+        history = _history(file_id)
+        _store(file_id, df, op)
+        _settle(file_id, delta, reverted=False)
+        history.undo.append(delta)
+        history.ids.append(history.next_id)
+        history.next_id += 1
+        history.redo.clear()
+        history.journaled += 1
+        history.journaled_redo = 0
+        if len(history.undo) > MAX_VERSIONS:
+            del history.undo[0], history.ids[0]
+            history.journaled = min(history.journaled, len(history.undo))
+        change_feed.publish(file_id, history.version, df, delta)
+        return history.version
+
+
+def _settle(file_id: str, delta, reverted: bool):
+    # Deltas that also carry state kept outside the frame (a computed column's
+    # formula) update it once committed and when undo/redo moves past them;
+    # frame_at() only reads
+    for part in delta.deltas if isinstance(delta, CompositeDelta) else [delta]:
+        settle = getattr(part, "settle", None)
+        if settle is not None:
+            settle(file_id, reverted)
+
+
+def replayable(file_id: str, kind: str) -> bool:
+    """
+    Whether the next undo/redo (`kind`) uses a delta replay can rebuild from the
+    journal. When it doesn't, the step must be checkpointed instead of relying
+    on its journal record (services/operations apply_op).
+    """
+    with _lock:
+        history = _history(file_id)
+        return (history.journaled if kind == "undo" else history.journaled_redo) > 0
+
+
+def undo(file_id: str, journal: bool = True) -> tuple[pd.DataFrame, int] | None:
+    with _lock:
+        df = get_df(file_id)
+        history = _history(file_id)
+        if df is None or not history.undo:
+            return None
+        delta = history.undo.pop()
+        history.redo.append((delta, history.ids.pop()))
+        if history.journaled:
+            history.journaled -= 1
+            history.journaled_redo += 1
+        df = delta.revert(df)
+        _store(file_id, df, {"kind": "undo"} if journal else None)
+        _settle(file_id, delta, reverted=True)
+        change_feed.publish(file_id, history.version, df, delta, reverted=True)
+        return df, history.version
+
+
+def redo(file_id: str, journal: bool = True) -> tuple[pd.DataFrame, int] | None:
+    with _lock:
+        df = get_df(file_id)
+        history = _history(file_id)
+        if df is None or not history.redo:
+            return None
+        delta, version = history.redo.pop()
+        history.undo.append(delta)
+        history.ids.append(version)
+        if history.journaled_redo:
+            history.journaled_redo -= 1
+            history.journaled += 1
+        df = delta.apply(df)
+        _store(file_id, df, {"kind": "redo"} if journal else None)
+        _settle(file_id, delta, reverted=False)
+        change_feed.publish(file_id, history.version, df, delta)
+        return df, history.version
+
+
+def frame_at(file_id: str, version: int) -> pd.DataFrame | None:
+    """
+    Rebuild `version` from the current frame without touching the cache. Any
+    version on the undo path or the redo stack can be read.
+    """
+    with _lock:
+        df = get_df(file_id)
+        history = _history(file_id)
+        if df is None:
+            return None
+        if version in history.ids:
+            for delta in reversed(history.undo[history.ids.index(version):]):
+                df = delta.revert(df)
+            return df
+        redo_ids = [v for _, v in history.redo]
+        if version in redo_ids:
+            for delta, _ in reversed(history.redo[redo_ids.index(version):]):
+                df = delta.apply(df)
+            return df
+        return None
+
+
+def deltas_since(file_id: str, version: int) -> list | None:
+    """
+    The deltas that turn `version` into the current frame, oldest first; None
+    when `version` isn't on the undo path any more (undone, or too old).
+    """
+    with _lock:
+        history = _history(file_id)
+        if version not in history.ids:
+            return None
+        return history.undo[history.ids.index(version):]
+
+
+def describe(file_id: str) -> dict:
+    with _lock:
+        history = _history(file_id)
+        return {
+            "version": history.version,
+            "oldest": history.ids[0],
+            "undo": [{"version": v, "operation": d.kind} for v, d in zip(history.ids[1:], history.undo)],
+            "redo": [{"version": v, "operation": d.kind} for d, v in reversed(history.redo)],
+        }
+
+
+def subscribe(file_id: str, viewport: change_feed.Viewport) -> change_feed.Subscriber | None:
+    """A change-feed subscriber starting from the current version; None if the file isn't loaded."""
+    with _lock:
+        # Under the lock commit() publishes with, so no edit falls between the two
+        df = get_df(file_id)
+        if df is None:
+            return None
+        return change_feed.subscribe(file_id, viewport, change_feed.Change(_history(file_id).version, df))
+
+
+def frame_with_seq(file_id: str) -> tuple[pd.DataFrame | None, int]:
+    """The current frame and the last journalled operation it includes, consistently."""
+    with _lock:
+        return get_with_seq(file_id)
+
+
+def checkpointed(file_id: str, seq: int, publish) -> bool:
+    """
+    Finish a checkpoint of the frame as of `seq`: if no edit happened since,
+    run `publish()` (which moves the written copy into place), drop the journal
+    records it covers and mark the cache clean. Undo history is kept; since
+    replay after a crash starts from this copy, none of it is journalled any
+    more (see replayable()). Returns False, without publishing, when the frame
+    has moved on.
+    """
+    with mutation(file_id), _lock:
+        get_df(file_id)   # with a shared store, catch up with other workers first
+        if journal_seq(file_id) != seq:
+            return False
+        publish()
+        op_journal.compact(file_id, seq)
+        mark_clean(file_id, seq)
+        history = _history(file_id)
+        history.journaled = history.journaled_redo = 0
+        return True
+
+
+def forget(file_id: str):
+    with _lock:
+        _histories.pop(file_id, None)
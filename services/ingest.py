@@ -0,0 +1,100 @@
+import asyncio
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+import pandas as pd
+
+from services.memory_store import put, get
+from services.file_status import update_status
+from services.snapshot import write_snapshot, mark_in_sync
+from services.dtype_optimizer import optimize, record
+from services.chunk_store import wants_chunks, convert as convert_to_chunks
+from services.metrics import stage
+
+UPLOAD_DIR = "uploads"
+PARSE_WORKERS = int(os.getenv("EXCELSIOR_PARSE_WORKERS", max((os.cpu_count() or 2) // 2, 1)))
+
+_executor: ProcessPoolExecutor | None = None
+_tasks: set[asyncio.Task] = set()   # keeps background parses referenced until done
+
+
+def spool_path(file_id: str) -> str:
+    # Not named .xlsx so memory_store can't pick it up (and parse it inline) mid-ingest
+    return os.path.join(UPLOAD_DIR, f"{file_id}.upload")
+
+
+def parse_upload(file_id: str) -> tuple[pd.DataFrame | None, dict]:
+    """
+    Runs in a worker process: parse the spooled upload, write the snapshot and
+    move the workbook to uploads/{file_id}.xlsx. Returns the memory report of
+    the dtype pass, and the frame only when it couldn't be snapshotted, so the
+    parent doesn't pay for pickling it back.
+
+    Workbooks over EXCELSIOR_CHUNKED_THRESHOLD_MB are streamed into chunk
+    files instead (services/chunk_store) and never become one DataFrame; the
+    report is then the chunk store's description of the file.
+    """
+    src = spool_path(file_id)
+    if wants_chunks(src):
+        report = convert_to_chunks(file_id, src)
+        os.replace(src, os.path.join(UPLOAD_DIR, f"{file_id}.xlsx"))
+        return None, report
+    df, report = optimize(pd.read_excel(src, engine="openpyxl"))
+    snapshotted = write_snapshot(file_id, df)
+    os.replace(src, os.path.join(UPLOAD_DIR, f"{file_id}.xlsx"))
+    if snapshotted:
+        mark_in_sync(file_id)
+        return None, report
+    return df, report
+
+
+def _get_executor() -> ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        # spawn: forking a process that runs an event loop and threads is unsafe
+        _executor = ProcessPoolExecutor(
+            max_workers=PARSE_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _executor
+
+
+async def _parse_in_background(file_id: str):
+    loop = asyncio.get_running_loop()
+    try:
+        with stage("excel_parse"):
+            df, report = await loop.run_in_executor(_get_executor(), parse_upload, file_id)
+    except Exception as e:
+        if os.path.exists(spool_path(file_id)):
+            os.remove(spool_path(file_id))
+        update_status(file_id, f"error: could not read Excel: {e}")
+        return
+
+    if report.get("mode") == "chunked":
+        print(f"[INGEST] {file_id}: {report['rows']} rows in {report['chunks']} chunks "
+              f"({report['bytes_on_disk'] / 2**20:.1f} MB on disk), out-of-core mode")
+        update_status(file_id, "uploaded")
+        return
+
+    record(file_id, report)
+    print(f"[INGEST] {file_id}: {report['bytes_before'] / 2**20:.1f} MB -> {report['bytes_after'] / 2**20:.1f} MB "
+          f"after dtype optimization")
+    if df is not None:
+        put(file_id, df, dirty=False)
+    else:
+        get(file_id)   # warm the cache from the freshly written snapshot
+    update_status(file_id, "uploaded")
+
+
+def schedule_parse(file_id: str):
+    update_status(file_id, "parsing")
+    task = asyncio.create_task(_parse_in_background(file_id))
+    _tasks.add(task)
+    task.add_done_callback(_tasks.discard)
+
+
+def shutdown():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
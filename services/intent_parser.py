@@ -0,0 +1,233 @@
+import difflib
+import os
+import re
+from dataclasses import dataclass
+import pandas as pd
+
+# Rule-based parsing of the common /generate-action prompts ("sort by Profit
+# descending", "filter Region == West", "set Status to Complete") into the
+# same action dicts the LLM returns. Column names are matched fuzzily against
+# the frame's headers; anything the grammar doesn't cover, or covers with low
+# confidence, is left to the LLM.
+
+MIN_CONFIDENCE = float(os.getenv("EXCELSIOR_INTENT_MIN_CONFIDENCE", 0.8))
+FUZZY_CUTOFF = 0.75
+
+_FILLER = re.compile(r"^(?:please\s+|can you\s+|could you\s+|now\s+|just\s+)+", re.I)
+_TRAILING = re.compile(r"[\s.!?]+$")
+
+_ASCENDING = {"asc", "ascending", "increasing", "a-z", "low to high", "lowest first", "smallest first", "oldest first"}
+_DESCENDING = {"desc", "descending", "decreasing", "z-a", "high to low", "highest first", "largest first",
+               "biggest first", "newest first"}
+_DIRECTIONS = "|".join(sorted((re.escape(d) for d in _ASCENDING | _DESCENDING), key=len, reverse=True))
+
+_SORT = re.compile(
+    r"^(?:sort|order|rank|arrange)\s+(?:the\s+)?(?:rows\s+|data\s+|table\s+|sheet\s+)?(?:by\s+)?"
+    rf"(?P<column>.+?)(?:\s+(?:in\s+)?(?P<direction>{_DIRECTIONS})(?:\s+order)?)?$",
+    re.I,
+)
+
+# Longest phrases first so "greater than or equal to" beats "greater than"
+_OPERATORS = {
+    "greater than or equal to": ">=", "less than or equal to": "<=", "is not equal to": "!=",
+    "not equal to": "!=", "greater than": ">", "more than": ">", "less than": "<", "fewer than": "<",
+    "at least": ">=", "at most": "<=", "is not": "!=", "equal to": "==", "equals": "==", "is": "==",
+    "above": ">", "over": ">", "below": "<", "under": "<", "after": ">", "before": "<",
+    "contains": "contains", "containing": "contains", "starts with": "startswith", "ends with": "endswith",
+    "between": "between",
+    "==": "==", "!=": "!=", ">=": ">=", "<=": "<=", "=": "==", ">": ">", "<": "<",
+}
+_OPERATOR_WORDS = "|".join(
+    re.escape(p) if not p[0].isalpha() else rf"\b{re.escape(p)}\b"
+    for p in sorted(_OPERATORS, key=len, reverse=True)
+)
+_FILTER = re.compile(
+    r"^(?:filter|show|keep|only|find|select|get)\s+(?:only\s+)?(?:(?:the\s+)?rows\s+)?(?:(?:where|with|whose)\s+)?"
+    rf"(?P<column>.+?)\s*(?P<operator>{_OPERATOR_WORDS})\s*(?P<value>.+)$",
+    re.I,
+)
+
+_UPDATE = re.compile(
+    r"^(?:set|change|update|make)\s+(?:all\s+)?(?:of\s+)?(?:the\s+)?(?P<column>.+?)\s+(?:column\s+)?"
+    r"(?:to|=|as|equal to)\s+(?P<value>.+)$",
+    re.I,
+)
+
+# "filter West, sort by Profit, then set Status to Done": clauses split where
+# the next one starts with a command word, so "between 5 and 10" stays whole
+_VERBS = r"(?:sort|order|rank|arrange|filter|show|keep|only|find|select|get|set|change|update|make)\b"
+_CLAUSE = re.compile(rf"(?:\s*[,;]\s*(?:(?:and|then)\s+)*|\s+(?:and\s+)?then\s+|\s+and\s+)(?={_VERBS})", re.I)
+
+_MISSING = {"null", "empty", "blank", "missing", "none", "nan"}
+_NUMBER = re.compile(r"^[-+]?\$?\d[\d,]*(?:\.\d+)?%?$")
+
+
+@dataclass
+class Intent:
+    action: dict
+    confidence: float
+
+
+def _normalize(name: str) -> str:
+    return re.sub(r"[\W_]+", "", name).casefold()
+
+
+def match_column(phrase: str, columns: list[str]) -> tuple[str | None, float]:
+    """Best header for `phrase` and how sure the match is (0-1)."""
+    phrase = re.sub(r"^(?:the|column)\s+|\s+(?:column|field)$", "", phrase.strip(" '\"`"), flags=re.I)
+    if phrase in columns:
+        return phrase, 1.0
+    folded = {str(c).casefold(): c for c in columns}
+    if phrase.casefold() in folded:
+        return folded[phrase.casefold()], 0.98
+    normalized = {_normalize(str(c)): c for c in columns}
+    if _normalize(phrase) in normalized:
+        return normalized[_normalize(phrase)], 0.95
+
+    # "date" for "Order Date": one header containing the phrase as a word
+    word = re.compile(rf"\b{re.escape(phrase.casefold())}\b")
+    containing = [c for c in columns if word.search(str(c).casefold())]
+    if len(containing) == 1:
+        return containing[0], 0.85
+
+    close = difflib.get_close_matches(phrase.casefold(), list(folded), n=2, cutoff=FUZZY_CUTOFF)
+    if not close:
+        return None, 0.0
+    score = difflib.SequenceMatcher(None, phrase.casefold(), close[0]).ratio()
+    if len(close) > 1:
+        # Two plausible headers: take the better one, but don't be sure about it
+        score = min(score, 0.75)
+    return folded[close[0]], score
+
+
+def parse_value(text: str):
+    """Literal from a prompt: quoted text, a number, a boolean, or the bare text."""
+    text = text.strip()
+    if len(text) >= 2 and text[0] == text[-1] and text[0] in "'\"`":
+        return text[1:-1]
+    if _NUMBER.match(text):
+        number = text.replace(",", "").replace("$", "").rstrip("%")
+        value = float(number)
+        return int(value) if value.is_integer() and "." not in number else value
+    if text.casefold() in {"true", "yes"}:
+        return True
+    if text.casefold() in {"false", "no"}:
+        return False
+    return text
+
+
+def _value_fits(dtype, value) -> bool:
+    if pd.api.types.is_bool_dtype(dtype):
+        return isinstance(value, bool)
+    if pd.api.types.is_numeric_dtype(dtype):
+        return isinstance(value, (int, float)) and not isinstance(value, bool)
+    if pd.api.types.is_datetime64_any_dtype(dtype):
+        try:
+            pd.Timestamp(str(value))
+            return True
+        except ValueError:
+            return False
+    return True
+
+
+def _is_text(dtype) -> bool:
+    return pd.api.types.is_string_dtype(dtype) or pd.api.types.is_object_dtype(dtype) \
+        or isinstance(dtype, pd.CategoricalDtype)
+
+
+def _split_range(text: str) -> list[str] | None:
+    # Tried in turn so "-5 and 10" and dates like "2024-01-01" stay in one piece
+    for separator in (r"\s+and\s+", r"\s*,\s*", r"\s+to\s+", r"\s+-\s+"):
+        bounds = re.split(separator, text.strip(), maxsplit=1, flags=re.I)
+        if len(bounds) == 2:
+            return bounds
+    return None
+
+
+def _parse_sort(match, df) -> Intent | None:
+    column, score = match_column(match["column"], df.columns.tolist())
+    if column is None:
+        return None
+    direction = (match["direction"] or "asc").casefold()
+    order = "desc" if direction in _DESCENDING else "asc"
+    return Intent({"operation": "sort", "column": column, "order": order}, score)
+
+
+def _parse_filter(match, df) -> Intent | None:
+    column, score = match_column(match["column"], df.columns.tolist())
+    if column is None:
+        return None
+    operator = _OPERATORS[match["operator"].casefold()]
+    dtype = df[column].dtype
+
+    if operator in {"==", "!="} and match["value"].strip().casefold() in _MISSING:
+        operator = "is_null" if operator == "==" else "not_null"
+        return Intent({"operation": "filter", "column": column,
+                       "condition": {"operator": operator, "value": None}}, score)
+
+    if operator == "between":
+        bounds = _split_range(match["value"])
+        if bounds is None:
+            return None
+        value = [parse_value(b) for b in bounds]
+        fits = all(_value_fits(dtype, v) for v in value)
+    else:
+        value = parse_value(match["value"])
+        if operator in {"contains", "startswith", "endswith"}:
+            value, fits = str(value), _is_text(dtype)
+        else:
+            fits = _value_fits(dtype, value)
+    if operator in {">", "<", ">=", "<="} and _is_text(dtype):
+        fits = False
+    if not fits:
+        # Probably the wrong column, or a prompt we didn't really understand
+        score *= 0.5
+
+    if isinstance(value, str) and operator in {">", "<", ">=", "<=", "==", "!="}:
+        value = value.strip()
+    return Intent({"operation": "filter", "column": column,
+                   "condition": {"operator": operator, "value": value}}, score)
+
+
+def _parse_update(match, df) -> Intent | None:
+    column, score = match_column(match["column"], df.columns.tolist())
+    if column is None:
+        return None
+    value = parse_value(match["value"])
+    if not _value_fits(df[column].dtype, value):
+        score *= 0.5
+    return Intent({"operation": "update", "column": column, "value": value}, score)
+
+
+_RULES = ((_SORT, _parse_sort), (_FILTER, _parse_filter), (_UPDATE, _parse_update))
+
+
+def _parse_clause(text: str, df: pd.DataFrame) -> Intent | None:
+    text = _TRAILING.sub("", _FILLER.sub("", text.strip()))
+    if " and " in text.casefold() and not re.search(r"\bbetween\b", text, re.I):
+        # "filter X and Y" is a compound condition: left to the LLM
+        return None
+    for pattern, build in _RULES:
+        match = pattern.match(text)
+        if match:
+            intent = build(match, df)
+            if intent is not None:
+                return intent
+    return None
+
+
+def parse_intent(prompt: str, df: pd.DataFrame) -> Intent | None:
+    """
+    The action for `prompt` if the rules cover it, with a confidence in [0, 1];
+    None when no rule applies. Callers compare against MIN_CONFIDENCE. A
+    prompt of several commands becomes a pipeline when every clause parses,
+    as sure as its least certain clause.
+    """
+    clauses = _CLAUSE.split(_TRAILING.sub("", _FILLER.sub("", prompt.strip())))
+    intents = [_parse_clause(clause, df) for clause in clauses]
+    if any(intent is None for intent in intents):
+        return None
+    if len(intents) == 1:
+        return intents[0]
+    return Intent({"operation": "pipeline", "steps": [i.action for i in intents]},
+                  min(i.confidence for i in intents))
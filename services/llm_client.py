@@ -0,0 +1,191 @@
+import asyncio
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from dotenv import load_dotenv
+from openai import AsyncOpenAI
+
+from services.metrics import observe_llm
+
+load_dotenv()
+
+# One shared async client for every LLM call. Reusing it keeps the HTTP
+# connection pool warm; requests no longer block the event loop. Point
+# EXCELSIOR_LLM_BASE_URL at any OpenAI-compatible server (for example
+# benchmarks/llm_stub.py) to run without the real API.
+BASE_URL = os.getenv("EXCELSIOR_LLM_BASE_URL") or None
+TIMEOUT_SECONDS = float(os.getenv("EXCELSIOR_LLM_TIMEOUT", 30))
+MAX_RETRIES = int(os.getenv("EXCELSIOR_LLM_RETRIES", 2))
+
+# Parsed responses are cached on disk, keyed by the normalized prompt, the
+# column schema, the model and the system prompt.
+CACHE_DB = os.getenv("EXCELSIOR_LLM_CACHE_DB", "llm_cache.db")
+CACHE_TTL = float(os.getenv("EXCELSIOR_LLM_CACHE_TTL", 7 * 24 * 3600))
+CACHE_MAX_ENTRIES = int(os.getenv("EXCELSIOR_LLM_CACHE_MAX_ENTRIES", 10_000))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS llm_cache (
+    key       TEXT PRIMARY KEY,
+    model     TEXT NOT NULL,
+    response  TEXT NOT NULL,
+    created   REAL NOT NULL,
+    last_used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS llm_cache_last_used ON llm_cache (last_used);
+"""
+
+_client: AsyncOpenAI | None = None
+_local = threading.local()
+_inflight: dict[str, asyncio.Future] = {}
+_stats = {"hits": 0, "misses": 0, "coalesced": 0, "errors": 0, "evictions": 0}
+
+
+def get_client() -> AsyncOpenAI:
+    global _client
+    if _client is None:
+        _client = AsyncOpenAI(
+            api_key=os.getenv("OPENAI_API_KEY"),
+            base_url=BASE_URL,
+            timeout=TIMEOUT_SECONDS,
+            max_retries=MAX_RETRIES,
+        )
+    return _client
+
+
+def _connect() -> sqlite3.Connection:
+    conn = getattr(_local, "conn", None)
+    if conn is not None and _local.pid == os.getpid() and _local.path == CACHE_DB:
+        return conn
+
+    conn = sqlite3.connect(CACHE_DB, timeout=30, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.executescript(_SCHEMA)
+
+    _local.conn, _local.pid, _local.path = conn, os.getpid(), CACHE_DB
+    return conn
+
+
+def normalize_prompt(prompt: str) -> str:
+    # Whitespace only: case and punctuation can change which value a filter matches
+    return re.sub(r"\s+", " ", prompt).strip()
+
+
+def cache_key(system: str, prompt: str, schema: list | None, model: str) -> str:
+    payload = json.dumps([normalize_prompt(prompt), schema or [], model, system], default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def _cache_get(key: str) -> dict | None:
+    conn = _connect()
+    now = time.time()
+    row = conn.execute("SELECT response, created FROM llm_cache WHERE key = ?", (key,)).fetchone()
+    if row is None:
+        return None
+    if now - row[1] > CACHE_TTL:
+        conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+        return None
+    conn.execute("UPDATE llm_cache SET last_used = ? WHERE key = ?", (now, key))
+    return json.loads(row[0])
+
+
+def _cache_put(key: str, model: str, response: dict):
+    conn = _connect()
+    now = time.time()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.execute(
+            "INSERT OR REPLACE INTO llm_cache VALUES (?, ?, ?, ?, ?)",
+            (key, model, json.dumps(response), now, now),
+        )
+        # Expired rows first, then least recently used beyond the cap
+        evicted = conn.execute("DELETE FROM llm_cache WHERE created < ?", (now - CACHE_TTL,)).rowcount
+        evicted += conn.execute(
+            "DELETE FROM llm_cache WHERE key IN "
+            "(SELECT key FROM llm_cache ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+            (CACHE_MAX_ENTRIES,),
+        ).rowcount
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    _stats["evictions"] += evicted
+
+
+def parse_json(content: str) -> dict:
+    """The JSON object in a model reply, tolerating a ```json fence around it."""
+    content = content.strip()
+    fenced = re.match(r"^```(?:json)?\s*(.*?)\s*```$", content, re.DOTALL)
+    if fenced:
+        content = fenced.group(1)
+    result = json.loads(content)
+    if not isinstance(result, dict):
+        raise ValueError(f"Expected a JSON object, got {type(result).__name__}")
+    return result
+
+
+async def _complete(system: str, prompt: str, model: str) -> dict:
+    start = time.perf_counter()
+    try:
+        response = await get_client().chat.completions.create(
+            model=model,
+            messages=[
+                {"role": "system", "content": system},
+                {"role": "user", "content": prompt}
+            ]
+        )
+    except Exception:
+        observe_llm(model, time.perf_counter() - start, outcome="error")
+        raise
+    observe_llm(model, time.perf_counter() - start, getattr(response, "usage", None))
+    return parse_json(response.choices[0].message.content)
+
+
+async def complete_json(system: str, prompt: str, model: str, schema: list | None = None,
+                        use_cache: bool = True) -> dict:
+    """
+    Ask `model` for a JSON object. Answers are served from the response cache
+    when possible, and concurrent identical requests share one upstream call.
+    Raises whatever the client or JSON parsing raised; failures aren't cached.
+    """
+    key = cache_key(system, prompt, schema, model)
+    if use_cache:
+        cached = _cache_get(key)
+        if cached is not None:
+            _stats["hits"] += 1
+            return cached
+
+    pending = _inflight.get(key)
+    if pending is not None:
+        _stats["coalesced"] += 1
+        return await asyncio.shield(pending)
+
+    _stats["misses"] += 1
+    future = asyncio.get_running_loop().create_future()
+    _inflight[key] = future
+    try:
+        result = await _complete(system, prompt, model)
+        if use_cache:
+            _cache_put(key, model, result)
+        future.set_result(result)
+        return result
+    except asyncio.CancelledError:
+        future.cancel()
+        raise
+    except Exception as e:
+        _stats["errors"] += 1
+        future.set_exception(e)
+        # Nobody else may be waiting; don't leave "exception never retrieved" behind
+        future.exception()
+        raise
+    finally:
+        del _inflight[key]
+
+
+def get_stats() -> dict:
+    entries = _connect().execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+    return {**_stats, "entries": entries, "inflight": len(_inflight)}
@@ -1,14 +1,374 @@
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
 from typing import Dict
 import pandas as pd
+from services.snapshot import read_frame, write_frame, read_seq, read_snapshot, write_snapshot, snapshot_path, mark_in_sync
+from services.excel_parser import sheet_names, read_rows
+from services.dtype_optimizer import optimize, record, forget as forget_report
+from services.frame_store import make_backend, token_seq
+from services.chunk_store import is_chunked
 
-# {file_id: DataFrame}
-dataframes: Dict[str, pd.DataFrame] = {}
+UPLOAD_DIR = "uploads"
+SPILL_DIR = os.path.join(UPLOAD_DIR, ".spill")
 
-def put(file_id: str, df: pd.DataFrame):
-    dataframes[file_id] = df
+# Byte budget for cached frames (measured with memory_usage(deep=True))
+MAX_BYTES = int(os.getenv("EXCELSIOR_CACHE_MAX_BYTES", 512 * 1024 * 1024))
+# Idle frames older than this are dropped on the next access; 0 disables TTL
+TTL_SECONDS = float(os.getenv("EXCELSIOR_CACHE_TTL", 0))
+
+# {file_id: DataFrame}, least recently used first
+dataframes: "OrderedDict[str, pd.DataFrame]" = OrderedDict()
+
+_sheet_names: Dict[str, list[str]] = {}
+_sizes: Dict[str, int] = {}
+_seqs: Dict[str, int] = {}   # last journalled operation each cached frame includes
+# Renewed whenever a frame arrives that its seq doesn't describe (an upload, an
+# untagged reload); (epoch, seq) then identifies a frame's content
+_epochs: Dict[str, str] = {}
+_last_access: Dict[str, float] = {}
+_dirty: set[str] = set()     # frames with edits not yet written to disk
+_lock = threading.RLock()
+
+# Shared with other worker processes when EXCELSIOR_STORE isn't "local" (see
+# services/frame_store). Only first-sheet frames are published; other sheets
+# are read-only and load from the snapshot files every worker can read.
+_backend = make_backend()
+_shared_tokens: Dict[str, str] = {}   # version token of the shared frame each cached copy is
+# Bumped when a frame published by another worker replaces the cached one, so
+# per-process state derived from the old frame (undo history) knows to reset
+_generations: Dict[str, int] = {}
+_mutation_locks: Dict[str, threading.RLock] = {}
+_mutation_depth: Dict[str, int] = {}
+
+_stats = {"hits": 0, "misses": 0, "reloads": 0, "evictions": 0, "spills": 0, "expired": 0,
+          "fetches": 0, "publishes": 0}
+
+
+def _frame_bytes(df: pd.DataFrame) -> int:
+    return int(df.memory_usage(index=True, deep=True).sum())
+
+
+def _spill_path(file_id: str) -> str:
+    return os.path.join(SPILL_DIR, f"{file_id}.arrow")
+
+
+def _spill(file_id: str, df: pd.DataFrame):
+    if not write_frame(_spill_path(file_id), df, _seqs.get(file_id, 0)):
+        # Not representable in Arrow; keep it resident rather than lose edits
+        return False
+    _stats["spills"] += 1
+    return True
+
+
+def _drop(file_id: str):
+    dataframes.pop(file_id, None)
+    _sizes.pop(file_id, None)
+    _seqs.pop(file_id, None)
+    _last_access.pop(file_id, None)
+
+
+def _evict(file_id: str):
+    # Unsaved edits go to the spill area so a later get() sees them again
+    if file_id in _dirty:
+        if not _spill(file_id, dataframes[file_id]):
+            return False
+        _dirty.discard(file_id)
+    _drop(file_id)
+    _stats["evictions"] += 1
+    return True
+
+
+def _expire_idle(now: float):
+    if TTL_SECONDS <= 0:
+        return
+    for file_id in list(dataframes):
+        if now - _last_access[file_id] > TTL_SECONDS and _evict(file_id):
+            _stats["expired"] += 1
+
+
+def _enforce_budget(keep: str | None = None):
+    total = sum(_sizes.values())
+    for file_id in list(dataframes):
+        if total <= MAX_BYTES:
+            break
+        if file_id == keep:
+            continue
+        size = _sizes[file_id]
+        if _evict(file_id):
+            total -= size
+
+
+def frame_key(file_id: str, sheet: str | None = None) -> str:
+    # The first sheet is cached under the bare file_id; other sheets get their own entry
+    return file_id if sheet is None else f"{file_id}:{sheet}"
+
+
+def _load_sheet_names(file_id: str) -> list[str] | None:
+    if file_id not in _sheet_names:
+        path = os.path.join(UPLOAD_DIR, f"{file_id}.xlsx")
+        if not os.path.exists(path):
+            return None
+        _sheet_names[file_id] = sheet_names(path)
+    return _sheet_names[file_id]
+
+
+def _resolve_sheet(file_id: str, sheet: str) -> tuple[bool, str | None]:
+    """Map a sheet name to (exists, sheet-or-None-for-the-first-sheet)."""
+    names = _load_sheet_names(file_id)
+    if names is None or sheet not in names:
+        return False, None
+    return True, None if sheet == names[0] else sheet
+
+
+def _load_sheet(file_id: str, sheet: str) -> pd.DataFrame | None:
+    df = read_snapshot(file_id, sheet)
+    if df is None:
+        df, _ = optimize(read_rows(os.path.join(UPLOAD_DIR, f"{file_id}.xlsx"), sheet))
+        write_snapshot(file_id, df, sheet)
+    return df
+
+
+def _load_from_disk(file_id: str) -> tuple[pd.DataFrame | None, int]:
+    # Newest first: unsaved spill, then the columnar snapshot, then the .xlsx
+    df = read_frame(_spill_path(file_id))
+    if df is not None:
+        return df, read_seq(_spill_path(file_id))
+    df = read_snapshot(file_id)
+    if df is not None:
+        return df, read_seq(snapshot_path(file_id))
+    path = os.path.join(UPLOAD_DIR, f"{file_id}.xlsx")
+    if is_chunked(file_id):
+        return None, 0   # too big for memory; served chunk by chunk (services/chunk_store)
+    if os.path.exists(path):
+        df, report = optimize(pd.read_excel(path))
+        record(file_id, report)
+        if write_snapshot(file_id, df):
+            mark_in_sync(file_id)
+        return df, 0
+    return None, 0
+
+
+def put(file_id: str, df: pd.DataFrame, dirty: bool = True, seq: int | None = None):
+    """
+    Cache `df` under `file_id`. `dirty=False` means the frame matches what is
+    already on disk (e.g. fresh upload), so it can be evicted without a spill.
+    `seq` is the last journalled operation the frame includes; None keeps the
+    current one.
+    """
+    with _lock:
+        dataframes[file_id] = df
+        dataframes.move_to_end(file_id)
+        _sizes[file_id] = _frame_bytes(df)
+        _seqs[file_id] = _seqs.get(file_id, 0) if seq is None else seq
+        if not seq or file_id not in _epochs:
+            _epochs[file_id] = uuid.uuid4().hex[:12]
+        _last_access[file_id] = time.monotonic()
+        if dirty:
+            _dirty.add(file_id)
+        else:
+            _dirty.discard(file_id)
+        if _backend.shared and ":" not in file_id:
+            token = f"{_epochs[file_id]}-{_seqs[file_id]}"
+            _backend.publish(file_id, df, token)
+            _shared_tokens[file_id] = token
+            _stats["publishes"] += 1
+        _enforce_budget(keep=file_id)
+
+
+def _sync_shared(file_id: str):
+    """
+    Bring the cached frame up to date with the shared store if another worker
+    published a newer one. The store is asked without holding _lock (with
+    redis it is a network round trip); the lock only guards the swap.
+    """
+    token = _backend.current(file_id)
+    if token is None:
+        return
+    with _lock:
+        seen = _shared_tokens.get(file_id)
+        if seen == token and file_id in dataframes:
+            return
+    fetched = _backend.fetch(file_id)
+    if fetched is None:
+        return
+    df, token = fetched
+    with _lock:
+        if _shared_tokens.get(file_id) != seen:
+            return   # another thread adopted or published a frame meanwhile; keep that one
+        _stats["fetches"] += 1
+        # Cached locally as is, not published back: the shared copy already is this frame
+        dataframes[file_id] = df
+        dataframes.move_to_end(file_id)
+        _sizes[file_id] = _frame_bytes(df)
+        _seqs[file_id] = token_seq(token)
+        _epochs[file_id] = token.rsplit("-", 1)[0]
+        if seen != token:
+            _generations[file_id] = _generations.get(file_id, 0) + 1
+        _shared_tokens[file_id] = token
+        _last_access[file_id] = time.monotonic()
+        _dirty.discard(file_id)   # it is the other worker's edits; the shared copy holds them
+        _enforce_budget(keep=file_id)
+
+
+def get(file_id: str, sheet: str | None = None) -> pd.DataFrame | None:
+    """
+    Return the cached frame, reloading it from disk on a miss. `sheet` selects
+    a sheet other than the first by name; it is loaded lazily on first use.
+    """
+    if _backend.shared and sheet is None:
+        _sync_shared(file_id)
+    with _lock:
+        return _get(file_id, sheet)
+
+
+def _get(file_id: str, sheet: str | None = None) -> pd.DataFrame | None:
+    # get() without the shared-store check; callers hold _lock
+    if sheet is not None:
+        exists, sheet = _resolve_sheet(file_id, sheet)
+        if not exists:
+            return None
+    key = frame_key(file_id, sheet)
+
+    now = time.monotonic()
+    _expire_idle(now)
+
+    df = dataframes.get(key)
+    if df is not None:
+        _stats["hits"] += 1
+        dataframes.move_to_end(key)
+        _last_access[key] = now
+        return df
+
+    _stats["misses"] += 1
+    if sheet is None:
+        df, seq = _load_from_disk(file_id)
+    else:
+        df, seq = _load_sheet(file_id, sheet), 0
+    if df is None:
+        return None
+
+    _stats["reloads"] += 1
+    # A reloaded spill still differs from the .xlsx, so keep it dirty
+    put(key, df, dirty=os.path.exists(_spill_path(key)), seq=seq)
+    return df
+
+
+def get_with_seq(file_id: str) -> tuple[pd.DataFrame | None, int]:
+    """The cached frame together with the last journalled operation it includes."""
+    if _backend.shared:
+        _sync_shared(file_id)
+    with _lock:
+        df = _get(file_id)
+        return df, _seqs.get(file_id, 0)
+
+
+def get_with_token(file_id: str) -> tuple[pd.DataFrame | None, str | None]:
+    """
+    The cached frame and a token that changes whenever its content does, for
+    caching things derived from it (see services/exporter).
+    """
+    if _backend.shared:
+        _sync_shared(file_id)
+    with _lock:
+        df = _get(file_id)
+        if df is None:
+            return None, None
+        return df, f"{_epochs[file_id]}-{_seqs.get(file_id, 0)}"
+
+
+def journal_seq(file_id: str) -> int:
+    with _lock:
+        return _seqs.get(file_id, 0)
 
-def get(file_id: str) -> pd.DataFrame | None:
-    return dataframes.get(file_id)
 
 def delete(file_id: str):
-    dataframes.pop(file_id, None)
\ No newline at end of file
+    with _lock:
+        _sheet_names.pop(file_id, None)
+        forget_report(file_id)
+        for key in [k for k in dataframes if k.startswith(f"{file_id}:")] + [file_id]:
+            _drop(key)
+            _epochs.pop(key, None)
+        _shared_tokens.pop(file_id, None)
+        _backend.delete(file_id)
+        _dirty.discard(file_id)
+        if os.path.exists(_spill_path(file_id)):
+            os.remove(_spill_path(file_id))
+
+
+def mark_clean(file_id: str, seq: int | None = None):
+    """
+    Call after the cached frame has been written back to uploads/. With `seq`,
+    only if the cached frame hasn't moved past that operation in the meantime.
+    """
+    with _lock:
+        if seq is not None and _seqs.get(file_id, 0) != seq:
+            return
+        _dirty.discard(file_id)
+        if os.path.exists(_spill_path(file_id)):
+            os.remove(_spill_path(file_id))
+
+
+def generation(file_id: str) -> int:
+    """How many times a frame published by another worker replaced the cached one."""
+    with _lock:
+        return _generations.get(file_id, 0)
+
+
+def shared_seq(file_id: str) -> int | None:
+    """Journal seq of the frame in the shared store; None when nothing is shared."""
+    token = _backend.current(file_id) if _backend.shared else None
+    return token_seq(token) if token is not None else None
+
+
+@contextmanager
+def mutation(file_id: str):
+    """
+    Hold while reading, changing and storing a frame: one edit per file at a
+    time across threads and, with a shared store, across worker processes.
+    Reentrant. Does nothing with the local store, where the event loop
+    already runs edits one at a time.
+    """
+    if not _backend.shared:
+        yield
+        return
+    with _lock:
+        lock = _mutation_locks.setdefault(file_id, threading.RLock())
+    with lock:
+        depth = _mutation_depth.get(file_id, 0)
+        _mutation_depth[file_id] = depth + 1
+        try:
+            if depth:
+                yield
+            else:
+                with _backend.lock(file_id):
+                    yield
+        finally:
+            _mutation_depth[file_id] = depth
+
+
+def is_dirty(file_id: str) -> bool:
+    with _lock:
+        return file_id in _dirty
+
+
+def list_sheets(file_id: str) -> list[str] | None:
+    with _lock:
+        return _load_sheet_names(file_id)
+
+
+def get_stats() -> dict:
+    with _lock:
+        lookups = _stats["hits"] + _stats["misses"]
+        return {
+            **_stats,
+            "hit_rate": _stats["hits"] / lookups if lookups else 0.0,
+            "frames": len(dataframes),
+            "bytes": sum(_sizes.values()),
+            "max_bytes": MAX_BYTES,
+            "dirty": len(_dirty),
+            "backend": _backend.name,
+        }
@@ -0,0 +1,258 @@
+import hmac
+import os
+import sys
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter as _Tally
+from contextlib import contextmanager
+from typing import Callable, Dict
+from urllib.parse import parse_qs
+
+# Prometheus-style metrics, rendered in the text exposition format at /metrics
+# without a client library. Three kinds of data:
+#   - request latency and bytes in/out per route (MetricsMiddleware);
+#   - per-stage latency of the hot paths: `with stage("excel_parse"): ...`;
+#   - gauges read from each service's get_stats() at scrape time (collectors).
+# An opt-in sampling profiler turns any request into a flame graph: send
+# ?profile=1 with the X-Profile-Token header matching EXCELSIOR_PROFILE_TOKEN,
+# and the response is the request's stacks in collapsed ("folded") format, as
+# read by flamegraph.pl and speedscope. Unset token, no profiling.
+
+PREFIX = "excelsior"
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+PROFILE_TOKEN = os.getenv("EXCELSIOR_PROFILE_TOKEN")
+PROFILE_INTERVAL = float(os.getenv("EXCELSIOR_PROFILE_INTERVAL_MS", 5)) / 1000
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _number(value) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def _labels(names: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labels: tuple = ()):
+        self.name, self.help, self.labelnames = f"{PREFIX}_{name}_total", help, labels
+        self._values: Dict[tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, *labels):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self) -> list[str]:
+        with self._lock:
+            values = dict(self._values)
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        lines += [f"{self.name}{_labels(self.labelnames, k)} {_number(v)}" for k, v in sorted(values.items())]
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labels: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        self.name, self.help, self.labelnames, self.buckets = f"{PREFIX}_{name}", help, labels, buckets
+        self._values: Dict[tuple, list] = {}   # labels -> [count per bucket..., +Inf count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels):
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._values.get(labels)
+            if counts is None:
+                counts = self._values[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            counts[i] += 1
+            counts[-1] += value
+
+    def render(self) -> list[str]:
+        with self._lock:
+            values = {k: list(v) for k, v in self._values.items()}
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for key, counts in sorted(values.items()):
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float("inf"),), counts):
+                cumulative += n
+                le = 'le="+Inf"' if bound == float("inf") else f'le="{bound:g}"'
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {counts[-1]:.6f}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+
+HTTP_SECONDS = Histogram("http_request_duration_seconds", "Request latency by route.", ("method", "route", "status"))
+HTTP_BYTES_IN = Counter("http_request_bytes", "Request body bytes by route.", ("method", "route"))
+HTTP_BYTES_OUT = Counter("http_response_bytes", "Response body bytes by route.", ("method", "route"))
+STAGE_SECONDS = Histogram("stage_duration_seconds", "Time spent in each hot-path stage.", ("stage",))
+LLM_SECONDS = Histogram("llm_request_duration_seconds", "Upstream LLM call latency.", ("model", "outcome"))
+LLM_TOKENS = Counter("llm_tokens", "Tokens reported by the LLM API.", ("model", "kind"))
+
+_METRICS = [HTTP_SECONDS, HTTP_BYTES_IN, HTTP_BYTES_OUT, STAGE_SECONDS, LLM_SECONDS, LLM_TOKENS]
+_collectors: Dict[str, Callable[[], dict]] = {}
+
+
+@contextmanager
+def stage(name: str):
+    """Time the enclosed block into the stage latency histogram."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_SECONDS.observe(time.perf_counter() - start, name)
+
+
+def timed_iter(name: str, chunks):
+    """Yield from `chunks`, timing only the work of producing them (not the time spent sending)."""
+    elapsed = 0.0
+    iterator = iter(chunks)
+    try:
+        while True:
+            start = time.perf_counter()
+            try:
+                chunk = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                elapsed += time.perf_counter() - start
+            yield chunk
+    finally:
+        STAGE_SECONDS.observe(elapsed, name)
+
+
+def observe_llm(model: str, seconds: float, usage=None, outcome: str = "ok"):
+    LLM_SECONDS.observe(seconds, model, outcome)
+    if usage is not None:
+        LLM_TOKENS.inc(getattr(usage, "prompt_tokens", 0) or 0, model, "prompt")
+        LLM_TOKENS.inc(getattr(usage, "completion_tokens", 0) or 0, model, "completion")
+
+
+def register_collector(component: str, get_stats: Callable[[], dict]):
+    """Export every number in get_stats() as gauge excelsior_<component>_<key> at scrape time."""
+    _collectors[component] = get_stats
+
+
+def render() -> str:
+    lines = []
+    for metric in _METRICS:
+        lines += metric.render()
+    for component, get_stats in _collectors.items():
+        for key, value in get_stats().items():
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                continue
+            name = f"{PREFIX}_{component}_{key}"
+            lines += [f"# TYPE {name} gauge", f"{name} {_number(value)}"]
+    return "\n".join(lines) + "\n"
+
+
+# -- sampling profiler --------------------------------------------------------
+
+_IDLE = {("threading", "wait"), ("selectors", "select"), ("thread", "_worker"), ("queue", "get")}
+
+
+class _Sampler(threading.Thread):
+    """Samples every other thread's Python stack until stopped; idle threads are skipped."""
+
+    def __init__(self, interval: float):
+        super().__init__(name="excelsior-profiler", daemon=True)
+        self.interval = interval
+        self.stacks = _Tally()
+        self.samples = 0
+        self._stop_event = threading.Event()
+
+    def run(self):
+        me = threading.get_ident()
+        while not self._stop_event.wait(self.interval):
+            names = {t.ident: t.name for t in threading.enumerate()}
+            self.samples += 1
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                stack = []
+                while frame is not None:
+                    module = os.path.splitext(os.path.basename(frame.f_code.co_filename))[0]
+                    stack.append(f"{module}:{frame.f_code.co_name}")
+                    frame = frame.f_back
+                leaf = tuple(stack[0].split(":", 1))
+                if leaf in _IDLE:
+                    continue
+                stack.append(names.get(ident, str(ident)))
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def stop(self) -> str:
+        self._stop_event.set()
+        self.join()
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+def _wants_profile(scope) -> bool:
+    if not PROFILE_TOKEN:
+        return False
+    query = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+    if query.get("profile", ["0"])[-1] not in {"1", "true"}:
+        return False
+    headers = dict(scope.get("headers") or [])
+    # Constant-time, so response timing doesn't reveal how much of a guess matched
+    return hmac.compare_digest(headers.get(b"x-profile-token", b""), PROFILE_TOKEN.encode())
+
+
+class MetricsMiddleware:
+    """ASGI middleware: latency, status and body bytes per route, plus ?profile=1."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        sizes = {"in": 0, "out": 0}
+        status = [500]
+        sampler = _Sampler(PROFILE_INTERVAL) if _wants_profile(scope) else None
+
+        async def counting_receive():
+            message = await receive()
+            if message["type"] == "http.request":
+                sizes["in"] += len(message.get("body", b""))
+            return message
+
+        async def counting_send(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            elif message["type"] == "http.response.body":
+                sizes["out"] += len(message.get("body", b""))
+            if sampler is None:
+                await send(message)
+
+        if sampler is not None:
+            sampler.start()
+        try:
+            await self.app(scope, counting_receive, counting_send)
+        finally:
+            route = scope.get("route")
+            path = getattr(route, "path", "<unmatched>")
+            method = scope.get("method", "")
+            HTTP_SECONDS.observe(time.perf_counter() - start, method, path, status[0])
+            HTTP_BYTES_IN.inc(sizes["in"], method, path)
+            HTTP_BYTES_OUT.inc(sizes["out"], method, path)
+            profile = sampler.stop().encode() if sampler is not None else None
+
+        if profile is not None:
+            # The profiled response itself is dropped; its status travels in a header
+            await send({"type": "http.response.start", "status": 200, "headers": [
+                (b"content-type", b"text/plain; charset=utf-8"),
+                (b"content-length", str(len(profile)).encode()),
+                (b"x-profiled-status", str(status[0]).encode()),
+                (b"x-profile-samples", str(sampler.samples).encode()),
+            ]})
+            await send({"type": "http.response.body", "body": profile})
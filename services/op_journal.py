@@ -0,0 +1,254 @@
+import asyncio
+import os
+import threading
+import zlib
+from dataclasses import dataclass, field
+from typing import Dict
+
+from services.serializer import dumps
+
+try:
+    import orjson
+    _loads = orjson.loads
+except ImportError:  # pragma: no cover - orjson is in requirements.txt
+    import json
+    _loads = json.loads
+
+UPLOAD_DIR = "uploads"
+
+# Append-only log of the edits made to each cached frame, uploads/{id}.journal.
+# Every record is one line, "<crc32> {"seq": n, "op": {...}}". The op is the
+# request that produced the edit, not the resulting data, so a durable edit
+# costs a few hundred bytes instead of a rewrite of the workbook. Stored frames
+# (snapshots, spills) carry the seq of the last op they include; recovery loads
+# one and replays the records after it (see services/operations).
+#
+# EXCELSIOR_JOURNAL_SYNC: "batch" (default) lets concurrent edits share one
+# fsync (group commit), "always" fsyncs every record, "off" leaves it to the OS.
+SYNC_MODE = os.getenv("EXCELSIOR_JOURNAL_SYNC", "batch")
+GROUP_COMMIT_MS = float(os.getenv("EXCELSIOR_JOURNAL_GROUP_MS", 2))
+# A checkpoint writes a fresh snapshot and compacts the log past either limit
+CHECKPOINT_OPS = int(os.getenv("EXCELSIOR_JOURNAL_CHECKPOINT_OPS", 500))
+CHECKPOINT_BYTES = int(os.getenv("EXCELSIOR_JOURNAL_CHECKPOINT_BYTES", 16 * 1024 * 1024))
+
+
+@dataclass
+class _Journal:
+    fd: int
+    seq: int = 0               # last seq written
+    synced: int = 0            # last seq known to be on disk
+    records: int = 0           # records currently in the file
+    size: int = 0
+    syncing: asyncio.Future | None = None
+    lock: threading.Lock = field(default_factory=threading.Lock)
+
+
+_journals: Dict[str, _Journal] = {}
+_lock = threading.Lock()
+_stats = {"records": 0, "bytes": 0, "fsyncs": 0, "checkpoints": 0}
+
+
+def journal_path(file_id: str) -> str:
+    return os.path.join(UPLOAD_DIR, f"{file_id}.journal")
+
+
+def _encode(seq: int, op: dict) -> bytes:
+    payload = dumps({"seq": seq, "op": op})
+    return b"%08x " % zlib.crc32(payload) + payload + b"\n"
+
+
+def _decode(line: bytes) -> tuple[int, dict] | None:
+    crc, _, payload = line.rstrip(b"\n").partition(b" ")
+    try:
+        if int(crc, 16) != zlib.crc32(payload):
+            return None
+        record = _loads(payload)
+    except ValueError:
+        return None
+    return record["seq"], record["op"]
+
+
+def _replaced(journal: _Journal, path: str) -> bool:
+    # Another worker process compacted (or removed) the file under our descriptor
+    try:
+        return os.stat(path).st_ino != os.fstat(journal.fd).st_ino
+    except FileNotFoundError:
+        return True
+
+
+def _journal(file_id: str) -> _Journal:
+    with _lock:
+        journal = _journals.get(file_id)
+        if journal is not None and _replaced(journal, journal_path(file_id)):
+            with journal.lock:
+                os.close(journal.fd)
+            del _journals[file_id]
+            journal = None
+        if journal is None:
+            os.makedirs(UPLOAD_DIR, exist_ok=True)
+            path = journal_path(file_id)
+            existing, valid = _scan(path)
+            fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+            # Cut off a torn tail, or records appended after it would never be read
+            os.ftruncate(fd, valid)
+            journal = _Journal(fd, records=len(existing), size=valid)
+            if existing:
+                journal.seq = journal.synced = existing[-1][0]
+            _journals[file_id] = journal
+        return journal
+
+
+def record(file_id: str, seq: int, op: dict):
+    """
+    Append `op` as operation `seq` of file_id. The record is handed to the OS
+    right away; call flush()/sync() before acknowledging it as durable.
+    """
+    journal = _journal(file_id)
+    line = _encode(seq, op)
+    with journal.lock:
+        os.write(journal.fd, line)
+        journal.seq = seq
+        journal.records += 1
+        journal.size += len(line)
+        if SYNC_MODE == "always":
+            os.fsync(journal.fd)
+            journal.synced = seq
+            _stats["fsyncs"] += 1
+    _stats["records"] += 1
+    _stats["bytes"] += len(line)
+
+
+def _fsync(journal: _Journal) -> int:
+    # fsync a duplicate so appends (and compact() swapping the file) don't wait on the disk
+    with journal.lock:
+        upto = journal.seq
+        fd = os.dup(journal.fd)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+    _stats["fsyncs"] += 1
+    return upto
+
+
+def sync(file_id: str):
+    """Block until every record written for file_id is on disk."""
+    journal = _journals.get(file_id)
+    if journal is None or SYNC_MODE == "off" or journal.synced >= journal.seq:
+        return
+    journal.synced = max(journal.synced, _fsync(journal))
+
+
+async def _group_commit(journal: _Journal):
+    try:
+        # Give edits arriving in the same instant a chance to share this fsync
+        if GROUP_COMMIT_MS > 0:
+            await asyncio.sleep(GROUP_COMMIT_MS / 1000)
+        upto = await asyncio.to_thread(_fsync, journal)
+        journal.synced = max(journal.synced, upto)
+    finally:
+        journal.syncing = None
+
+
+async def flush(file_id: str):
+    """Wait until every record written for file_id so far is on disk."""
+    journal = _journals.get(file_id)
+    if journal is None or SYNC_MODE == "off":
+        return
+    target = journal.seq
+    while journal.synced < target:
+        if journal.syncing is None:
+            journal.syncing = asyncio.ensure_future(_group_commit(journal))
+        await asyncio.shield(journal.syncing)
+
+
+def _scan(path: str) -> tuple[list[tuple[int, dict]], int]:
+    # Stops at the first torn or corrupt line: that is where a crash interrupted a write
+    records, valid = [], 0
+    if not os.path.exists(path):
+        return records, valid
+    with open(path, "rb") as f:
+        for line in f:
+            decoded = _decode(line) if line.endswith(b"\n") else None
+            if decoded is None:
+                break
+            records.append(decoded)
+            valid += len(line)
+    return records, valid
+
+
+def read_records(file_id: str, after: int = 0) -> list[tuple[int, dict]]:
+    """(seq, op) for the intact records after `after`, in order."""
+    records, _ = _scan(journal_path(file_id))
+    return [(seq, op) for seq, op in records if seq > after]
+
+
+def needs_checkpoint(file_id: str) -> bool:
+    journal = _journals.get(file_id)
+    return journal is not None and (journal.records >= CHECKPOINT_OPS or journal.size >= CHECKPOINT_BYTES)
+
+
+def _rewrite(file_id: str, keep: list[tuple[int, dict]]):
+    journal = _journal(file_id)
+    path = journal_path(file_id)
+    with journal.lock:
+        tmp = path + ".tmp"
+        with open(tmp, "wb") as f:
+            for seq, op in keep:
+                f.write(_encode(seq, op))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+        os.close(journal.fd)
+        journal.fd = os.open(path, os.O_WRONLY | os.O_APPEND)
+        journal.records = len(keep)
+        journal.size = os.fstat(journal.fd).st_size
+        journal.seq = journal.synced = keep[-1][0] if keep else journal.seq
+    if not keep:
+        # Nothing left to replay, so recovery can skip this file entirely. Callers
+        # hold the frame's version lock, so no record() can slip in here.
+        close(file_id)
+        os.remove(path)
+
+
+def compact(file_id: str, upto: int):
+    """Drop the records up to and including `upto`, now covered by a checkpoint."""
+    _rewrite(file_id, read_records(file_id, after=upto))
+    _stats["checkpoints"] += 1
+
+
+def discard_after(file_id: str, seq: int):
+    """Drop the records after `seq`, e.g. ones that could not be replayed."""
+    _rewrite(file_id, [(s, op) for s, op in read_records(file_id) if s <= seq])
+
+
+def journaled_files() -> list[str]:
+    """File ids with a journal on disk."""
+    if not os.path.isdir(UPLOAD_DIR):
+        return []
+    return sorted(name[:-len(".journal")] for name in os.listdir(UPLOAD_DIR) if name.endswith(".journal"))
+
+
+def pending(file_id: str) -> int:
+    journal = _journals.get(file_id)
+    return journal.records if journal is not None else len(read_records(file_id))
+
+
+def close(file_id: str):
+    with _lock:
+        journal = _journals.pop(file_id, None)
+    if journal is not None:
+        with journal.lock:
+            if SYNC_MODE != "off":
+                os.fsync(journal.fd)
+            os.close(journal.fd)
+
+
+def close_all():
+    for file_id in list(_journals):
+        close(file_id)
+
+
+def get_stats() -> dict:
+    with _lock:
+        return {**_stats, "open": len(_journals), "pending": sum(j.records for j in _journals.values())}
@@ -0,0 +1,192 @@
+import asyncio
+import os
+import pandas as pd
+
+from exceptions import ExcelOperationError, InvalidActionSchema, FileNotFound
+from services import frame_versions, op_journal, frame_index, aggregator, formula_engine
+from services import memory_store
+from services.cell_patch import patch_cells, column_values
+from services.dtype_optimizer import optimize
+from services.metrics import stage
+from services.excel_modifier import build_action
+from services.file_status import update_status
+from services.frame_versions import CellDelta, ColumnDelta
+from services.xlsx_writer import write_xlsx
+from services.snapshot import write_frame, read_snapshot, read_seq, snapshot_path, delete_snapshot
+
+UPLOAD_DIR = "uploads"
+
+# Edits as replayable operations. Every mutating endpoint goes through
+# apply_op(), which journals the op (services/op_journal) before the new frame
+# becomes visible. After a restart, replay() loads the last checkpoint and runs
+# the journalled ops through the same code again. Ops:
+#
+#   {"kind": "cells", "updates": [{"row", "column", "value"}, ...]}
+#   {"kind": "column", "column", "value", "operation", "delta"}
+#   {"kind": "action", "action": {"operation": "sort" | "filter" | "update" | "pipeline" | "add_column", ...}}
+#   {"kind": "undo"}   {"kind": "redo"}
+
+
+def _build(file_id: str, df: pd.DataFrame, op: dict):
+    with stage("frame_op"):
+        return _build_op(file_id, df, op)
+
+
+def _build_op(file_id: str, df: pd.DataFrame, op: dict):
+    kind = op.get("kind")
+    # Cell and column patches also recompute the computed columns reading them (services/formula_engine)
+    if kind == "cells":
+        patched, touched = patch_cells(df, op["updates"])
+        return formula_engine.recalculate(file_id, df, patched, CellDelta.capture(df, patched, touched))
+    if kind == "column":
+        new_col = column_values(df, op["column"], op.get("value"), op.get("operation"), op.get("delta"))
+        patched = df.copy(deep=False)
+        patched[op["column"]] = new_col
+        return formula_engine.recalculate(file_id, df, patched, ColumnDelta.capture(df, patched, op["column"]))
+    if kind == "action":
+        return build_action(file_id, df, op["action"])
+    raise InvalidActionSchema(f"Unknown operation kind '{kind}'")
+
+
+def apply_op(file_id: str, op: dict, journal: bool = True) -> tuple[pd.DataFrame, int]:
+    """
+    Apply `op` to the cached frame and commit it as a new version. Returns
+    (new frame, version). Raises FileNotFound, ExcelOperationError or
+    InvalidActionSchema; a rejected op is neither applied nor journalled.
+    """
+    with memory_store.mutation(file_id):
+        kind = op.get("kind")
+        if kind in {"undo", "redo"}:
+            if memory_store.get(file_id) is None:
+                raise FileNotFound(file_id)
+            step = frame_versions.undo if kind == "undo" else frame_versions.redo
+            replayable = frame_versions.replayable(file_id, kind)
+            result = step(file_id, journal=journal)
+            if result is None:
+                raise ExcelOperationError(f"Nothing to {kind}.")
+            if journal and not replayable:
+                # The step reached back past the last checkpoint, where replay has no
+                # history to undo or redo: make its result the checkpoint instead
+                checkpoint(file_id)
+            return result
+
+        df = memory_store.get(file_id)
+        if df is None:
+            raise FileNotFound(file_id)
+        patched, delta = _build(file_id, df, op)
+        version = frame_versions.commit(file_id, patched, delta, op=op if journal else None)
+        return patched, version
+
+
+async def durable(file_id: str):
+    """
+    Wait until the file's journalled ops are on disk (one fsync shared by
+    concurrent edits), then checkpoint in the background if the log is long.
+    """
+    await op_journal.flush(file_id)
+    if op_journal.needs_checkpoint(file_id):
+        await asyncio.to_thread(checkpoint, file_id)
+
+
+def checkpoint(file_id: str) -> bool:
+    """
+    Write the current frame as the new base snapshot and compact the journal.
+    Returns False when the file isn't loaded or an edit raced the write.
+    """
+    df, seq = frame_versions.frame_with_seq(file_id)
+    if df is None:
+        return False
+    if not memory_store.is_dirty(file_id) and op_journal.pending(file_id) == 0:
+        return True   # the base on disk already is the current frame
+
+    # Stage the copy, then publish it only if the frame is still at `seq`
+    snapshot = snapshot_path(file_id)
+    staged = snapshot + ".ckpt"
+    if write_frame(staged, df, seq):
+        def publish():
+            os.replace(staged, snapshot)
+    else:
+        # Not representable in Arrow: the .xlsx becomes the base instead
+        xlsx = os.path.join(UPLOAD_DIR, f"{file_id}.xlsx")
+        staged = xlsx + ".ckpt"
+        write_xlsx(df, staged)
+
+        def publish():
+            os.replace(staged, xlsx)
+            delete_snapshot(file_id)
+
+    if frame_versions.checkpointed(file_id, seq, publish):
+        return True
+    os.remove(staged)
+    return False
+
+
+def _load_base(file_id: str) -> tuple[pd.DataFrame | None, int | None]:
+    # The checkpoint, never a spill: undo history (and so replay) starts there
+    df = read_snapshot(file_id)
+    if df is not None:
+        return df, read_seq(snapshot_path(file_id))
+    xlsx = os.path.join(UPLOAD_DIR, f"{file_id}.xlsx")
+    if os.path.exists(xlsx):
+        return optimize(pd.read_excel(xlsx))[0], None
+    return None, None
+
+
+def replay(file_id: str) -> int:
+    """
+    Rebuild file_id's frame and undo history from its checkpoint plus journal.
+    Returns the number of ops replayed. Ops that fail to replay, and any after
+    them, are dropped from the journal.
+    """
+    with memory_store.mutation(file_id):
+        records = op_journal.read_records(file_id)
+        if not records:
+            return 0
+        shared = memory_store.shared_seq(file_id)
+        if shared is not None and shared >= records[-1][0]:
+            return 0   # another worker recovered it already; get() serves the shared copy
+        return _replay(file_id, records)
+
+
+def _replay(file_id: str, records: list[tuple[int, dict]]) -> int:
+    df, base = _load_base(file_id)
+    if df is None:
+        return 0
+    if base is None:
+        # The .xlsx carries no seq; compaction left the log starting right after it
+        base = records[0][0] - 1
+
+    memory_store.delete(file_id)
+    frame_versions.forget(file_id)
+    frame_index.forget(file_id)
+    aggregator.forget(file_id)
+    memory_store.put(file_id, df, dirty=False, seq=base)
+
+    applied = 0
+    for seq, op in records:
+        if seq <= base:
+            continue   # the checkpoint already includes it
+        if seq != memory_store.journal_seq(file_id) + 1:
+            break
+        try:
+            apply_op(file_id, op, journal=False)
+        except (ExcelOperationError, InvalidActionSchema, FileNotFound, KeyError, ValueError) as e:
+            print(f"[JOURNAL] {file_id}: stopped replay at op {seq}: {e}")
+            break
+        applied += 1
+
+    last = memory_store.journal_seq(file_id)
+    if records[-1][0] > last:
+        op_journal.discard_after(file_id, last)
+    return applied
+
+
+def recover_all() -> dict[str, int]:
+    """Replay every journal left on disk, e.g. after a crash. {file_id: ops replayed}"""
+    recovered = {}
+    for file_id in op_journal.journaled_files():
+        applied = replay(file_id)
+        if applied:
+            update_status(file_id, f"modified (recovered {applied} ops)")
+        recovered[file_id] = applied
+    return recovered
@@ -0,0 +1,164 @@
+import os
+import shutil
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from exceptions import ExcelOperationError
+from services import change_feed
+from services.cell_patch import column_values
+from services.chunk_store import (BATCH_ROWS, CHUNK_OVERHEAD, MEMORY_BUDGET, ChunkWriter, Manifest, chunk_dir,
+                                  concat_frames, iter_chunks, locked, publish, read_batches, require_manifest)
+from services.frame_versions import sort_order
+from services.query_engine import filter_mask, parse
+
+# The data endpoints for files in the out-of-core mode (services/chunk_store),
+# one chunk in memory at a time: filters scan, a sort preview keeps a running
+# top-N, and a persisted sort is an external merge sort. Edits write a new
+# generation of chunks under the file's lock.
+
+
+def filter_rows(file_id: str, expr: dict, rows: int) -> tuple[int, pd.DataFrame]:
+    """(number of matching rows, the first `rows` of them), scanning chunk by chunk."""
+    manifest = require_manifest(file_id)
+    node = parse(expr, manifest.columns)
+    count, found = 0, []
+    for _, chunk in iter_chunks(manifest):
+        positions = np.flatnonzero(filter_mask(node, chunk))
+        count += len(positions)
+        kept = sum(len(f) for f in found)
+        if kept < rows and len(positions):
+            found.append(chunk.take(positions[:rows - kept]))
+    return count, concat_frames(found or [manifest.empty()])
+
+
+def _check_column(manifest: Manifest, column: str):
+    if column not in manifest.columns:
+        raise ExcelOperationError(f"Column '{column}' not found.")
+
+
+def _sort_order(df: pd.DataFrame, column: str, ascending: bool) -> np.ndarray:
+    try:
+        return sort_order(df, column, ascending)
+    except TypeError as e:
+        raise ExcelOperationError(f"Column '{column}' can't be sorted: {e}")
+
+
+def sort_head(file_id: str, column: str, ascending: bool, rows: int) -> pd.DataFrame:
+    """The first `rows` rows in sorted order (stable, missing last), keeping a running top-N."""
+    manifest = require_manifest(file_id)
+    _check_column(manifest, column)
+    best = None
+    for _, chunk in iter_chunks(manifest):
+        # `best` holds earlier rows than `chunk`, so the stable sort keeps ties in sheet order
+        merged = chunk if best is None else pd.concat([best, chunk], ignore_index=True)
+        best = merged.take(_sort_order(merged, column, ascending)[:rows]).reset_index(drop=True)
+    return manifest.empty() if best is None else best
+
+
+# -- editing ------------------------------------------------------------------
+
+def patch_column(file_id: str, column: str, value=None, operation: str | None = None,
+                 delta: int | float | None = None) -> int:
+    """PATCH /data/{file_id}/column applied chunk by chunk into a new generation; returns it."""
+    with locked(file_id):
+        manifest = require_manifest(file_id)
+        _check_column(manifest, column)
+        generation = manifest.generation + 1
+        writer = ChunkWriter(os.path.join(chunk_dir(file_id), f"g{generation}"), manifest.row_bytes)
+        try:
+            for _, chunk in iter_chunks(manifest):
+                chunk[column] = column_values(chunk, column, value, operation, delta)
+                writer.add(chunk)
+            publish(file_id, writer.close(manifest.columns), generation)
+        except BaseException:
+            shutil.rmtree(writer.directory, ignore_errors=True)
+            raise
+    change_feed.publish(file_id, generation)
+    return generation
+
+
+class _Run:
+    """A sorted run on disk, read back one record batch at a time."""
+
+    def __init__(self, files: list[tuple[str, int]], schema: pa.Schema):
+        self._batches = (batch for path, _ in files for batch in read_batches(path, schema))
+        self.done = False
+
+    def next(self) -> pd.DataFrame | None:
+        batch = next(self._batches, None)
+        self.done = batch is None
+        return batch
+
+
+def _merge(runs: list[_Run], column: str, ascending: bool, out: ChunkWriter):
+    """
+    k-way merge of sorted runs. Each round merges what is buffered and emits
+    everything up to the earliest last-buffered row of a run that isn't
+    exhausted: nothing still on disk can sort before it. Runs are topped up to
+    a full batch before the next round, so every round emits about one batch
+    per run rather than one batch in all.
+    """
+    buffers = [run.next() for run in runs]
+    while True:
+        live = [i for i, buf in enumerate(buffers) if buf is not None and len(buf)]
+        if not live:
+            return
+        candidates = pd.concat([buffers[i] for i in live], ignore_index=True)   # run order breaks ties
+        order = _sort_order(candidates, column, ascending)
+        ends = np.cumsum([len(buffers[i]) for i in live])
+        pending = [ends[j] - 1 for j, i in enumerate(live) if not runs[i].done]
+        cut = len(order)
+        if pending:
+            ranks = np.empty(len(order), dtype=np.int64)
+            ranks[order] = np.arange(len(order))
+            cut = int(ranks[pending].min()) + 1
+        emitted = order[:cut]
+        out.add(candidates.take(emitted).reset_index(drop=True))
+        taken = np.bincount(np.searchsorted(ends, emitted, side="right"), minlength=len(live))
+        for j, i in enumerate(live):
+            rest = buffers[i].iloc[taken[j]:]
+            more = runs[i].next() if len(rest) < BATCH_ROWS and not runs[i].done else None
+            if more is not None:
+                rest = pd.concat([rest, more], ignore_index=True) if len(rest) else more
+            buffers[i] = rest
+
+
+def sort_persist(file_id: str, column: str, ascending: bool) -> int:
+    """Sort the whole file by `column` with an external merge sort into a new generation; returns it."""
+    with locked(file_id):
+        manifest = require_manifest(file_id)
+        _check_column(manifest, column)
+        generation = manifest.generation + 1
+        root = chunk_dir(file_id)
+        scratch = os.path.join(root, f"sort-g{generation}")
+        target = os.path.join(root, f"g{generation}")
+        try:
+            # 1. every chunk sorted on its own is a run
+            runs = []
+            for i, (_, chunk) in enumerate(iter_chunks(manifest)):
+                run = ChunkWriter(os.path.join(scratch, f"p0-{i:05d}"), manifest.row_bytes)
+                run.add(chunk.take(_sort_order(chunk, column, ascending)).reset_index(drop=True))
+                runs.append(run.close(manifest.columns).files)
+
+            # 2. merge as many runs at once as there is budget for up to two batches each
+            fan_in = max(2, int(MEMORY_BUDGET // (CHUNK_OVERHEAD * 2 * BATCH_ROWS * max(manifest.row_bytes, 1))))
+            level = 0
+            while len(runs) > fan_in:
+                level += 1
+                merged = []
+                for g in range(0, len(runs), fan_in):
+                    out = ChunkWriter(os.path.join(scratch, f"p{level}-{g:05d}"), manifest.row_bytes)
+                    _merge([_Run(files, manifest.schema) for files in runs[g:g + fan_in]], column, ascending, out)
+                    merged.append(out.close(manifest.columns).files)
+                runs = merged
+            out = ChunkWriter(target, manifest.row_bytes)
+            _merge([_Run(files, manifest.schema) for files in runs], column, ascending, out)
+            publish(file_id, out.close(manifest.columns), generation)
+        except BaseException:
+            shutil.rmtree(target, ignore_errors=True)
+            raise
+        finally:
+            shutil.rmtree(scratch, ignore_errors=True)
+    change_feed.publish(file_id, generation)
+    return generation
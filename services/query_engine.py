@@ -0,0 +1,244 @@
+from dataclasses import dataclass
+import numpy as np
+import pandas as pd
+
+from exceptions import InvalidActionSchema
+from services.frame_index import filter_positions, EQUALITY_OPS, RANGE_OPS
+from services.dtype_optimizer import wide_dtype
+
+# Filter expressions for /data/{file_id}/filter and the LLM "filter" action.
+# An expression is JSON:
+#
+#   {"and": [expr, ...]}   {"or": [expr, ...]}   {"not": expr}
+#   {"column": "Region", "op": "==", "value": "West"}
+#
+# Leaf ops: == != > < >= <= in not_in between contains startswith endswith
+# is_null not_null. Expressions are parsed into a small AST, checked against
+# the frame's columns and dtypes, and evaluated straight to NumPy masks; no
+# string is ever handed to DataFrame.query/eval. Inside and/or the cheapest
+# predicates run first and later ones only look at rows still undecided.
+
+COMPARISON_OPS = EQUALITY_OPS | RANGE_OPS
+LIST_OPS = {"in", "not_in"}
+STRING_OPS = {"contains", "startswith", "endswith"}
+NULL_OPS = {"is_null", "not_null"}
+LEAF_OPS = COMPARISON_OPS | LIST_OPS | STRING_OPS | NULL_OPS | {"between"}
+
+# Relative cost per row, used to order predicates inside and/or
+_COST = {"is_null": 1, "not_null": 1, "in": 3, "not_in": 3, "between": 2,
+         "contains": 20, "startswith": 10, "endswith": 10}
+_COMPARISON_COST = 2
+
+# Below this share of surviving rows, later predicates gather their rows first
+SUBSET_RATIO = 0.5
+
+
+@dataclass
+class Predicate:
+    column: str
+    op: str
+    value: object = None
+
+    @property
+    def cost(self) -> int:
+        return _COST.get(self.op, _COMPARISON_COST)
+
+
+@dataclass
+class And:
+    children: list
+
+    @property
+    def cost(self) -> int:
+        return sum(c.cost for c in self.children)
+
+
+@dataclass
+class Or:
+    children: list
+
+    @property
+    def cost(self) -> int:
+        return sum(c.cost for c in self.children)
+
+
+@dataclass
+class Not:
+    child: object
+
+    @property
+    def cost(self) -> int:
+        return self.child.cost
+
+
+def parse(expr: dict, columns: list[str]):
+    """Build the AST for `expr`, checking structure, operators and column names."""
+    if not isinstance(expr, dict):
+        raise InvalidActionSchema(f"Filter expression must be an object, got {type(expr).__name__}")
+
+    for key, node in (("and", And), ("or", Or)):
+        if key in expr:
+            children = expr[key]
+            if not isinstance(children, list) or not children:
+                raise InvalidActionSchema(f"'{key}' needs a non-empty list of expressions")
+            return node([parse(child, columns) for child in children])
+    if "not" in expr:
+        return Not(parse(expr["not"], columns))
+
+    column, op = expr.get("column"), expr.get("op", expr.get("operator"))
+    if column is None or op is None:
+        raise InvalidActionSchema("Predicate needs 'column' and 'op'")
+    if column not in columns:
+        raise InvalidActionSchema(f"Column '{column}' not found.")
+    if op not in LEAF_OPS:
+        raise InvalidActionSchema(f"Unsupported operator: {op}")
+
+    value = expr.get("value")
+    if op in NULL_OPS:
+        return Predicate(column, op)
+    if op in LIST_OPS and not isinstance(value, list):
+        raise InvalidActionSchema(f"'{op}' needs a list value")
+    if op == "between" and not (isinstance(value, list) and len(value) == 2):
+        raise InvalidActionSchema("'between' needs a [low, high] value")
+    if op in STRING_OPS and not isinstance(value, str):
+        raise InvalidActionSchema(f"'{op}' needs a string value")
+    if op in COMPARISON_OPS and ("value" not in expr or isinstance(value, (list, dict))):
+        raise InvalidActionSchema(f"'{op}' needs a single value")
+    return Predicate(column, op, value)
+
+
+def _is_text(dtype) -> bool:
+    if isinstance(dtype, pd.CategoricalDtype):
+        return _is_text(dtype.categories.dtype)
+    return pd.api.types.is_string_dtype(dtype) or pd.api.types.is_object_dtype(dtype)
+
+
+def _coerce(col: pd.Series, value):
+    # Query strings and LLM output often carry numbers/dates as text
+    if not isinstance(value, str) or _is_text(col.dtype):
+        return value
+    try:
+        # Through the wide dtype: "1000" must not overflow a column downcast to int8
+        return pd.Series([value]).astype(wide_dtype(col.dtype)).iloc[0]
+    except (ValueError, TypeError):
+        raise InvalidActionSchema(f"Cannot cast value {value!r} to column type {col.dtype}")
+
+
+def bind(node, df: pd.DataFrame):
+    """Check `node` against df's dtypes and coerce literal values to match."""
+    if isinstance(node, (And, Or)):
+        return type(node)([bind(child, df) for child in node.children])
+    if isinstance(node, Not):
+        return Not(bind(node.child, df))
+
+    col = df[node.column]
+    if node.op in STRING_OPS and not _is_text(col.dtype):
+        raise InvalidActionSchema(f"'{node.op}' needs a text column; '{node.column}' is {col.dtype}")
+    if node.op in NULL_OPS:
+        return node
+    if node.op in LIST_OPS or node.op == "between":
+        return Predicate(node.column, node.op, [_coerce(col, v) for v in node.value])
+    return Predicate(node.column, node.op, _coerce(col, node.value))
+
+
+def _as_mask(result) -> np.ndarray:
+    if isinstance(result, pd.Series):
+        return result.to_numpy(dtype=bool, na_value=False)
+    return np.asarray(result, dtype=bool)
+
+
+def _leaf(pred: Predicate, col: pd.Series) -> np.ndarray:
+    op, value = pred.op, pred.value
+    if isinstance(col.dtype, pd.CategoricalDtype) and (op in RANGE_OPS or op in STRING_OPS or op == "between"):
+        # Test each category once and look the answer up by code; this also
+        # sidesteps unordered categoricals refusing <, >
+        hit = _leaf(pred, pd.Series(col.dtype.categories))
+        return np.append(hit, False)[col.cat.codes.to_numpy()]   # code -1 (missing) hits the False
+    if op == "==":
+        return _as_mask(col.eq(value))
+    if op == "!=":
+        return _as_mask(col.ne(value))
+    if op == ">":
+        return _as_mask(col.gt(value))
+    if op == "<":
+        return _as_mask(col.lt(value))
+    if op == ">=":
+        return _as_mask(col.ge(value))
+    if op == "<=":
+        return _as_mask(col.le(value))
+    if op == "in":
+        return _as_mask(col.isin(value))
+    if op == "not_in":
+        return ~_as_mask(col.isin(value))
+    if op == "between":
+        return _as_mask(col.between(value[0], value[1]))
+    if op == "is_null":
+        return _as_mask(col.isna())
+    if op == "not_null":
+        return _as_mask(col.notna())
+    text = col.astype(str) if not pd.api.types.is_string_dtype(col.dtype) else col
+    if op == "contains":
+        return _as_mask(text.str.contains(value, regex=False, na=False))
+    if op == "startswith":
+        return _as_mask(text.str.startswith(value, na=False))
+    return _as_mask(text.str.endswith(value, na=False))
+
+
+def _evaluate(node, df: pd.DataFrame, rows: np.ndarray | None, file_id: str | None) -> np.ndarray:
+    """Mask over `rows` (positions into df), or over the whole frame when rows is None."""
+    n = len(df) if rows is None else len(rows)
+
+    if isinstance(node, Predicate):
+        if rows is None and file_id is not None and node.op in COMPARISON_OPS:
+            positions = filter_positions(file_id, df, node.column, node.op, node.value)
+            if positions is not None:
+                mask = np.zeros(n, dtype=bool)
+                mask[positions] = True
+                return mask
+        col = df[node.column]
+        if rows is None:
+            return _leaf(node, col)
+        if len(rows) < SUBSET_RATIO * len(df):
+            return _leaf(node, col.iloc[rows])
+        return _leaf(node, col)[rows]
+
+    if isinstance(node, Not):
+        return ~_evaluate(node.child, df, rows, file_id)
+
+    # and/or: cheapest first, each child only sees rows that are still undecided
+    is_and = isinstance(node, And)
+    result = np.full(n, is_and)
+    pending = np.arange(n)
+    for child in sorted(node.children, key=lambda c: c.cost):
+        positions = pending if rows is None else rows[pending]
+        sub = _evaluate(child, df, None if len(pending) == len(df) and rows is None else positions, file_id)
+        decided = ~sub if is_and else sub
+        result[pending[decided]] = not is_and
+        pending = pending[~decided]
+        if not len(pending):
+            break
+    return result
+
+
+def compile_filter(expr: dict | object, df: pd.DataFrame):
+    """Parse (if needed) and bind `expr` against df; returns the bound AST."""
+    node = parse(expr, df.columns.tolist()) if isinstance(expr, dict) else expr
+    return bind(node, df)
+
+
+def filter_mask(expr: dict | object, df: pd.DataFrame, file_id: str | None = None) -> np.ndarray:
+    """
+    Boolean mask of the rows matching `expr`. With `file_id`, simple
+    comparisons are answered from the cached indexes in services/frame_index.
+    Raises InvalidActionSchema for malformed or type-incompatible expressions.
+    """
+    node = compile_filter(expr, df)
+    try:
+        return _evaluate(node, df, None, file_id)
+    except TypeError as e:
+        raise InvalidActionSchema(f"Filter can't be applied: {e}")
+
+
+def to_expression(column: str, operator: str, value) -> dict:
+    """The single column/operator/value triple used by older callers."""
+    return {"column": column, "op": operator, "value": value}
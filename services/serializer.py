@@ -0,0 +1,179 @@
+import datetime
+import io
+import json
+import math
+from itertools import chain
+from typing import Iterable, Iterator
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+from fastapi.responses import Response
+
+from services.metrics import stage
+
+try:
+    import orjson
+except ImportError:   # stock json works, just slower
+    orjson = None
+
+BATCH_ROWS = 2000
+# Values per object column used to pick its Arrow type
+SCHEMA_SAMPLE = 1000
+
+
+def _default(obj):
+    # Anything orjson/json can't encode natively: pandas/NumPy scalars and missing values
+    if obj is pd.NaT or obj is pd.NA or obj is None:
+        return None
+    if isinstance(obj, (pd.Timestamp, datetime.datetime, datetime.date, datetime.time)):
+        return obj.isoformat()
+    if isinstance(obj, pd.Timedelta):
+        return obj.isoformat()
+    if isinstance(obj, np.generic):
+        value = obj.item()
+        return None if isinstance(value, float) and math.isnan(value) else value
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    if isinstance(obj, float) and math.isnan(obj):
+        return None
+    return str(obj)
+
+
+def _clean_nan(value):
+    # stock json writes NaN literally; orjson already emits null
+    if isinstance(value, float) and not math.isfinite(value):
+        return None
+    if isinstance(value, dict):
+        return {k: _clean_nan(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_clean_nan(v) for v in value]
+    return value
+
+
+def dumps(obj) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(obj, default=_default, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(_clean_nan(obj), default=_default, allow_nan=False).encode()
+
+
+def frame_records(df: pd.DataFrame) -> list[dict]:
+    """df.to_dict(orient="records"), left for dumps() to make NaN/Timestamp safe."""
+    with stage("serialize"):
+        return df.to_dict(orient="records")
+
+
+def iter_batches(df: pd.DataFrame | Iterable[pd.DataFrame], batch_rows: int = BATCH_ROWS) -> Iterator[pd.DataFrame]:
+    """Row batches of a frame, or of a sequence of frames read one at a time (services/chunk_store)."""
+    for frame in ([df] if isinstance(df, pd.DataFrame) else df):
+        for start in range(0, len(frame), batch_rows):
+            yield frame.iloc[start:start + batch_rows]
+
+
+def iter_json(header: dict, df: pd.DataFrame | Iterable[pd.DataFrame], batch_rows: int = BATCH_ROWS) -> Iterator[bytes]:
+    """
+    Stream `{**header, "rows": [...]}` one row batch at a time, so only a single
+    batch of Python dicts exists at once.
+    """
+    head = dumps(header)
+    yield head[:-1] + (b',"rows":[' if len(header) else b'"rows":[')
+    first = True
+    for batch in iter_batches(df, batch_rows):
+        encoded = dumps(frame_records(batch))[1:-1]
+        if not encoded:
+            continue
+        yield encoded if first else b"," + encoded
+        first = False
+    yield b"]}"
+
+
+def iter_ndjson(df: pd.DataFrame | Iterable[pd.DataFrame], batch_rows: int = BATCH_ROWS) -> Iterator[bytes]:
+    for batch in iter_batches(df, batch_rows):
+        yield b"".join(dumps(row) + b"\n" for row in frame_records(batch))
+
+
+def _text(col: pd.Series) -> pd.Series:
+    return col.map(lambda v: None if v is None or v is pd.NA or v is pd.NaT
+                   or (isinstance(v, float) and math.isnan(v)) else str(v))
+
+
+def _fitting(col: pd.Series, type_: pa.DataType) -> pd.Series:
+    # Values the schema sample didn't foresee and that don't fit the column's type go as null
+    def fit(v):
+        try:
+            return pa.scalar(v, type=type_, from_pandas=True).as_py()
+        except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError, TypeError, ValueError):
+            return None
+    return col.map(fit)
+
+
+def _arrow_schema(df: pd.DataFrame) -> pa.Schema:
+    """
+    Schema for streaming `df`. Object columns are typed from a sample of their
+    values spread over the frame (an empty slice would type them null); ones
+    Arrow can't give a single type, such as mixed numbers and text, are sent
+    as text.
+    """
+    schema = pa.Schema.from_pandas(df.head(0), preserve_index=False)
+    for i, name in enumerate(df.columns):
+        if df[name].dtype != object:
+            continue
+        values = df[name].dropna()
+        if len(values) > SCHEMA_SAMPLE:
+            values = values.iloc[np.linspace(0, len(values) - 1, SCHEMA_SAMPLE).astype(int)]
+        try:
+            type_ = pa.array(values, from_pandas=True).type
+        except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError):
+            type_ = pa.string()
+        if pa.types.is_null(type_):
+            type_ = pa.string()
+        schema = schema.set(i, schema.field(i).with_type(type_))
+    return schema
+
+
+def _record_batch(batch: pd.DataFrame, schema: pa.Schema) -> pa.RecordBatch:
+    try:
+        return pa.RecordBatch.from_pandas(batch, schema=schema, preserve_index=False)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        fixed = {name: _text(batch[name]) if pa.types.is_string(field.type) else _fitting(batch[name], field.type)
+                 for name, field in zip(batch.columns, schema) if batch[name].dtype == object}
+        return pa.RecordBatch.from_pandas(batch.assign(**fixed), schema=schema, preserve_index=False)
+
+
+def iter_arrow(df: pd.DataFrame | Iterable[pd.DataFrame], batch_rows: int = BATCH_ROWS) -> Iterator[bytes]:
+    """Arrow IPC stream: one schema message, then one record batch per chunk."""
+    if not isinstance(df, pd.DataFrame):
+        frames, skipped = iter(df), []
+        first = next(frames)
+        while first.empty:   # the schema comes from the first frame with rows
+            skipped.append(first)
+            first = next(frames, None)
+            if first is None:
+                first = skipped.pop()
+                break
+        df = chain(skipped, [first], frames)
+    else:
+        first = df
+    schema = _arrow_schema(first)
+    buf = io.BytesIO()
+    writer = pa.ipc.new_stream(pa.PythonFile(buf, mode="w"), schema)
+
+    def drain() -> bytes:
+        data = buf.getvalue()
+        buf.seek(0)
+        buf.truncate()
+        return data
+
+    for batch in iter_batches(df, batch_rows):
+        writer.write_batch(_record_batch(batch, schema))
+        yield drain()
+    writer.close()
+    yield drain()
+
+
+class FastJSONResponse(Response):
+    """JSONResponse that encodes with orjson and tolerates NaN/Timestamp values."""
+    media_type = "application/json"
+
+    def render(self, content) -> bytes:
+        with stage("serialize"):
+            return dumps(content)
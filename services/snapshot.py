@@ -0,0 +1,202 @@
+import datetime
+import json
+import os
+from urllib.parse import quote
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from services.xlsx_writer import write_xlsx
+
+UPLOAD_DIR = "uploads"
+
+# Schema metadata key for the last journalled operation a stored frame includes
+SEQ_KEY = b"excelsior.journal_seq"
+# Schema metadata key listing columns stored as tagged JSON text (see _tag)
+MIXED_KEY = b"excelsior.mixed_columns"
+
+# Columnar copy of a sheet stored next to uploads/{file_id}.xlsx. It is an
+# uncompressed Arrow IPC file, so reads are a memory map rather than a parse and
+# the OS page cache is shared between worker processes.
+
+
+def snapshot_path(file_id: str, sheet: str | None = None) -> str:
+    # Sheets other than the first are snapshotted the first time they are loaded
+    if sheet is not None:
+        return os.path.join(UPLOAD_DIR, f"{file_id}.{quote(sheet, safe='')}.arrow")
+    return os.path.join(UPLOAD_DIR, f"{file_id}.arrow")
+
+
+def write_frame(path: str, df: pd.DataFrame, seq: int | None = None, mixed: bool = False) -> bool:
+    """
+    Write `df` to `path` atomically, tagged with journal sequence number `seq`
+    (see services/op_journal). Returns False when the frame can't be
+    represented in Arrow (e.g. a column mixing numbers and text); any older
+    file at `path` is removed so callers fall back to the .xlsx. With `mixed`,
+    such columns are stored as JSON text that read_frame turns back into the
+    original values, and the write always succeeds.
+    """
+    table = _table(df, seq, mixed)
+    if table is None:
+        if os.path.exists(path):
+            os.remove(path)
+        return False
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = path + ".tmp"
+    with pa.OSFile(tmp, "wb") as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    os.replace(tmp, path)
+    return True
+
+
+def _tag(value):
+    # JSON for one cell of a mixed column, keeping the Python type of values Excel produces
+    if isinstance(value, np.generic):
+        value = value.item()
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value   # NaN is written as the JSON extension NaN
+    if value is pd.NaT:
+        return {"$ts": None}
+    if value is pd.NA:
+        return {"$na": True}
+    if isinstance(value, datetime.datetime):
+        return {"$ts": pd.Timestamp(value).isoformat()}
+    if isinstance(value, datetime.date):
+        return {"$d": value.isoformat()}
+    if isinstance(value, datetime.time):
+        return {"$t": value.isoformat()}
+    if isinstance(value, datetime.timedelta):
+        return {"$td": pd.Timedelta(value).value}
+    return str(value)
+
+
+def _untag(obj: dict):
+    if "$ts" in obj:
+        return pd.NaT if obj["$ts"] is None else pd.Timestamp(obj["$ts"])
+    if "$d" in obj:
+        return datetime.date.fromisoformat(obj["$d"])
+    if "$t" in obj:
+        return datetime.time.fromisoformat(obj["$t"])
+    if "$td" in obj:
+        return pd.Timedelta(obj["$td"])
+    if "$na" in obj:
+        return pd.NA
+    return obj
+
+
+def _mixed_table(df: pd.DataFrame) -> pa.Table:
+    # Object columns Arrow can't give one type become JSON text, decoded again by _to_frame
+    mixed = {}
+    for name in df.columns:
+        if df[name].dtype != object:
+            continue
+        try:
+            pa.array(df[name], from_pandas=True)
+        except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError):
+            mixed[name] = pd.Series([None if v is None else json.dumps(_tag(v)) for v in df[name]],
+                                    index=df.index, dtype=object)
+    table = pa.Table.from_pandas(df.assign(**mixed), preserve_index=False)
+    return table.replace_schema_metadata({**(table.schema.metadata or {}), MIXED_KEY: json.dumps(list(mixed)).encode()})
+
+
+def _table(df: pd.DataFrame, seq: int | None, mixed: bool) -> pa.Table | None:
+    try:
+        table = pa.Table.from_pandas(df, preserve_index=False)
+    except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError):
+        if not mixed:
+            return None
+        table = _mixed_table(df)
+    if seq is not None:
+        table = table.replace_schema_metadata({**(table.schema.metadata or {}), SEQ_KEY: str(seq).encode()})
+    return table
+
+
+def _to_frame(table: pa.Table) -> pd.DataFrame:
+    # split_blocks lets null-free numeric columns stay zero-copy views of the map
+    df = table.to_pandas(split_blocks=True)
+    mixed = (table.schema.metadata or {}).get(MIXED_KEY)
+    for name in json.loads(mixed) if mixed else []:
+        values = table.column(name).to_pylist()
+        df[name] = pd.Series([None if v is None else json.loads(v, object_hook=_untag) for v in values],
+                             index=df.index, dtype=object)
+    return df
+
+
+def read_frame(path: str) -> pd.DataFrame | None:
+    if not os.path.exists(path):
+        return None
+    with pa.memory_map(path, "r") as source:
+        table = pa.ipc.open_file(source).read_all()
+    return _to_frame(table)
+
+
+def frame_to_bytes(df: pd.DataFrame, seq: int | None = None, mixed: bool = False) -> bytes | None:
+    """
+    df as an Arrow IPC stream, tagged like write_frame; None when Arrow can't
+    hold it, unless `mixed`, which stores such columns as JSON text instead.
+    """
+    table = _table(df, seq, mixed)
+    if table is None:
+        return None
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def frame_from_bytes(data: bytes) -> pd.DataFrame:
+    return _to_frame(pa.ipc.open_stream(pa.py_buffer(data)).read_all())
+
+
+def read_seq(path: str) -> int:
+    """Journal sequence number stored with the frame at `path`; 0 if untagged."""
+    if not os.path.exists(path):
+        return 0
+    with pa.memory_map(path, "r") as source:
+        metadata = pa.ipc.open_file(source).schema.metadata or {}
+    return int(metadata.get(SEQ_KEY, b"0"))
+
+
+def write_snapshot(file_id: str, df: pd.DataFrame, sheet: str | None = None, seq: int | None = None) -> bool:
+    return write_frame(snapshot_path(file_id, sheet), df, seq)
+
+
+def read_snapshot(file_id: str, sheet: str | None = None) -> pd.DataFrame | None:
+    return read_frame(snapshot_path(file_id, sheet))
+
+
+def delete_snapshot(file_id: str):
+    path = snapshot_path(file_id)
+    if os.path.exists(path):
+        os.remove(path)
+
+
+def mark_in_sync(file_id: str):
+    """Record that the snapshot and the .xlsx hold the same data."""
+    xlsx = os.path.join(UPLOAD_DIR, f"{file_id}.xlsx")
+    snap = snapshot_path(file_id)
+    if os.path.exists(xlsx) and os.path.exists(snap):
+        mtime = os.stat(xlsx).st_mtime_ns
+        os.utime(snap, ns=(mtime, mtime))
+
+
+def xlsx_is_stale(file_id: str) -> bool:
+    """True when the snapshot holds edits that the .xlsx doesn't have yet."""
+    xlsx = os.path.join(UPLOAD_DIR, f"{file_id}.xlsx")
+    snap = snapshot_path(file_id)
+    if not os.path.exists(snap):
+        return False
+    if not os.path.exists(xlsx):
+        return True
+    return os.path.getmtime(snap) > os.path.getmtime(xlsx)
+
+
+def materialize_xlsx(file_id: str) -> str | None:
+    """Regenerate uploads/{file_id}.xlsx from the snapshot if it is out of date."""
+    xlsx = os.path.join(UPLOAD_DIR, f"{file_id}.xlsx")
+    if xlsx_is_stale(file_id):
+        write_xlsx(read_snapshot(file_id), xlsx)
+        mark_in_sync(file_id)
+    return xlsx if os.path.exists(xlsx) else None
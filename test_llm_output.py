@@ -1,6 +1,8 @@
-from services.formula_generator import generate_action_from_prompt
+import asyncio
+from services.formula_generator import generate_excel_formula
 
-prompt = "Filter all rows where Profit is greater than 300"
-result = generate_action_from_prompt(prompt)
+if __name__ == "__main__":
+    prompt = "Filter all rows where Profit is greater than 300"
+    result = asyncio.run(generate_excel_formula(prompt))
 
-print("[FINAL OUTPUT]", result)
\ No newline at end of file
+    print("[FINAL OUTPUT]", result)
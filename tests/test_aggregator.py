@@ -0,0 +1,123 @@
+import uuid
+
+import numpy as np
+import pandas as pd
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from exceptions import InvalidActionSchema
+from routers import action as action_router
+from services import aggregator, frame_versions, memory_store, operations
+from services.aggregator import aggregate, parse_spec
+
+SPEC = {"group_by": ["Region"], "aggregations": [
+    {"column": "Sales", "func": f} for f in ("sum", "count", "min", "max", "mean")
+] + [{"column": "Units", "func": f} for f in ("sum", "min", "max")] + [{"func": "count"}]}
+
+
+@pytest.fixture
+def file_id(workdir):
+    file_id = uuid.uuid4().hex
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame({"Region": rng.choice(["East", "West", "North"], 60),
+                       "Name": [f"n{i}" for i in range(60)],
+                       "Units": rng.integers(1, 100, 60),
+                       "Sales": rng.random(60).round(3) * 100})
+    memory_store.put(file_id, df, dirty=False)
+    yield file_id
+    memory_store.delete(file_id)
+    frame_versions.forget(file_id)
+    aggregator.forget(file_id)
+
+
+def expected(df: pd.DataFrame) -> pd.DataFrame:
+    grouped = df.groupby("Region", sort=True)
+    return pd.DataFrame({
+        "Sales_sum": grouped.Sales.sum(), "Sales_count": grouped.Sales.count(),
+        "Sales_min": grouped.Sales.min(), "Sales_max": grouped.Sales.max(), "Sales_mean": grouped.Sales.mean(),
+        "Units_sum": grouped.Units.sum(), "Units_min": grouped.Units.min(), "Units_max": grouped.Units.max(),
+        "count": grouped.size(),
+    }).reset_index()
+
+
+def check(file_id: str):
+    result = aggregate(file_id, memory_store.get(file_id), SPEC)
+    pd.testing.assert_frame_equal(result, expected(memory_store.get(file_id)), check_dtype=False)
+
+
+def patch(file_id: str, *updates):
+    operations.apply_op(file_id, {"kind": "cells", "updates": [
+        {"row": row, "column": column, "value": value} for row, column, value in updates]})
+
+
+def rows_of(file_id: str, region: str) -> list[int]:
+    return np.flatnonzero(memory_store.get(file_id).Region == region).tolist()
+
+
+def test_incremental_matches_groupby(file_id):
+    check(file_id)
+    before = aggregator.get_stats()["incremental"]
+    df = memory_store.get(file_id)
+    east = rows_of(file_id, "East")
+    top = int(df.Sales.iloc[east].idxmax())
+    low = int(df.Units.iloc[east].idxmin())
+
+    steps = [
+        [(east[1], "Sales", 12.5)],                            # an ordinary value
+        [(top, "Sales", 0.5)],                                 # the group maximum goes: recheck
+        [(low, "Units", 1000)],                                # the group minimum goes
+        [(east[2], "Sales", 7.0), (east[2], "Sales", 99.0)],   # patched twice in one batch
+        [(east[3], "Sales", None), (east[4], "Sales", None)],  # number -> missing
+        [(east[3], "Sales", 3.25)],                            # missing -> number
+        [(east[0], "Sales", 150.0), (rows_of(file_id, "West")[0], "Sales", -1.0)],   # new extremes
+    ]
+    for updates in steps:
+        patch(file_id, *updates)
+        check(file_id)
+    assert aggregator.get_stats()["incremental"] == before + len(steps)
+
+    operations.apply_op(file_id, {"kind": "undo"})
+    check(file_id)
+    operations.apply_op(file_id, {"kind": "undo"})
+    check(file_id)
+
+
+def test_group_with_every_value_missing(file_id):
+    check(file_id)
+    patch(file_id, *[(row, "Sales", None) for row in rows_of(file_id, "North")])
+    check(file_id)
+    result = aggregate(file_id, memory_store.get(file_id), SPEC).set_index("Region").loc["North"]
+    assert result.Sales_count == 0 and np.isnan(result.Sales_min) and np.isnan(result.Sales_mean)
+    patch(file_id, (rows_of(file_id, "North")[0], "Sales", 5.0))
+    check(file_id)
+
+
+def test_key_column_patch_regroups(file_id):
+    check(file_id)
+    before = aggregator.get_stats()["incremental"]
+    patch(file_id, (0, "Region", "South"))
+    check(file_id)
+    assert aggregator.get_stats()["incremental"] == before
+
+
+@pytest.mark.parametrize("func", ["sum", "mean"])
+def test_non_numeric_sum_and_mean_rejected_up_front(file_id, func):
+    df = memory_store.get(file_id)
+    spec = {"group_by": ["Region"], "aggregations": [{"column": "Name", "func": func}]}
+    parse_spec(spec, df.columns.tolist())   # names only: nothing to check the type against
+    with pytest.raises(InvalidActionSchema, match="non-numeric"):
+        parse_spec(spec, df.columns.tolist(), df.dtypes.to_dict())
+
+
+def test_generate_action_aggregate_error_is_422(file_id, monkeypatch):
+    spec = {"operation": "aggregate", "group_by": ["Region"], "aggregations": [{"column": "Name", "func": "sum"}]}
+
+    async def resolve(prompt, df):
+        return spec, "rules"
+    monkeypatch.setattr(action_router, "resolve_action", resolve)
+    app = FastAPI()
+    app.include_router(action_router.router)
+    response = TestClient(app).post("/generate-action", json={"file_id": file_id, "prompt": "total names"})
+    assert response.status_code == 422
+    assert "non-numeric" in response.json()["detail"]
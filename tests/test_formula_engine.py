@@ -0,0 +1,125 @@
+import os
+import uuid
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from exceptions import InvalidActionSchema
+from services import formula_engine, frame_versions, memory_store, op_journal, operations
+
+
+@pytest.fixture
+def file_id(workdir):
+    file_id = uuid.uuid4().hex
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame({"Region": rng.choice(["East", "West"], 50), "Units": rng.integers(1, 50, 50),
+                       "Sales": rng.random(50).round(2) * 100 + 1})
+    memory_store.put(file_id, df, dirty=False)
+    yield file_id
+    op_journal.close(file_id)
+    memory_store.delete(file_id)
+    frame_versions.forget(file_id)
+
+
+def define(file_id: str, column: str, formula: str) -> pd.DataFrame:
+    return operations.apply_op(file_id, {"kind": "action", "action": {
+        "operation": "add_column", "column": column, "formula": formula}})[0]
+
+
+def patch(file_id: str, *updates) -> pd.DataFrame:
+    return operations.apply_op(file_id, {"kind": "cells", "updates": [
+        {"row": row, "column": column, "value": value} for row, column, value in updates]})[0]
+
+
+def check_chain(df: pd.DataFrame):
+    price = df.Sales / df.Units
+    pd.testing.assert_series_equal(df.Price, price, check_names=False, check_dtype=False)
+    pd.testing.assert_series_equal(df.Band, pd.Series(np.where(price > 2, "high", "low")),
+                                   check_names=False, check_dtype=False)
+
+
+def test_chained_columns_follow_their_inputs(file_id):
+    define(file_id, "Price", "=[@Sales]/[@Units]")
+    check_chain(define(file_id, "Band", '=IF([@Price]>2, "high", "low")'))
+    assert list(formula_engine.formulas(file_id)) == ["Price", "Band"]
+
+    check_chain(patch(file_id, (0, "Sales", 1000.0), (1, "Units", 1)))
+    check_chain(operations.apply_op(file_id, {"kind": "column", "column": "Units", "operation": "add", "delta": 5})[0])
+    # Redefining the first column recomputes the second
+    df = define(file_id, "Price", "=[@Sales]/[@Units]/10")
+    assert (df.Band == np.where(df.Sales / df.Units / 10 > 2, "high", "low")).all()
+
+
+def test_fixed_cell_follows_sort(file_id):
+    df = define(file_id, "Share", "=[@Sales]/$C$2")   # C2: Sales in the first data row
+    pd.testing.assert_series_equal(df.Share, df.Sales / df.Sales.iloc[0], check_names=False)
+    df = operations.apply_op(file_id, {"kind": "action", "action": {
+        "operation": "sort", "column": "Sales", "order": "desc"}})[0]
+    assert df.Sales.iloc[0] == df.Sales.max()
+    pd.testing.assert_series_equal(df.Share, df.Sales / df.Sales.iloc[0], check_names=False)
+    df = patch(file_id, (0, "Sales", 500.0))
+    pd.testing.assert_series_equal(df.Share, df.Sales / 500.0, check_names=False)
+
+
+def test_undo_and_redo_definition(file_id):
+    original = memory_store.get(file_id)
+    define(file_id, "Price", "=[@Sales]/[@Units]")
+    define(file_id, "Price", "=[@Sales]*2")
+
+    operations.apply_op(file_id, {"kind": "undo"})
+    assert formula_engine.formulas(file_id)["Price"].text == "=[@Sales]/[@Units]"
+    check = patch(file_id, (2, "Sales", 80.0))
+    assert check.Price.iloc[2] == 80.0 / check.Units.iloc[2]
+    operations.apply_op(file_id, {"kind": "undo"})
+    operations.apply_op(file_id, {"kind": "undo"})
+    pd.testing.assert_frame_equal(memory_store.get(file_id), original)
+    assert formula_engine.formulas(file_id) == {}
+
+    df = operations.apply_op(file_id, {"kind": "redo"})[0]
+    assert "Price" in df.columns and "Price" in formula_engine.formulas(file_id)
+
+
+def test_failed_commit_leaves_no_definition(file_id, monkeypatch):
+    def fail(*args):
+        raise OSError("disk full")
+    monkeypatch.setattr(op_journal, "record", fail)
+    with pytest.raises(OSError):
+        define(file_id, "Price", "=[@Sales]/[@Units]")
+    assert not os.path.exists(formula_engine._path(file_id))
+    assert formula_engine.formulas(file_id) == {}
+    assert "Price" not in memory_store.get(file_id).columns
+
+
+def test_rejected_definition_leaves_no_definition(file_id):
+    define(file_id, "Price", "=[@Sales]/[@Units]")
+    define(file_id, "Double", "=[@Price]*2")
+    with pytest.raises(InvalidActionSchema, match="Circular"):
+        define(file_id, "Price", "=[@Double]+1")
+    assert formula_engine.formulas(file_id)["Price"].text == "=[@Sales]/[@Units]"
+
+
+@pytest.mark.parametrize("incremental_max", [0, 10_000])
+def test_incremental_matches_full_recalculation(file_id, monkeypatch, incremental_max):
+    monkeypatch.setattr(formula_engine, "INCREMENTAL_MAX_ROWS", incremental_max)
+    define(file_id, "Price", "=[@Sales]/[@Units]")
+    define(file_id, "Total", "=SUM([Sales])")
+    define(file_id, "Label", '=[@Region]&"-"&ROUND([@Price], 1)')
+    evaluated = []
+
+    def spy(formula, df, rows=None):
+        evaluated.append((formula.column, None if rows is None else len(rows)))
+        return evaluate(formula, df, rows)
+    evaluate = formula_engine.evaluate
+    monkeypatch.setattr(formula_engine, "evaluate", spy)
+
+    df = patch(file_id, (3, "Sales", 42.0), (7, "Units", 3), (7, "Region", "North"))
+    # Total reads Sales as a range: always the whole column
+    assert ("Total", None) in evaluated
+    assert ("Price", 2 if incremental_max else None) in evaluated
+    monkeypatch.setattr(formula_engine, "evaluate", evaluate)
+
+    expected = df.copy()
+    for column in ("Price", "Total", "Label"):
+        expected[column] = formula_engine._filled(formula_engine.formulas(file_id)[column], expected)
+    pd.testing.assert_frame_equal(df, expected)
@@ -0,0 +1,122 @@
+import datetime
+import uuid
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pytest
+
+from services import memory_store
+from services.frame_store import RespStore, SharedMemoryStore
+from services.snapshot import frame_from_bytes, frame_to_bytes, read_frame, write_frame
+
+
+def mixed_frame() -> pd.DataFrame:
+    return pd.DataFrame({
+        "n": [1, 2, 3, 4, 5, 6, 7, 8],
+        "mixed": pd.Series([1, "x", None, 2.5, datetime.datetime(2024, 5, 6, 7, 8), datetime.date(1999, 1, 2),
+                            True, np.nan], dtype=object),
+        "text": ["a", "b", None, "d", "e", "f", "g", "h"],
+    })
+
+
+class FakeRedis:
+    """The commands RespStore sends, over a dict."""
+
+    def __init__(self):
+        self.data = {}
+
+    def execute(self, command, key, *args):
+        if command == "EVAL":   # only the lock release script: compare and delete
+            _, lock, owner = args
+            if self.data.get(lock) == owner.encode():
+                del self.data[lock]
+                return 1
+            return 0
+        if command == "GET":
+            return self.data.get(key)
+        if command == "DEL":
+            self.data.pop(key, None)
+            return 1
+        value = args[0] if isinstance(args[0], bytes) else str(args[0]).encode()
+        if "NX" in args and key in self.data:
+            return None
+        old = self.data.get(key)
+        self.data[key] = value
+        return old if "GET" in args else "OK"
+
+
+def test_mixed_columns_roundtrip_without_pickle(tmp_path):
+    df = mixed_frame()
+    assert frame_to_bytes(df) is None
+    pd.testing.assert_frame_equal(frame_from_bytes(frame_to_bytes(df, 3, mixed=True)), df)
+
+    path = str(tmp_path / "f.arrow")
+    assert not write_frame(path, df)
+    assert write_frame(path, df, 3, mixed=True)
+    pd.testing.assert_frame_equal(read_frame(path), df)
+
+
+def test_shm_store_publishes_mixed_frames_as_arrow(tmp_path):
+    store = SharedMemoryStore(str(tmp_path))
+    df = mixed_frame()
+    store.publish("f", df, "e-1")
+    store.publish("f", df.head(3), "e-2")
+    fetched, token = store.fetch("f")
+    assert token == "e-2"
+    pd.testing.assert_frame_equal(fetched, df.head(3))
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["f.current", "f.e-2.arrow"]
+
+
+def test_redis_store_holds_only_arrow(tmp_path):
+    store = RespStore()
+    store.client = FakeRedis()
+    df = mixed_frame()
+    store.publish("f", df, "e-7")
+    data = store.client.data["excelsior:f:data:e-7"]
+    pa.ipc.open_stream(pa.py_buffer(data)).read_all()   # plain Arrow IPC, nothing else
+    fetched, token = store.fetch("f")
+    assert token == "e-7"
+    pd.testing.assert_frame_equal(fetched, df)
+
+
+class CheckedStore(SharedMemoryStore):
+    def current(self, file_id):
+        assert not memory_store._lock._is_owned(), "shared store asked while holding memory_store._lock"
+        return super().current(file_id)
+
+
+@pytest.fixture
+def shared_backend(workdir, monkeypatch):
+    backend = CheckedStore(str(workdir / "shared"))
+    monkeypatch.setattr(memory_store, "_backend", backend)
+    return backend
+
+
+def test_get_adopts_frame_published_by_another_worker(shared_backend):
+    file_id = uuid.uuid4().hex
+    df = pd.DataFrame({"n": [1, 2, 3]})
+    memory_store.put(file_id, df, dirty=False)
+    assert memory_store.get(file_id) is df
+    generation = memory_store.generation(file_id)
+
+    newer = pd.DataFrame({"n": [4, 5]})
+    shared_backend.publish(file_id, newer, "other-5")   # another worker's edit
+    pd.testing.assert_frame_equal(memory_store.get(file_id), newer)
+    assert memory_store.get_with_seq(file_id)[1] == 5
+    assert memory_store.get_with_token(file_id)[1] == "other-5"
+    assert memory_store.generation(file_id) == generation + 1
+    memory_store.delete(file_id)
+
+
+def test_redis_lock_release_leaves_another_owners_lock():
+    store = RespStore()
+    store.client = FakeRedis()
+    with store.lock("f"):
+        assert "excelsior:f:lock" in store.client.data
+    assert "excelsior:f:lock" not in store.client.data
+
+    with store.lock("f"):
+        # Ours expired mid-edit and another worker took the lock
+        store.client.data["excelsior:f:lock"] = b"other-worker"
+    assert store.client.data["excelsior:f:lock"] == b"other-worker"
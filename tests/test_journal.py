@@ -0,0 +1,190 @@
+import asyncio
+import uuid
+
+import numpy as np
+import pandas as pd
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from exceptions import ExcelOperationError
+from routers import export as export_router
+from services import aggregator, frame_index, frame_versions, memory_store, op_journal, operations
+from services.snapshot import write_snapshot
+
+EDITS = [
+    {"kind": "cells", "updates": [{"row": 3, "column": "Sales", "value": 99.5},
+                                  {"row": 7, "column": "Region", "value": "North"}]},
+    {"kind": "column", "column": "Units", "operation": "add", "delta": 10},
+    {"kind": "action", "action": {"operation": "sort", "column": "Sales", "order": "desc"}},
+    {"kind": "undo"},
+    {"kind": "action", "action": {"operation": "filter", "column": "Units",
+                                  "condition": {"operator": ">", "value": 20}}},
+    {"kind": "cells", "updates": [{"row": 0, "column": "Region", "value": "South"}]},
+]
+
+
+@pytest.fixture
+def file_id(workdir):
+    file_id = uuid.uuid4().hex
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame({"Region": rng.choice(["East", "West"], 40), "Units": rng.integers(1, 50, 40),
+                       "Sales": rng.random(40).round(2) * 100})
+    write_snapshot(file_id, df)   # the upload's base, as services/ingest leaves it
+    memory_store.put(file_id, df, dirty=False)
+    yield file_id
+    op_journal.close(file_id)
+    memory_store.delete(file_id)
+    frame_versions.forget(file_id)
+
+
+def crash(file_id: str):
+    """Lose everything the process held; only what reached uploads/ survives."""
+    op_journal.close(file_id)
+    memory_store.delete(file_id)
+    for service in (frame_versions, frame_index, aggregator):
+        service.forget(file_id)
+
+
+def apply(file_id: str, ops: list[dict]) -> pd.DataFrame:
+    for op in ops:
+        operations.apply_op(file_id, op)
+    return memory_store.get(file_id)
+
+
+def test_scan_stops_at_torn_tail(workdir):
+    file_id = uuid.uuid4().hex
+    for seq in (1, 2, 3):
+        op_journal.record(file_id, seq, {"kind": "undo", "n": seq})
+    op_journal.close(file_id)
+    path = op_journal.journal_path(file_id)
+    intact = open(path, "rb").read()
+    with open(path, "ab") as f:
+        f.write(intact.splitlines(keepends=True)[0][:20])   # a write cut short by the crash
+
+    records, valid = op_journal._scan(path)
+    assert [seq for seq, _ in records] == [1, 2, 3]
+    assert valid == len(intact)
+
+    # Reopening cuts the tail off, so the next record isn't stranded behind it
+    op_journal.record(file_id, 4, {"kind": "redo"})
+    op_journal.close(file_id)
+    assert [seq for seq, _ in op_journal.read_records(file_id)] == [1, 2, 3, 4]
+
+
+def test_scan_stops_at_corrupt_record(workdir):
+    file_id = uuid.uuid4().hex
+    for seq in (1, 2, 3):
+        op_journal.record(file_id, seq, {"kind": "undo"})
+    op_journal.close(file_id)
+    path = op_journal.journal_path(file_id)
+    lines = open(path, "rb").read().splitlines(keepends=True)
+    lines[1] = lines[1].replace(b'"seq":2', b'"seq":7')   # checksum no longer matches
+    open(path, "wb").write(b"".join(lines))
+    assert [seq for seq, _ in op_journal.read_records(file_id)] == [1]
+
+
+def test_replay_matches_frame_before_crash(file_id):
+    previous = apply(file_id, EDITS[:-1])
+    expected = apply(file_id, EDITS[-1:])
+    crash(file_id)
+    assert operations.replay(file_id) == len(EDITS)
+    pd.testing.assert_frame_equal(memory_store.get(file_id), expected)
+    # The undo history is rebuilt too
+    operations.apply_op(file_id, {"kind": "undo"})
+    pd.testing.assert_frame_equal(memory_store.get(file_id), previous)
+
+
+def test_replay_after_torn_tail(file_id):
+    expected = apply(file_id, EDITS)
+    with open(op_journal.journal_path(file_id), "ab") as f:
+        f.write(b'0badf00d {"seq": 99, "op": {"kind": "ce')
+    crash(file_id)
+    operations.replay(file_id)
+    pd.testing.assert_frame_equal(memory_store.get(file_id), expected)
+
+
+def test_replay_after_checkpoint(file_id):
+    apply(file_id, EDITS[:4])
+    assert operations.checkpoint(file_id)
+    assert op_journal.pending(file_id) == 0
+    expected = apply(file_id, EDITS[4:])
+    assert [seq for seq, _ in op_journal.read_records(file_id)] == [5, 6]
+
+    crash(file_id)
+    assert operations.replay(file_id) == 2
+    pd.testing.assert_frame_equal(memory_store.get(file_id), expected)
+
+
+def frames(file_id: str, ops: list[dict]) -> list[pd.DataFrame]:
+    """The frame before and after each of `ops`."""
+    return [memory_store.get(file_id)] + [apply(file_id, [op]) for op in ops]
+
+
+def check_replay(file_id: str):
+    expected = memory_store.get(file_id)
+    crash(file_id)
+    operations.replay(file_id)
+    pd.testing.assert_frame_equal(memory_store.get(file_id), expected)
+
+
+def test_undo_after_checkpoint(file_id):
+    before = frames(file_id, EDITS[:3])
+    assert operations.checkpoint(file_id)
+
+    # Back past the checkpoint: the undo is checkpointed, not left to replay
+    operations.apply_op(file_id, {"kind": "undo"})
+    pd.testing.assert_frame_equal(memory_store.get(file_id), before[2])
+    assert op_journal.pending(file_id) == 0
+    operations.apply_op(file_id, {"kind": "redo"})
+    pd.testing.assert_frame_equal(memory_store.get(file_id), before[3])
+    check_replay(file_id)
+
+
+def test_undo_across_checkpoint_after_new_edits(file_id):
+    before = frames(file_id, EDITS[:2])
+    assert operations.checkpoint(file_id)
+    after = frames(file_id, EDITS[4:])
+
+    # The first two undos are journalled, the third reaches past the checkpoint
+    for expected in (after[1], after[0], before[1]):
+        operations.apply_op(file_id, {"kind": "undo"})
+        pd.testing.assert_frame_equal(memory_store.get(file_id), expected)
+    operations.apply_op(file_id, {"kind": "redo"})
+    pd.testing.assert_frame_equal(memory_store.get(file_id), after[0])
+    check_replay(file_id)
+    # Replay only rebuilds history back to the checkpoint that covers the redo
+    with pytest.raises(ExcelOperationError):
+        operations.apply_op(file_id, {"kind": "undo"})
+
+
+def test_undo_after_export(file_id):
+    before = frames(file_id, EDITS[:3])
+    app = FastAPI()
+    app.include_router(export_router.router)
+    assert TestClient(app).post(f"/export/{file_id}", params={"format": "csv"}).status_code == 200
+
+    for expected in (before[2], before[1]):
+        operations.apply_op(file_id, {"kind": "undo"})
+        pd.testing.assert_frame_equal(memory_store.get(file_id), expected)
+    check_replay(file_id)
+
+
+def test_auto_checkpoint_keeps_undo(file_id, monkeypatch):
+    before = frames(file_id, EDITS[:3])
+    monkeypatch.setattr(op_journal, "needs_checkpoint", lambda file_id: True)
+    asyncio.run(operations.durable(file_id))
+    assert op_journal.pending(file_id) == 0
+
+    operations.apply_op(file_id, {"kind": "undo"})
+    pd.testing.assert_frame_equal(memory_store.get(file_id), before[2])
+    check_replay(file_id)
+
+
+def test_checkpoint_covering_everything_leaves_nothing_to_replay(file_id):
+    expected = apply(file_id, EDITS)
+    assert operations.checkpoint(file_id)
+    assert file_id not in op_journal.journaled_files()
+    crash(file_id)
+    assert operations.replay(file_id) == 0
+    pd.testing.assert_frame_equal(memory_store.get(file_id), expected)
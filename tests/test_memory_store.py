@@ -0,0 +1,72 @@
+import os
+import time
+import uuid
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from services import memory_store
+from services.snapshot import write_snapshot
+
+
+def frame(seed: int) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({"a": rng.random(1000), "b": rng.integers(0, 100, 1000)})
+
+
+@pytest.fixture
+def ids(workdir, monkeypatch):
+    # Room for two of the test frames, not three
+    monkeypatch.setattr(memory_store, "MAX_BYTES", int(memory_store._frame_bytes(frame(0)) * 2.5))
+    ids = [uuid.uuid4().hex for _ in range(3)]
+    yield ids
+    for file_id in ids:
+        memory_store.delete(file_id)
+
+
+def test_lru_evicts_least_recently_used_and_reloads(ids):
+    a, b, c = ids
+    frames = {file_id: frame(i) for i, file_id in enumerate(ids)}
+    for file_id in ids[:2]:
+        write_snapshot(file_id, frames[file_id])
+        memory_store.put(file_id, frames[file_id], dirty=False)
+    memory_store.get(a)   # b is now the least recently used
+    memory_store.put(c, frames[c], dirty=False)
+
+    assert list(memory_store.dataframes)[-2:] == [a, c] and b not in memory_store.dataframes
+    reloads = memory_store.get_stats()["reloads"]
+    pd.testing.assert_frame_equal(memory_store.get(b), frames[b])   # back from its snapshot
+    assert memory_store.get_stats()["reloads"] == reloads + 1
+    assert a not in memory_store.dataframes   # and it pushed out the next oldest
+
+
+def test_dirty_frame_spills_and_reloads_with_its_edits(ids):
+    a, b, c = ids
+    write_snapshot(a, frame(0))
+    edited = frame(0).assign(b=-1)
+    memory_store.put(a, edited, dirty=True, seq=7)
+    memory_store.put(b, frame(1), dirty=False)
+    memory_store.put(c, frame(2), dirty=False)
+
+    assert a not in memory_store.dataframes
+    assert os.path.exists(memory_store._spill_path(a))
+    pd.testing.assert_frame_equal(memory_store.get(a), edited)   # the spill, not the older snapshot
+    assert memory_store.is_dirty(a) and memory_store.journal_seq(a) == 7
+
+    memory_store.mark_clean(a)
+    assert not os.path.exists(memory_store._spill_path(a))
+
+
+def test_ttl_expires_idle_frames(ids, monkeypatch):
+    a, b, _ = ids
+    monkeypatch.setattr(memory_store, "TTL_SECONDS", 0.05)
+    write_snapshot(a, frame(0))
+    memory_store.put(a, frame(0), dirty=False)
+    memory_store.put(b, frame(1), dirty=True)
+    time.sleep(0.1)
+    expired = memory_store.get_stats()["expired"]
+
+    pd.testing.assert_frame_equal(memory_store.get(a), frame(0))   # expired, then reloaded
+    assert memory_store.get_stats()["expired"] == expired + 2
+    assert b not in memory_store.dataframes and os.path.exists(memory_store._spill_path(b))
@@ -0,0 +1,146 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from benchmarks.common import make_sales_frame, peak_rss_mb, reset_peak_rss, rss_mb
+from services import chunk_store, out_of_core
+from services.out_of_core import filter_rows, patch_column, sort_head, sort_persist
+
+FILE_ID = "big"
+ROWS = 20_000
+
+
+def sheet(rows: int = ROWS) -> pd.DataFrame:
+    rng = np.random.default_rng(0)
+    sales = rng.integers(0, 50, rows).astype(float)   # few distinct values, so sorts have ties
+    sales[rng.random(rows) < 0.05] = np.nan
+    return pd.DataFrame({
+        "Order ID": np.arange(rows),
+        "Region": rng.choice(["East", "West", "North", "South"], rows),
+        "Units": rng.integers(1, 500, rows),
+        "Sales": sales,
+    })
+
+
+def budget(monkeypatch, megabytes: float, chunk_rows: int = 250_000, batch_rows: int = 8192):
+    """What EXCELSIOR_CHUNK_MEMORY_MB and EXCELSIOR_CHUNK_ROWS set at import."""
+    for module in (chunk_store, out_of_core):
+        monkeypatch.setattr(module, "MEMORY_BUDGET", int(megabytes * 2**20))
+        monkeypatch.setattr(module, "BATCH_ROWS", batch_rows)
+    monkeypatch.setattr(chunk_store, "CHUNK_ROWS", chunk_rows)
+
+
+def stored() -> pd.DataFrame:
+    return chunk_store.concat_frames([chunk for _, chunk in chunk_store.iter_chunks(chunk_store.load_manifest(FILE_ID))])
+
+
+@pytest.fixture
+def chunked(workdir, monkeypatch):
+    # ~1,300-row chunks, 500-row batches and a two-way merge: everything crosses chunks
+    budget(monkeypatch, 1, chunk_rows=3_000, batch_rows=500)
+    df = sheet()
+    chunk_store.write_frames(FILE_ID, (df.iloc[i:i + 4_000] for i in range(0, ROWS, 4_000)))
+    assert len(chunk_store.load_manifest(FILE_ID).chunks) > 5
+    return df
+
+
+def ids(df: pd.DataFrame) -> list[int]:
+    return df["Order ID"].tolist()
+
+
+def test_pages_cross_chunks(chunked):
+    manifest = chunk_store.load_manifest(FILE_ID)
+    boundary = manifest.chunks[0][1]
+    for offset, end in [(0, 10), (boundary - 5, boundary + 5), (ROWS - 3, ROWS + 100), (0, ROWS)]:
+        page = chunk_store.concat_frames(list(chunk_store.page(FILE_ID, offset, end)))
+        assert ids(page) == ids(chunked.iloc[offset:end])
+    assert list(chunk_store.page(FILE_ID, ROWS + 1))[0].columns.tolist() == chunked.columns.tolist()
+
+
+def test_filter_matches_pandas(chunked):
+    count, rows = filter_rows(FILE_ID, {"column": "Region", "op": "==", "value": "West"}, 50)
+    expected = chunked[chunked.Region == "West"]
+    assert count == len(expected) and ids(rows) == ids(expected.head(50))
+
+    expr = {"and": [{"column": "Sales", "op": ">", "value": 40}, {"column": "Units", "op": "<", "value": 100}]}
+    count, rows = filter_rows(FILE_ID, expr, 10_000)
+    expected = chunked[(chunked.Sales > 40) & (chunked.Units < 100)]
+    assert count == len(expected) and ids(rows) == ids(expected)
+
+
+@pytest.mark.parametrize("ascending", [True, False])
+def test_sort_head_matches_pandas(chunked, ascending):
+    expected = chunked.sort_values("Sales", ascending=ascending, kind="stable", na_position="last")
+    assert ids(sort_head(FILE_ID, "Sales", ascending, 300)) == ids(expected.head(300))
+
+
+def test_sort_persist_multi_pass_matches_pandas(chunked, monkeypatch):
+    merges = []
+    merge = out_of_core._merge
+    monkeypatch.setattr(out_of_core, "_merge", lambda *args: merges.append(1) or merge(*args))
+
+    sort_persist(FILE_ID, "Region", True)
+    assert len(merges) > 2   # more runs than the fan-in: merged in several passes
+    expected = chunked.sort_values("Region", kind="stable")
+    assert ids(stored()) == ids(expected)
+
+    # Stable: a second sort keeps the first one's order among ties, missing values last
+    sort_persist(FILE_ID, "Sales", False)
+    expected = expected.sort_values("Sales", ascending=False, kind="stable", na_position="last")
+    assert ids(stored()) == ids(expected)
+
+
+def test_patch_column_matches_pandas(chunked):
+    generation = chunk_store.load_manifest(FILE_ID).generation
+    assert patch_column(FILE_ID, "Units", operation="add", delta=5) == generation + 1
+    assert patch_column(FILE_ID, "Region", operation="lower") == generation + 2
+    result = stored()
+    assert result["Units"].tolist() == (chunked.Units + 5).tolist()
+    assert result["Region"].tolist() == chunked.Region.str.lower().tolist()
+    assert ids(result) == ids(chunked)
+
+
+def check_peak_rss(monkeypatch, rows: int, budget_mb: int, block_rows: int):
+    """Each step's peak RSS stays within the budget while the sheet is many times bigger."""
+    try:
+        reset_peak_rss()
+        with open("/proc/self/status") as f:
+            assert "VmHWM" in f.read()
+    except (OSError, AssertionError):
+        pytest.skip("needs Linux /proc to measure peak RSS")
+    budget(monkeypatch, budget_mb)
+
+    def blocks():
+        for start in range(0, rows, block_rows):
+            block = make_sales_frame(min(block_rows, rows - start), seed=start)
+            block["Order ID"] += start
+            yield block
+
+    steps = [
+        ("ingest", lambda: chunk_store.write_frames(FILE_ID, blocks())),
+        ("page", lambda: sum(len(p) for p in chunk_store.page(FILE_ID, rows // 2, rows // 2 + 1000))),
+        ("filter", lambda: filter_rows(FILE_ID, {"column": "Region", "op": "==", "value": "West"}, 100)),
+        ("sort preview", lambda: sort_head(FILE_ID, "Sales", False, 100)),
+        ("column patch", lambda: patch_column(FILE_ID, "Units", operation="add", delta=1)),
+        ("sort persist", lambda: sort_persist(FILE_ID, "Sales", True)),
+    ]
+    for name, step in steps:
+        base = rss_mb()
+        reset_peak_rss()
+        step()
+        assert peak_rss_mb() - base <= budget_mb, f"{name} went over the {budget_mb} MB budget"
+    assert chunk_store.load_manifest(FILE_ID).rows == rows
+
+
+def test_peak_rss_within_budget(workdir, monkeypatch):
+    # ~300 MB as one DataFrame against a 48 MB budget
+    check_peak_rss(monkeypatch, rows=1_500_000, budget_mb=48, block_rows=25_000)
+
+
+@pytest.mark.slow
+def test_peak_rss_within_budget_multi_gb(workdir, monkeypatch):
+    # ~3 GB as one DataFrame (see benchmarks/bench_chunked)
+    rows = int(os.getenv("EXCELSIOR_TEST_CHUNKED_ROWS", 30_000_000))
+    check_peak_rss(monkeypatch, rows=rows, budget_mb=256, block_rows=100_000)
@@ -0,0 +1,46 @@
+import pandas as pd
+import pyarrow as pa
+
+from services.serializer import iter_arrow
+
+
+def read_stream(chunks) -> pa.Table:
+    return pa.ipc.open_stream(b"".join(chunks)).read_all()
+
+
+def test_arrow_stream_object_columns():
+    df = pd.DataFrame({
+        "mixed": pd.Series([1, "x", None, 2.5], dtype=object),
+        "text": pd.Series(["a", None, "b", "c"], dtype=object),
+        "empty": pd.Series([None] * 4, dtype=object),
+        "n": [1, 2, 3, 4],
+    })
+    table = read_stream(iter_arrow(df, batch_rows=2))
+    assert table.schema.field("mixed").type == pa.string()
+    assert table.column("mixed").to_pylist() == ["1", "x", None, "2.5"]
+    assert table.column("text").to_pylist() == ["a", None, "b", "c"]
+    assert table.column("empty").to_pylist() == [None] * 4
+    assert table.column("n").to_pylist() == [1, 2, 3, 4]
+
+
+def test_arrow_stream_frames_schema_from_first_with_rows():
+    frames = [pd.DataFrame({"a": pd.Series([], dtype=object)}),
+              pd.DataFrame({"a": pd.Series(["x", None], dtype=object)}),
+              pd.DataFrame({"a": pd.Series(["y"], dtype=object)})]
+    table = read_stream(iter_arrow(iter(frames)))
+    assert table.column("a").to_pylist() == ["x", None, "y"]
+
+
+def test_arrow_stream_empty_frame():
+    table = read_stream(iter_arrow(pd.DataFrame({"a": pd.Series([], dtype=object)})))
+    assert table.num_rows == 0
+
+
+def test_arrow_stream_value_outside_schema_sample():
+    values = [float(i) for i in range(3000)]
+    values[1001] = "x"   # between the sampled positions: the column is typed double
+    df = pd.DataFrame({"n": pd.Series(values, dtype=object)})
+    table = read_stream(iter_arrow(df, batch_rows=500))
+    assert table.schema.field("n").type == pa.float64()
+    column = table.column("n").to_pylist()
+    assert column[1001] is None and column[1000] == 1000.0 and len(column) == 3000
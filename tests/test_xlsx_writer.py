@@ -0,0 +1,60 @@
+import datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+from openpyxl import load_workbook
+
+from exceptions import ExcelOperationError
+from services import xlsx_writer
+from services.xlsx_writer import write_xlsx
+
+
+def roundtrip(df, tmp_path, **kwargs) -> list[tuple]:
+    path = str(tmp_path / "out.xlsx")
+    write_xlsx(df, path, **kwargs)
+    return list(load_workbook(path, read_only=True).active.iter_rows(values_only=True))
+
+
+def test_values_roundtrip(tmp_path):
+    df = pd.DataFrame({
+        "int": [1, -2, 3],
+        "float": [1.5, np.nan, 1e-7],
+        "text": ["a & <b>", " padded ", None],
+        "bool": [True, False, True],
+        "mixed": pd.Series([1, "x", 2.5], dtype=object),
+    })
+    rows = roundtrip(df, tmp_path)
+    assert rows[0] == ("int", "float", "text", "bool", "mixed")
+    assert rows[1:] == [(1, 1.5, "a & <b>", True, 1), (-2, None, " padded ", False, "x"),
+                        (3, 1e-7, None, True, 2.5)]
+
+
+def test_dates_roundtrip_around_1900_leap_bug(tmp_path):
+    days = ["1900-01-01", "1900-01-15", "1900-02-28", "1900-03-01", "2024-05-06 13:45:30"]
+    df = pd.DataFrame({"when": pd.to_datetime(days, format="ISO8601"),
+                       "day": pd.Series([datetime.date.fromisoformat(d[:10]) for d in days], dtype=object)})
+    rows = roundtrip(df, tmp_path)
+    expected = [datetime.datetime.fromisoformat(d) for d in days]
+    assert [r[0] for r in rows[1:]] == expected
+    assert [r[1] for r in rows[1:]] == [d.replace(hour=0, minute=0, second=0) for d in expected]
+
+
+def test_control_characters_dropped(tmp_path):
+    df = pd.DataFrame({"a\x01b": ["x\x02y"]})
+    assert roundtrip(df, tmp_path, sheet_name="S\x03") == [("ab",), ("xy",)]
+
+
+def test_chunks_join_into_one_sheet(tmp_path, monkeypatch):
+    monkeypatch.setattr(xlsx_writer, "CHUNK_ROWS", 7)
+    df = pd.DataFrame({"n": range(50)})
+    path = str(tmp_path / "out.xlsx")
+    write_xlsx(df, path)
+    assert pd.read_excel(path)["n"].tolist() == list(range(50))
+
+
+def test_too_many_rows_rejected(tmp_path, monkeypatch):
+    monkeypatch.setattr(xlsx_writer, "MAX_ROWS", 10)
+    with pytest.raises(ExcelOperationError):
+        write_xlsx(pd.DataFrame({"n": range(10)}), str(tmp_path / "out.xlsx"))
+    assert not (tmp_path / "out.xlsx").exists()